@@ -0,0 +1,177 @@
+# app/cancellation.py
+"""Cancelling chat turns nobody is waiting for any more.
+
+A turn holds a CancelToken under (username, chat_id) while it runs, and is
+cancelled when
+
+    disconnected   the client went away before the reply was ready
+    superseded     the user sent another message to the same chat
+    cancelled      POST /chat/chat/{id}/cancel was called
+
+With several uvicorn workers (GENERATION_WORKERS > 1) cancelling and
+superseding also write data/cancel/<username>/<chat_id>.json with the time
+of the request, so a turn running in another worker that started before it
+sees it the next time its route polls (every GENERATION_CANCEL_POLL_SECONDS,
+with the disconnect check). The marker goes when the last turn in the chat
+ends here, or shortly after the chat is deleted.
+
+The turn checks its token wherever it waits: for a scheduler slot, between
+Ollama retries and between streamed tokens. A running Ollama stream is shut
+down from the cancelling thread, so Ollama stops generating at once. A
+cancelled turn raises GenerationCancelled and stores no reply.
+GENERATION_CANCEL=0 turns all of this off (generations are no longer
+streamed either).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import DATA_DIR, GENERATION_WORKERS
+from app.file_lock import atomic_write_json
+from app.metrics import Counter
+
+GENERATION_CANCEL = os.environ.get("GENERATION_CANCEL", "1") == "1"
+GENERATION_CANCEL_POLL_SECONDS = float(os.environ.get("GENERATION_CANCEL_POLL_SECONDS", 0.5))
+CANCEL_DIR = DATA_DIR / "cancel"
+
+GENERATIONS_CANCELLED = Counter(
+    "chatbot_generations_cancelled_total", "Chat turns cancelled before their reply was stored", ("reason",),
+)
+
+
+class GenerationCancelled(Exception):
+    code = "generation_cancelled"
+
+    def __init__(self, reason: str):
+        super().__init__(f"Generation {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    def __init__(self):
+        self.started_ns = time.time_ns()
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Cancel with ``reason``; False if it already was."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # e.g. the stream it would have closed has ended meanwhile
+        return True
+
+    def check(self):
+        """Raise GenerationCancelled if cancelled."""
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason)
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep up to ``seconds``; True (early) if cancelled meanwhile."""
+        return self._event.wait(seconds)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]):
+        """Run ``callback`` from the cancelling thread if cancelled inside the block."""
+        with self._lock:
+            self._callbacks.append(callback)
+            cancelled = self._event.is_set()
+        try:
+            if cancelled:
+                callback()
+            yield
+        finally:
+            with self._lock:
+                self._callbacks.remove(callback)
+
+
+class TurnRegistry:
+    def __init__(self, cancel_dir: Path = CANCEL_DIR, shared: bool = GENERATION_WORKERS > 1):
+        self.cancel_dir = Path(cancel_dir)
+        # Whether other processes run turns too; a single worker cancels in memory
+        self.shared = shared
+        self._turns: Dict[Tuple[str, str], CancelToken] = {}
+        self._lock = threading.Lock()
+
+    def _marker(self, username: str, chat_id: str) -> Path:
+        return self.cancel_dir / username / f"{chat_id}.json"
+
+    def _request_cancel(self, username: str, chat_id: str, reason: str) -> bool:
+        if self.shared:
+            path = self._marker(username, chat_id)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # File mtimes are as coarse as the filesystem's clock; compare request times instead
+            atomic_write_json(path, {"reason": reason, "requested_ns": time.time_ns()}, indent=None)
+        with self._lock:
+            token = self._turns.get((username, chat_id))
+        return token is not None and token.cancel(reason)
+
+    def begin(self, username: str, chat_id: str) -> CancelToken:
+        """Register a new turn in the chat, superseding any turn still running in it."""
+        self._request_cancel(username, chat_id, "superseded")
+        token = CancelToken()
+        with self._lock:
+            self._turns[(username, chat_id)] = token
+        return token
+
+    def end(self, username: str, chat_id: str, token: CancelToken):
+        with self._lock:
+            if self._turns.get((username, chat_id)) is token:
+                del self._turns[(username, chat_id)]
+            running = (username, chat_id) in self._turns
+        if self.shared and not running:
+            self._marker(username, chat_id).unlink(missing_ok=True)
+
+    def cancel(self, username: str, chat_id: str) -> bool:
+        """Cancel the chat's running turn, here or in another worker.
+
+        True if this process was running one; another worker picks the
+        request up within GENERATION_CANCEL_POLL_SECONDS.
+        """
+        return self._request_cancel(username, chat_id, "cancelled")
+
+    def poll(self, username: str, chat_id: str, token: CancelToken) -> bool:
+        """Cancel ``token`` if another worker asked to since it started; True if cancelled."""
+        if not self.shared or token.cancelled:
+            return token.cancelled
+        try:
+            with open(self._marker(username, chat_id), "r", encoding="utf-8") as f:
+                marker = json.load(f)
+            if marker["requested_ns"] > token.started_ns:
+                token.cancel(marker["reason"])
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        return token.cancelled
+
+    def forget_chat(self, username: str, chat_id: str):
+        """Remove a deleted chat's marker once other workers have had a poll to see it."""
+        if not self.shared:
+            return
+        timer = threading.Timer(2 * GENERATION_CANCEL_POLL_SECONDS, self._marker(username, chat_id).unlink,
+                                kwargs={"missing_ok": True})
+        timer.daemon = True
+        timer.start()
+
+    def active(self) -> int:
+        with self._lock:
+            return len(self._turns)
+
+
+turns = TurnRegistry()
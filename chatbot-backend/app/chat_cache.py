@@ -0,0 +1,105 @@
+# app/chat_cache.py
+"""LRU cache of recently used chats' messages, bounded by memory.
+
+A chat turn reads the chat at least twice (history for the prompt, then the
+frontend's reload). load_chat_messages() keeps the parsed messages of
+recently used chats here, keyed by the chat file's inode, mtime and size:
+a hit costs a stat() instead of reading and parsing the file. Chat files
+are only ever replaced by a rename, so any write by this or another
+process changes the key and the stale entry is simply missed. Writes from
+this process put the new list in straight away.
+
+Entries are charged their file's size on disk, a fair proxy for their
+parsed size; the least recently used are evicted beyond CHAT_CACHE_MAX_BYTES
+(0 disables the cache). Cached lists are shared: callers get a copy of the
+list, but must not modify the message dicts in it.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.metrics import Counter, Gauge
+
+CHAT_CACHE_MAX_BYTES = int(os.environ.get("CHAT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+Key = Tuple[str, str]
+Signature = Tuple[int, int, int]
+
+CHAT_CACHE_LOOKUPS = Counter("chatbot_chat_cache_lookups_total", "Hot-chat cache lookups", ("result",))
+
+
+def file_signature(stat: os.stat_result) -> Signature:
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class ChatCache:
+    def __init__(self, max_bytes: int = CHAT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Key, Tuple[Signature, List[dict], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Key, signature: Signature) -> Optional[List[dict]]:
+        """The cached messages if the chat file still has this signature."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CHAT_CACHE_LOOKUPS.inc(result="hit")
+                return entry[1]
+            self.misses += 1
+        CHAT_CACHE_LOOKUPS.inc(result="miss")
+        return None
+
+    def put(self, key: Key, signature: Signature, messages: List[dict], size: int):
+        # A chat taking more than a quarter of the cache would evict everything else
+        if size > self.max_bytes // 4:
+            self.invalidate(key)
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (signature, messages, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, key: Key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+chat_cache = ChatCache()
+
+CHAT_CACHE_BYTES = Gauge(
+    "chatbot_chat_cache_bytes", "On-disk size of the chats held by the hot-chat cache",
+    collect=lambda: {(): chat_cache.stats()["bytes"]},
+)
+CHAT_CACHE_ENTRIES = Gauge(
+    "chatbot_chat_cache_entries", "Chats held by the hot-chat cache",
+    collect=lambda: {(): chat_cache.stats()["entries"]},
+)
@@ -0,0 +1,317 @@
+# app/chat_memory.py
+"""Semantic memory over a chat's whole history.
+
+A prompt carries only the last MAX_CONTEXT_MESSAGES messages of its chat.
+So that what was said before that isn't lost, every saved message is also
+embedded into a small index of its own chat, and each turn recalls the
+CHAT_MEMORY_K older messages most similar to the new one (cosine at least
+CHAT_MEMORY_MIN_SCORE) into the prompt next to the recent ones.
+
+    data/memory/<username>/<chat_id>.f32    unit-length float32 rows, append-only
+    data/memory/<username>/<chat_id>.keys   the message id of each row, one per line
+
+save_message() only queues the message. A worker thread embeds what is
+queued CHAT_MEMORY_BATCH messages per /api/embed call and appends the rows
+under the chat's file lock, so every uvicorn worker reads and extends the
+same files. Messages that failed to embed, were still queued at shutdown
+or predate the memory are queued again by the first recall that finds
+them missing, so old chats are indexed the first time they are used.
+
+A recall scores the chat's rows straight from a memory map with one
+matrix-vector product. The keys are parsed once per chat and process and
+after that only the lines appended since are read.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.config import DATA_DIR
+from app.file_lock import file_lock
+from app.metrics import Counter, Gauge, Histogram
+from app.model_manager import model_manager
+from app.ollama_client import OllamaError
+
+CHAT_MEMORY = os.environ.get("CHAT_MEMORY", "1") == "1"
+CHAT_MEMORY_K = int(os.environ.get("CHAT_MEMORY_K", 4))
+CHAT_MEMORY_MIN_SCORE = float(os.environ.get("CHAT_MEMORY_MIN_SCORE", 0.5))
+CHAT_MEMORY_BATCH = int(os.environ.get("CHAT_MEMORY_BATCH", 32))
+CHAT_MEMORY_MAX_QUEUED = int(os.environ.get("CHAT_MEMORY_MAX_QUEUED", 10000))
+MEMORY_DIR = DATA_DIR / "memory"
+# Longer messages are embedded by their beginning
+EMBED_MAX_CHARS = 2000
+KEY_CACHE_CHATS = 256
+
+logger = logging.getLogger(__name__)
+
+# (username, chat_id, message key)
+Item = Tuple[str, str, str]
+
+CHAT_MEMORY_RECALL_SECONDS = Histogram(
+    "chatbot_chat_memory_recall_seconds", "Recall of earlier messages from a chat's memory",
+)
+CHAT_MEMORY_EMBEDDED = Counter(
+    "chatbot_chat_memory_embedded_total", "Chat messages embedded into chat memory", ("result",),
+)
+
+
+def message_key(message: dict) -> str:
+    # Messages saved before they had ids are told apart by time and sender
+    return message.get("id") or f"{message.get('timestamp', '')}:{message.get('sender', '')}"
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class ChatMemory:
+    def __init__(self, memory_dir: Path = MEMORY_DIR, batch: int = CHAT_MEMORY_BATCH,
+                 max_queued: int = CHAT_MEMORY_MAX_QUEUED):
+        self.memory_dir = Path(memory_dir)
+        self.batch = batch
+        self._queue: "queue.Queue[Tuple[str, str, str, str]]" = queue.Queue(max_queued)
+        self._queued: Set[Item] = set()
+        self._queued_lock = threading.Lock()
+        # keys file -> (inode, bytes parsed, keys, key -> row)
+        self._keys: "OrderedDict[Path, Tuple[int, int, List[str], Dict[str, int]]]" = OrderedDict()
+        self._keys_lock = threading.Lock()
+        self._chat_dir: Optional[Path] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _paths(self, username: str, chat_id: str) -> Tuple[Path, Path]:
+        base = self.memory_dir / username / chat_id
+        return Path(f"{base}.f32"), Path(f"{base}.keys")
+
+    # --- lifecycle --------------------------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def start(self, chat_dir: Path):
+        if self.running:
+            return
+        self._chat_dir = Path(chat_dir)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="chat-memory", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop embedding; messages still queued are picked up again by later recalls."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # --- indexing ---------------------------------------------------------------------
+
+    def enqueue(self, username: str, chat_id: str, messages: Sequence[dict]) -> int:
+        """Queue messages to be embedded; returns how many were queued.
+
+        Messages without text or already queued are skipped, and once the
+        queue is full the rest are left for a later recall to queue again.
+        """
+        if not self.running:
+            return 0
+        queued = 0
+        with self._queued_lock:
+            for m in messages:
+                text = (m.get("text") or "").strip()
+                item = (username, chat_id, message_key(m))
+                if not text or item in self._queued:
+                    continue
+                try:
+                    self._queue.put_nowait((*item, text[:EMBED_MAX_CHARS]))
+                except queue.Full:
+                    break
+                self._queued.add(item)
+                queued += 1
+        return queued
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._embed(batch)
+            except Exception:
+                logger.exception("Chat memory indexing failed", extra={"messages": len(batch)})
+            finally:
+                with self._queued_lock:
+                    self._queued.difference_update(entry[:3] for entry in batch)
+
+    def _embed(self, batch: List[Tuple[str, str, str, str]]):
+        try:
+            vectors = model_manager.embed_batch([text for *_, text in batch])
+        except OllamaError as e:
+            CHAT_MEMORY_EMBEDDED.inc(len(batch), result="failed")
+            logger.warning("Chat memory embedding failed: %s", e.message,
+                           extra={"code": e.code, "messages": len(batch)})
+            return
+        vectors = _normalized(np.asarray(vectors, dtype=np.float32))
+        by_chat: Dict[Tuple[str, str], List[int]] = {}
+        for i, (username, chat_id, _, _) in enumerate(batch):
+            by_chat.setdefault((username, chat_id), []).append(i)
+        for (username, chat_id), rows in by_chat.items():
+            self._append(username, chat_id, [batch[i][2] for i in rows], vectors[rows])
+        CHAT_MEMORY_EMBEDDED.inc(len(batch), result="ok")
+
+    def _append(self, username: str, chat_id: str, keys: List[str], vectors: np.ndarray):
+        rows_path, keys_path = self._paths(username, chat_id)
+        row_bytes = vectors.shape[1] * 4
+        with file_lock(keys_path):
+            # Queued before the chat was deleted: it stays deleted
+            if self._chat_dir is not None and not (self._chat_dir / username / f"{chat_id}.json").exists():
+                return
+            keys_path.parent.mkdir(parents=True, exist_ok=True)
+            stored, positions = self._load_keys(keys_path)
+            rows = rows_path.stat().st_size // row_bytes if rows_path.exists() else 0
+            if rows != len(stored):
+                # A writer died between the two appends: cut both back to the rows they agree on
+                count = min(rows, len(stored))
+                with open(rows_path, "ab") as f:
+                    f.truncate(count * row_bytes)
+                with open(keys_path, "ab") as f:
+                    f.truncate(sum(len(k.encode("utf-8")) + 1 for k in stored[:count]))
+                stored, positions = self._load_keys(keys_path)
+            new = [i for i, key in enumerate(keys) if key not in positions and key not in keys[:i]]
+            if not new:
+                return
+            # Rows first: a row without its key is ignored by readers and cut by the next append
+            with open(rows_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[new], dtype=np.float32).tobytes())
+            with open(keys_path, "ab") as f:
+                f.write("".join(keys[i] + "\n" for i in new).encode("utf-8"))
+
+    def _load_keys(self, path: Path) -> Tuple[List[str], Dict[str, int]]:
+        """A keys file's keys and their rows, reading only what was appended since the last call."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            with self._keys_lock:
+                self._keys.pop(path, None)
+            return [], {}
+        with self._keys_lock:
+            cached = self._keys.get(path)
+            if cached is not None:
+                self._keys.move_to_end(path)
+        if cached is not None and cached[0] == stat.st_ino and cached[1] <= stat.st_size:
+            _, offset, keys, positions = cached
+            if offset == stat.st_size:
+                return keys, positions
+        else:
+            offset, keys, positions = 0, [], {}
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # Whole lines only: another process may be half-way through writing one
+        data = data[:data.rfind(b"\n") + 1]
+        if not data:
+            return keys, positions
+        # Copies, because other threads may be using the cached ones
+        parsed = len(keys)
+        keys = keys + data.decode("utf-8").splitlines()
+        positions = dict(positions)
+        for row in range(parsed, len(keys)):
+            positions.setdefault(keys[row], row)
+        with self._keys_lock:
+            self._keys[path] = (stat.st_ino, offset + len(data), keys, positions)
+            self._keys.move_to_end(path)
+            while len(self._keys) > KEY_CACHE_CHATS:
+                self._keys.popitem(last=False)
+        return keys, positions
+
+    # --- recall -----------------------------------------------------------------------
+
+    def recall(self, username: str, chat_id: str, query: np.ndarray, history: List[dict], recent: int,
+               k: int = CHAT_MEMORY_K, min_score: float = CHAT_MEMORY_MIN_SCORE) -> List[dict]:
+        """The ``k`` messages most similar to ``query`` from before the last ``recent`` of ``history``.
+
+        The last ``recent`` messages are in the prompt anyway. Returns the
+        messages oldest first. Earlier messages that aren't embedded yet are
+        queued, and can be recalled from a later turn on.
+        """
+        earlier = len(history) - recent
+        if earlier <= 0 or k <= 0:
+            return []
+        start = time.perf_counter()
+        rows_path, keys_path = self._paths(username, chat_id)
+        keys, positions = self._load_keys(keys_path)
+        skip = {message_key(m) for m in history[earlier:]}
+        # Only when the counts don't add up is it worth looking for the missing ones
+        if len(positions) - sum(1 for key in skip if key in positions) < earlier:
+            self.enqueue(username, chat_id, [m for m in history[:earlier] if message_key(m) not in positions])
+
+        found: List[int] = []
+        query = _normalized(np.asarray(query, dtype=np.float32).reshape(-1))
+        try:
+            rows = min(len(keys), rows_path.stat().st_size // (query.size * 4))
+        except FileNotFoundError:
+            rows = 0
+        if rows:
+            vectors = np.memmap(rows_path, dtype=np.float32, mode="r", shape=(rows, query.size))
+            scores = vectors @ query
+            above = np.flatnonzero(scores >= min_score)
+            index = None
+            for row in above[np.argsort(-scores[above], kind="stable")]:
+                key = keys[row]
+                if key in skip:
+                    continue
+                # Messages are mostly embedded in chat order, so a row is usually its message's index
+                if row < earlier and message_key(history[row]) == key:
+                    i = row
+                else:
+                    if index is None:
+                        index = {message_key(m): i for i, m in enumerate(history[:earlier])}
+                    i = index.get(key)
+                    if i is None:
+                        continue
+                found.append(i)
+                if len(found) == k:
+                    break
+        CHAT_MEMORY_RECALL_SECONDS.observe(time.perf_counter() - start)
+        return [history[i] for i in sorted(found)]
+
+    def delete_chat(self, username: str, chat_id: str):
+        rows_path, keys_path = self._paths(username, chat_id)
+        with file_lock(keys_path):
+            rows_path.unlink(missing_ok=True)
+            keys_path.unlink(missing_ok=True)
+        with self._keys_lock:
+            self._keys.pop(keys_path, None)
+
+
+chat_memory = ChatMemory()
+
+
+def start_chat_memory(chat_dir: Path):
+    """Start embedding saved messages into chat memory (CHAT_MEMORY)."""
+    if CHAT_MEMORY:
+        chat_memory.start(chat_dir)
+
+
+def stop_chat_memory():
+    chat_memory.stop()
+
+
+CHAT_MEMORY_QUEUED = Gauge(
+    "chatbot_chat_memory_queued", "Chat messages waiting to be embedded into chat memory",
+    collect=lambda: {(): chat_memory.queued()},
+)
@@ -1,67 +1,151 @@
 # app/chat_routes.py
-from fastapi import APIRouter, Depends, HTTPException, Request, status, Body, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Body, UploadFile, File, Form, Query
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from app.dependencies import get_current_username
-from app.chat_store import load_user_chats, load_chat_messages, save_message, create_new_chat, rename_user_chat, delete_user_chat
-from app.models import NewMessageRequest, RenameChatRequest
-from app.llm import generate_llm_response
+from app.chat_store import (
+    load_user_chats, load_user_chats_async, load_chat_messages_async, save_message_async,
+    create_new_chat_async, rename_user_chat_async, delete_user_chat_async,
+)
+from app.models import NewMessageRequest, RenameChatRequest, AttachDocumentRequest
+from app.llm import generate_llm_response, embed_text, ingest_document, store
+from app.scheduler import scheduler, QueueFullError
+from app import ollama_client
+from app.ollama_client import OllamaError
+from app.cancellation import (
+    GENERATION_CANCEL, GENERATION_CANCEL_POLL_SECONDS, GENERATIONS_CANCELLED, CancelToken, GenerationCancelled, turns,
+)
+from app.model_manager import MODELS_FILE, load_model_catalog, model_manager
+from app.model_router import UnknownModelError, model_router
+from app.search_index import get_search_index
+from app.uploads import UPLOADS_DIR
+from app.file_io import run_io
+from app import library
+from app import tracing
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
+import asyncio
 import uuid
 import json
 import shutil
 import os
+import logging
 
-UPLOADS_DIR = os.path.join(os.path.dirname(__file__), "..", "uploads")
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
 chat_router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
+def queue_full_exception(e: QueueFullError) -> HTTPException:
+    retry_after = max(1, int(e.retry_after + 0.5))
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail={"error": "queue_full", "model": e.model, "queued": e.queued, "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def ollama_error_exception(e: OllamaError) -> HTTPException:
+    headers = None
+    if e.retry_after is not None:
+        headers = {"Retry-After": str(max(1, int(e.retry_after + 0.5)))}
+    return HTTPException(status_code=e.status_code, detail=e.to_dict(), headers=headers)
+
+def cancelled_exception(e: GenerationCancelled) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"error": e.code, "reason": e.reason})
+
+async def _run_turn(request: Request, username: str, chat_id: str, token: CancelToken, *args):
+    """generate_llm_response() in the threadpool, cancelled if the client disconnects meanwhile
+    or another worker cancels the turn."""
+    if not GENERATION_CANCEL:
+        return await run_in_threadpool(generate_llm_response, *args)
+    generation = asyncio.ensure_future(run_in_threadpool(generate_llm_response, *args, cancel=token))
+    # The body has been read, so the next message is the client going away
+    disconnect = asyncio.ensure_future(request.receive())
+    try:
+        while not generation.done():
+            await asyncio.wait({generation, disconnect}, timeout=GENERATION_CANCEL_POLL_SECONDS,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if generation.done() or token.cancelled:
+                continue
+            if disconnect.done() and disconnect.result()["type"] == "http.disconnect":
+                token.cancel("disconnected")
+            else:
+                await run_io(turns.poll, username, chat_id, token)
+    except asyncio.CancelledError:
+        # The server dropped the request
+        token.cancel("disconnected")
+        raise
+    finally:
+        disconnect.cancel()
+    return generation.result()
+
 @chat_router.get("/chats")
-def get_chats(username: str = Depends(get_current_username)):
-    chats = load_user_chats(username)
+async def get_chats(username: str = Depends(get_current_username)):
+    chats = await load_user_chats_async(username)
     return {"chats": chats}
 
 @chat_router.get("/chat/{chat_id}/messages")
-def get_chat_messages(chat_id: str, username: str = Depends(get_current_username)):
-    messages = load_chat_messages(username, chat_id)
+async def get_chat_messages(chat_id: str, username: str = Depends(get_current_username)):
+    messages = await load_chat_messages_async(username, chat_id)
     if messages is None:
         raise HTTPException(status_code=404, detail="Chat not found")
     return {"messages": messages}
 
 @chat_router.post("/chat/{chat_id}/send")
 async def send_message(
+    request: Request,
     chat_id: str,
     text: str = Form(...),
     model_id: str = Form(...),
     file: UploadFile = File(None),
     username: str = Depends(get_current_username)
 ):
+    tracing.set_attribute("chat.id", chat_id)
     if not text.strip():
         raise HTTPException(status_code=400, detail="Message text required")
     if not model_id:
         raise HTTPException(status_code=400, detail="Model ID is required")
 
+    # Reject before storing anything if the queues of every model the turn could go to are full
+    try:
+        model_router.check_capacity(model_id, image=bool(file and (file.content_type or "").startswith("image/")))
+    except UnknownModelError:
+        raise HTTPException(status_code=400, detail="Unknown model ID")
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+
+    # Supersedes a reply still being generated in this chat
+    token = await run_io(turns.begin, username, chat_id)
+    try:
+        return await _send(request, username, chat_id, text, model_id, file, token)
+    finally:
+        turns.end(username, chat_id, token)
+
+async def _send(request: Request, username: str, chat_id: str, text: str, model_id: str,
+                file: Optional[UploadFile], token: CancelToken) -> JSONResponse:
     attachment_meta = None
 
-    # Save the uploaded file if present
+    # Save the uploaded file to the user's library (once per distinct file) and attach it
     if file:
-        file_ext = os.path.splitext(file.filename)[1]
-        file_id = f"{uuid.uuid4().hex}{file_ext}"
-        save_path = os.path.join(UPLOADS_DIR, file_id)
-
         try:
-            file_bytes = await file.read()
-            with open(save_path, "wb") as buffer:
-                buffer.write(file_bytes)
+            with tracing.span("upload.write", content_type=file.content_type or "") as s:
+                file_bytes = await file.read()
+                doc, created = await run_io(library.add_document, username, chat_id, file_bytes, file.filename,
+                                            file.content_type)
+                if s is not None:
+                    s.set_attribute("bytes", len(file_bytes))
+                    s.set_attribute("deduplicated", not created)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
         attachment_meta = {
             "filename": file.filename,
-            "stored_as": file_id,
+            "stored_as": doc["stored_as"],
             "content_type": file.content_type,
             "size": len(file_bytes),  # Correct size calculation
+            "doc_id": doc["id"],
         }
 
     user_msg = {
@@ -71,9 +155,23 @@ async def send_message(
         "file": attachment_meta,  # replaced image with file
         "timestamp": datetime.utcnow().isoformat() + "Z"
     }
-    save_message(username, chat_id, user_msg)
+    await save_message_async(username, chat_id, user_msg)
 
-    bot_resp = generate_llm_response(text, model_id, username, chat_id, attachment_meta)
+    # Generation blocks while waiting for a scheduler slot, so keep it off the event loop
+    try:
+        bot_resp = await _run_turn(request, username, chat_id, token, text, model_id, username, chat_id,
+                                   attachment_meta)
+        # Cancelled just as the reply came in: still nobody wants it
+        token.check()
+    except GenerationCancelled as e:
+        GENERATIONS_CANCELLED.inc(reason=e.reason)
+        logger.info("Generation cancelled: %s", e.reason, extra={"chat_id": chat_id})
+        raise cancelled_exception(e)
+    except QueueFullError as e:
+        raise queue_full_exception(e)
+    except OllamaError as e:
+        logger.error("Generation failed: %s", e.message, extra={"chat_id": chat_id, "code": e.code})
+        raise ollama_error_exception(e)
 
     bot_msg = {
         "id": str(uuid.uuid4()),
@@ -83,43 +181,147 @@ async def send_message(
         "file": bot_resp.get("file", None),  # Future support if bot attaches files
         "timestamp": datetime.utcnow().isoformat() + "Z"
     }
-    save_message(username, chat_id, bot_msg)
+    await save_message_async(username, chat_id, bot_msg)
 
     return JSONResponse(content=bot_msg)
 
+@chat_router.get("/search")
+def search_messages(
+    q: str = Query(..., min_length=1),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    username: str = Depends(get_current_username)
+):
+    """Ranked full-text search over all of the user's messages."""
+    result = get_search_index().search(username, q, page, page_size)
+    titles = {chat["id"]: chat["title"] for chat in load_user_chats(username)}
+    for r in result["results"]:
+        r["chat_title"] = titles.get(r["chat_id"])
+    return result
+
+@chat_router.get("/documents")
+async def get_documents(
+    since_minutes: float = Query(None, gt=0),
+    username: str = Depends(get_current_username)
+):
+    """The user's document library, newest first."""
+    return {"documents": await run_io(library.list_documents, username, since_minutes)}
+
+@chat_router.get("/documents/search")
+def search_documents(
+    q: str = Query(..., min_length=1),
+    doc_ids: str = Query(None, description="Comma-separated document ids; default all of the user's"),
+    chat_id: str = Query(None, description="Also search this chat's recent attachments"),
+    k: int = Query(5, ge=1, le=50),
+    min_score: float = Query(None, ge=-1, le=1, description="Drop matches with a lower cosine similarity"),
+    username: str = Depends(get_current_username)
+):
+    """Semantic search across the user's library (or some of its documents)."""
+    wanted = [d for d in doc_ids.split(",") if d] if doc_ids else None
+    vec = embed_text(q)
+    if vec is None:
+        raise HTTPException(status_code=503, detail="Embedding model unavailable")
+    results = store.search(vec, k=k, chat_id=chat_id, username=username, doc_ids=wanted, min_score=min_score)
+    docs = {d["id"]: d for d in library.list_documents(username)}
+    for r in results:
+        doc = docs.get(r.get("doc_id"))
+        r["filename"] = doc["filename"] if doc else None
+    return {"results": results}
+
+@chat_router.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str, username: str = Depends(get_current_username)):
+    """Remove a document from the library, every chat it's attached to and the vector store."""
+    doc = await run_io(library.delete_document, username, doc_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    await run_io(store.delete_document, username, doc_id)
+    return {"doc_id": doc_id, "status": "deleted"}
+
+async def _require_chat(username: str, chat_id: str):
+    chats = await load_user_chats_async(username)
+    if not any(chat["id"] == chat_id for chat in chats):
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+@chat_router.get("/chat/{chat_id}/documents")
+async def get_chat_documents(chat_id: str, username: str = Depends(get_current_username)):
+    await _require_chat(username, chat_id)
+    return {"documents": await run_io(library.attached_documents, username, chat_id)}
+
+@chat_router.post("/chat/{chat_id}/documents")
+async def attach_document(chat_id: str, payload: AttachDocumentRequest,
+                          username: str = Depends(get_current_username)):
+    """Attach a library document to a chat by reference; nothing is uploaded or embedded again."""
+    await _require_chat(username, chat_id)
+    if not await run_io(library.attach, username, chat_id, payload.doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    # Only does work if the document's first ingestion failed
+    await run_in_threadpool(ingest_document, username, payload.doc_id)
+    return {"chat_id": chat_id, "doc_id": payload.doc_id, "status": "attached"}
+
+@chat_router.delete("/chat/{chat_id}/documents/{doc_id}")
+async def detach_document(chat_id: str, doc_id: str, username: str = Depends(get_current_username)):
+    dropped = await run_io(library.detach, username, chat_id, doc_id)
+    if dropped is None:
+        raise HTTPException(status_code=404, detail="Document not attached to this chat")
+    # No other chat has it attached: it left the library
+    for doc in dropped:
+        await run_io(store.delete_document, username, doc["id"])
+    return {"chat_id": chat_id, "doc_id": doc_id, "status": "detached"}
+
+@chat_router.post("/chat/{chat_id}/cancel")
+async def cancel_generation(chat_id: str, username: str = Depends(get_current_username)):
+    """Stop the reply being generated in this chat; it is not stored."""
+    await _require_chat(username, chat_id)
+    running_here = await run_io(turns.cancel, username, chat_id)
+    # Another worker may be running it; that one sees the request when it next polls
+    return {"chat_id": chat_id, "status": "cancelled" if running_here else "cancel_requested"}
+
+@chat_router.get("/queue")
+def get_queue_status(username: str = Depends(get_current_username)):
+    """Generation load per model and where this user's pending requests are queued."""
+    return {"models": scheduler.snapshot(username)}
+
 @chat_router.post("/chat/new")
-def new_chat(
+async def new_chat(
     title: str = Body(None, embed=True),
     username: str = Depends(get_current_username)
 ):
     if not title:
         title = "New Chat - " + datetime.now().strftime("%Y-%m-%d %H:%M")
-    new_chat_id = create_new_chat(username, title)
+    new_chat_id = await create_new_chat_async(username, title)
     return {"chat_id": new_chat_id, "title": title}
 
 @chat_router.post("/chat/{chat_id}/rename")
-def rename_chat(chat_id: str, payload: RenameChatRequest, username: str = Depends(get_current_username)):
-    success = rename_user_chat(username, chat_id, payload.title)
+async def rename_chat(chat_id: str, payload: RenameChatRequest, username: str = Depends(get_current_username)):
+    success = await rename_user_chat_async(username, chat_id, payload.title)
     if not success:
         raise HTTPException(status_code=404, detail="Chat not found")
     return {"chat_id": chat_id, "new_title": payload.title}
 
 @chat_router.delete("/chat/{chat_id}/delete")
-def delete_chat(chat_id: str, username: str = Depends(get_current_username)):
-    success = delete_user_chat(username, chat_id)
+async def delete_chat(chat_id: str, username: str = Depends(get_current_username)):
+    success = await delete_user_chat_async(username, chat_id)
     if not success:
         raise HTTPException(status_code=404, detail="Chat not found")
     return {"chat_id": chat_id, "status": "deleted"}
 
 @chat_router.get("/models")
 def get_available_models():
-    models_file = Path(__file__).parent.parent / "models" / "models.json"
-    if not models_file.exists():
+    if not MODELS_FILE.exists():
         return JSONResponse(status_code=404, content={"error": "models.json not found"})
 
-    with open(models_file, "r", encoding="utf-8") as f:
-        models = json.load(f)
+    models = load_model_catalog()
 
     # Convert to list of dicts for frontend ease: [{id, name}]
     model_list = [{"id": key, "name": value} for key, value in models.items()]
-    return model_list
\ No newline at end of file
+    return model_list
+
+@chat_router.get("/models/stats")
+def get_model_stats(username: str = Depends(get_current_username)):
+    """Cold versus warm latency, recent traffic and current keep_alive per Ollama model, per-route rates
+    and the state of each Ollama backend."""
+    return {
+        "models": model_manager.report(),
+        "routes": model_router.report(),
+        "backends": {"generate": ollama_client.client.report(), "embed": ollama_client.embed_client.report()},
+    }
\ No newline at end of file
@@ -1,13 +1,36 @@
 # app/chat_store.py
+import asyncio
 import json
-from pathlib import Path
 from datetime import datetime
+import logging
 import os
 import uuid
+import weakref
+
+from app.chat_cache import chat_cache, file_signature
+from app.config import DATA_DIR
+from app.file_io import run_io
+from app.file_lock import atomic_write_json, file_lock
+from app import library, search_index
+from app.cancellation import turns
+from app.chat_memory import chat_memory
+from app.uploads import delete_uploads, referenced_uploads
+from app.vector_service import get_vector_store
+from app.write_buffer import CHAT_WRITE_BEHIND, write_buffer
+from app.tracing import traced
 
-DATA_DIR = Path(__file__).parent.parent / "data"
 CHAT_DIR = DATA_DIR / "chats"
 
+logger = logging.getLogger(__name__)
+
+# Every read-modify-write of a chat file or chat_list.json holds file_lock()
+# so concurrent uvicorn workers can't overwrite each other's changes.
+# Writes go through atomic_write_json so readers never see a partial file.
+# New messages go through the write-behind buffer (app.write_buffer) when it
+# runs; reads merge in what it hasn't written yet. Recently used chats are
+# served from the hot-chat cache (app.chat_cache) while their file is unchanged.
+
+@traced("chat_store.load_user_chats")
 def load_user_chats(username: str):
     user_folder = CHAT_DIR / username
     chat_list_file = user_folder / "chat_list.json"
@@ -16,92 +39,159 @@ def load_user_chats(username: str):
     with open(chat_list_file, "r", encoding="utf-8") as f:
         return json.load(f)
 
+@traced("chat_store.load_chat_messages")
 def load_chat_messages(username: str, chat_id: str):
-    from pathlib import Path
-    import json
+    # Taken before reading the file: a message leaves the buffer only after
+    # it is in the file, so nothing saved before this call can be missed
+    buffered = write_buffer.buffered(username, chat_id)
 
-    DATA_DIR = Path(__file__).parent.parent / "data"
-    CHAT_DIR = DATA_DIR / "chats" / username
-    chat_file = CHAT_DIR / f"{chat_id}.json"
-
-    if not chat_file.exists():
-        return []
+    stored = _read_chat_file(username, chat_id)
+    if stored is None:
+        return list(buffered)
 
-    with open(chat_file, "r", encoding="utf-8") as f:
-        messages = json.load(f)
+    messages = stored + _not_contained(stored, buffered)
 
     # Optional: sort messages by timestamp if not already sorted
     messages.sort(key=lambda x: x.get("timestamp", ""))
 
     return messages
 
+def _read_chat_file(username: str, chat_id: str):
+    """A chat file's messages in file order, from the hot-chat cache when it's current.
+
+    None if there is no such file. The list is shared with the cache: copy it before changing it.
+    """
+    chat_file = CHAT_DIR / username / f"{chat_id}.json"
+    try:
+        stat = chat_file.stat()
+    except FileNotFoundError:
+        return None
+    signature = file_signature(stat)
+    messages = chat_cache.get((username, chat_id), signature)
+    if messages is None:
+        try:
+            with open(chat_file, "r", encoding="utf-8") as f:
+                messages = json.load(f)
+        except FileNotFoundError:
+            return None
+        # Replaced since the stat: caching it under the old signature is only a wasted entry
+        chat_cache.put((username, chat_id), signature, messages, stat.st_size)
+    return messages
+
+def _not_contained(messages: list, candidates: list) -> list:
+    """The candidates ``messages`` doesn't already hold, matched by id (by content without one)."""
+    if not candidates:
+        return []
+    ids = {m.get("id") for m in messages if m.get("id")}
+    contents = None
+    missing = []
+    for m in candidates:
+        if m.get("id"):
+            if m["id"] in ids:
+                continue
+        else:
+            if contents is None:
+                contents = {json.dumps(x, sort_keys=True) for x in messages if not x.get("id")}
+            if json.dumps(m, sort_keys=True) in contents:
+                continue
+        missing.append(m)
+    return missing
+
+@traced("chat_store.save_message")
 def save_message(username: str, chat_id: str, message: dict):
-    DATA_DIR = Path(__file__).parent.parent / "data"
-    CHAT_DIR = DATA_DIR / "chats" / username
-    chat_file = CHAT_DIR / f"{chat_id}.json"
+    if not write_buffer.append(username, chat_id, message):
+        _append_messages(username, chat_id, [message])
+    chat_memory.enqueue(username, chat_id, [message])
+
+def _append_messages(username: str, chat_id: str, new_messages: list, fsync: bool = False, replay: bool = False) -> list:
+    """Append messages to a chat file in one rewrite and index them; returns those added.
+
+    Write-behind flushes and journal replays may retry messages the file
+    already has, so those are skipped. A replay never recreates a chat that
+    was deleted meanwhile.
+    """
+    user_dir = CHAT_DIR / username
+    chat_file = user_dir / f"{chat_id}.json"
+    if not replay:
+        user_dir.mkdir(parents=True, exist_ok=True)
 
-    if chat_file.exists():
-        with open(chat_file, "r", encoding="utf-8") as f:
-            messages = json.load(f)
-    else:
-        messages = []
+    with file_lock(chat_file):
+        existing = _read_chat_file(username, chat_id)
+        if existing is None and replay:
+            return []
+        messages = list(existing or [])
 
-    messages.append(message)
+        added = _not_contained(messages, new_messages) if messages else list(new_messages)
+        if added:
+            messages.extend(added)
+            atomic_write_json(chat_file, messages, fsync=fsync)
+            # Still under the lock, so this is the file's current content
+            stat = chat_file.stat()
+            chat_cache.put((username, chat_id), file_signature(stat), messages, stat.st_size)
 
-    with open(chat_file, "w", encoding="utf-8") as f:
-        json.dump(messages, f, indent=2)
+    search_index.index_messages(username, chat_id, added)
+    return added
 
+def start_write_behind():
+    """Replay journals of crashed processes and buffer message writes (CHAT_WRITE_BEHIND)."""
+    if CHAT_WRITE_BEHIND:
+        write_buffer.start(_append_messages)
+
+def stop_write_behind():
+    write_buffer.stop()
+
+@traced("chat_store.create_new_chat")
 def create_new_chat(username: str, title: str) -> str:
-    user_dir = os.path.join(DATA_DIR, "chats", username)
+    user_dir = os.path.join(CHAT_DIR, username)
     os.makedirs(user_dir, exist_ok=True)
 
-    chat_list_path = os.path.join(user_dir, "chat_list.json")
-    if os.path.exists(chat_list_path):
-        with open(chat_list_path, "r") as f:
-            chat_list = json.load(f)
-    else:
-        chat_list = []
-
     chat_id = str(uuid.uuid4())
-    created_at = datetime.utcnow().isoformat() + "Z"
-    chat_list.append({
-        "id": chat_id,
-        "title": title,
-        "created_at": created_at
-    })
+    chat_file_path = os.path.join(user_dir, f"{chat_id}.json")
+    atomic_write_json(chat_file_path, [], indent=None)
 
-    with open(chat_list_path, "w") as f:
-        json.dump(chat_list, f, indent=2)
+    chat_list_path = os.path.join(user_dir, "chat_list.json")
+    with file_lock(chat_list_path):
+        if os.path.exists(chat_list_path):
+            with open(chat_list_path, "r") as f:
+                chat_list = json.load(f)
+        else:
+            chat_list = []
 
-    chat_file_path = os.path.join(user_dir, f"{chat_id}.json")
-    with open(chat_file_path, "w") as f:
-        json.dump([], f)
+        created_at = datetime.utcnow().isoformat() + "Z"
+        chat_list.append({
+            "id": chat_id,
+            "title": title,
+            "created_at": created_at
+        })
+        atomic_write_json(chat_list_path, chat_list)
 
     return chat_id
 
+@traced("chat_store.rename_user_chat")
 def rename_user_chat(username: str, chat_id: str, new_title: str) -> bool:
     chat_list_path = CHAT_DIR / username / "chat_list.json"
     if not chat_list_path.exists():
         return False
 
-    with open(chat_list_path, "r", encoding="utf-8") as f:
-        chats = json.load(f)
+    with file_lock(chat_list_path):
+        with open(chat_list_path, "r", encoding="utf-8") as f:
+            chats = json.load(f)
 
-    found = False
-    for chat in chats:
-        if chat["id"] == chat_id:
-            chat["title"] = new_title
-            found = True
-            break
+        found = False
+        for chat in chats:
+            if chat["id"] == chat_id:
+                chat["title"] = new_title
+                found = True
+                break
 
-    if not found:
-        return False
+        if not found:
+            return False
 
-    with open(chat_list_path, "w", encoding="utf-8") as f:
-        json.dump(chats, f, indent=2)
+        atomic_write_json(chat_list_path, chats)
 
     return True
 
+@traced("chat_store.delete_user_chat")
 def delete_user_chat(username: str, chat_id: str) -> bool:
     user_dir = CHAT_DIR / username
     chat_list_path = user_dir / "chat_list.json"
@@ -110,17 +200,87 @@ def delete_user_chat(username: str, chat_id: str) -> bool:
     if not chat_list_path.exists():
         return False
 
-    with open(chat_list_path, "r", encoding="utf-8") as f:
-        chats = json.load(f)
+    with file_lock(chat_list_path):
+        with open(chat_list_path, "r", encoding="utf-8") as f:
+            chats = json.load(f)
 
-    new_chats = [chat for chat in chats if chat["id"] != chat_id]
-    if len(new_chats) == len(chats):  # Nothing deleted
-        return False
+        new_chats = [chat for chat in chats if chat["id"] != chat_id]
+        if len(new_chats) == len(chats):  # Nothing deleted
+            return False
+
+        atomic_write_json(chat_list_path, new_chats)
 
-    with open(chat_list_path, "w", encoding="utf-8") as f:
-        json.dump(new_chats, f, indent=2)
+    # Buffered messages belong in the file before it's read for the cascade
+    write_buffer.flush()
+    messages = []
+    with file_lock(chat_file_path):
+        if chat_file_path.exists():
+            try:
+                with open(chat_file_path, "r", encoding="utf-8") as f:
+                    messages = json.load(f)
+            except ValueError:
+                pass
+            chat_file_path.unlink()
+    chat_cache.invalidate((username, chat_id))
 
-    if chat_file_path.exists():
-        chat_file_path.unlink()
+    # A reply still being generated has nowhere to go
+    turns.cancel(username, chat_id)
+    turns.forget_chat(username, chat_id)
 
+    # Cascade: the chat's search entries, memory, vectors (tombstoned now,
+    # compacted in the background), document attachments and uploaded files.
+    # Library documents stay, with their vectors, if another chat has them attached.
+    search_index.remove_chat(username, chat_id)
+    chat_memory.delete_chat(username, chat_id)
+    dropped = library.forget_chat(username, chat_id)
+    try:
+        store = get_vector_store()
+        store.delete_chat(chat_id)
+        for doc in dropped:
+            store.delete_document(username, doc["id"])
+    except (OSError, RuntimeError) as e:
+        logger.error("Could not delete vectors of chat %s: %s", chat_id, e)
+    delete_uploads(referenced_uploads(messages) - library.library_uploads(username))
     return True
+
+
+# Async API for code on the event loop: the same operations, run on the
+# file I/O pool instead of blocking the loop.
+#
+# Writes to one chat also queue on an asyncio.Lock per chat (and changes to
+# a user's chat list on one per user) before they take an I/O thread. The
+# file lock alone would keep them correct, but a burst of sends to one chat
+# would then park every I/O thread on that chat's lock while other chats
+# wait for a thread. Locks are created on first use and dropped once no
+# request holds or waits for them; always take the user lock first.
+
+_locks: "weakref.WeakValueDictionary[tuple, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def _async_lock(*key) -> asyncio.Lock:
+    # Only called on the event loop thread, so get-or-create can't race
+    lock = _locks.get(key)
+    if lock is None:
+        lock = _locks[key] = asyncio.Lock()
+    return lock
+
+async def load_user_chats_async(username: str):
+    return await run_io(load_user_chats, username)
+
+async def load_chat_messages_async(username: str, chat_id: str):
+    return await run_io(load_chat_messages, username, chat_id)
+
+async def save_message_async(username: str, chat_id: str, message: dict):
+    async with _async_lock(username, chat_id):
+        return await run_io(save_message, username, chat_id, message)
+
+async def create_new_chat_async(username: str, title: str) -> str:
+    async with _async_lock(username):
+        return await run_io(create_new_chat, username, title)
+
+async def rename_user_chat_async(username: str, chat_id: str, new_title: str) -> bool:
+    async with _async_lock(username):
+        return await run_io(rename_user_chat, username, chat_id, new_title)
+
+async def delete_user_chat_async(username: str, chat_id: str) -> bool:
+    async with _async_lock(username), _async_lock(username, chat_id):
+        return await run_io(delete_user_chat, username, chat_id)
@@ -0,0 +1,9 @@
+# app/config.py
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+# Everything the backend persists (users, chats, sessions, locks) lives here
+DATA_DIR = Path(os.environ.get("CHATBOT_DATA_DIR", BASE_DIR / "data"))
+# uvicorn worker processes serving the app; app.serve sets it to --workers
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", 1))
@@ -0,0 +1,54 @@
+# app/debug_routes.py
+import html
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse
+
+from app.dependencies import get_current_username
+from app.tracing import traces, waterfall
+
+debug_router = APIRouter()
+
+
+def _render_waterfall(trace_id: str, rows) -> str:
+    total = max((r["offset_ms"] + (r["duration_ms"] or 0)) for r in rows) or 1.0
+    lines = []
+    for r in rows:
+        duration = r["duration_ms"] or 0
+        left = r["offset_ms"] / total * 100
+        width = max(duration / total * 100, 0.2)
+        color = "#d9534f" if r["status"] == "error" else "#4a90d9"
+        attributes = ", ".join(f"{k}={v}" for k, v in r["attributes"].items())
+        title = html.escape(f"{attributes} {r['status_message']}".strip(), quote=True)
+        lines.append(
+            f'<tr title="{title}"><td style="padding-left:{r["depth"] * 16}px">{html.escape(r["name"])}</td>'
+            f'<td class="num">{r["offset_ms"]:.1f}</td><td class="num">{duration:.1f}</td>'
+            f'<td class="bar"><div style="margin-left:{left:.2f}%;width:{width:.2f}%;background:{color}"></div></td></tr>'
+        )
+    return (
+        "<!doctype html><html><head><meta charset='utf-8'>"
+        f"<title>Trace {html.escape(trace_id)}</title><style>"
+        "body{font-family:sans-serif;font-size:13px}table{border-collapse:collapse;width:100%}"
+        "td{padding:2px 6px;border-bottom:1px solid #eee;white-space:nowrap}.num{text-align:right}"
+        ".bar{width:60%}.bar div{height:12px}</style></head><body>"
+        f"<h3>Trace {html.escape(trace_id)} &mdash; {total:.1f} ms</h3>"
+        "<table><tr><th align=left>Stage</th><th>Start (ms)</th><th>Duration (ms)</th><th></th></tr>"
+        + "".join(lines) + "</table></body></html>"
+    )
+
+
+@debug_router.get("/trace/{trace_id}")
+def get_trace(
+    trace_id: str,
+    format: str = Query("html", pattern="^(html|json)$"),
+    username: str = Depends(get_current_username)
+):
+    """Per-stage waterfall of one of the caller's recent requests (id from the X-Trace-Id header)."""
+    spans = traces.get(trace_id)
+    # Only the user the request belonged to may see it
+    if not spans or not any(s.attributes.get("enduser.id") == username for s in spans):
+        raise HTTPException(status_code=404, detail="Trace not found")
+    rows = waterfall(spans)
+    if format == "json":
+        return {"trace_id": trace_id, "spans": rows}
+    return HTMLResponse(_render_waterfall(trace_id, rows))
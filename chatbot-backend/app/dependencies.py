@@ -6,6 +6,7 @@ from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from starlette.status import HTTP_401_UNAUTHORIZED
 from app.session_store import get_username as verify_token
+from app import tracing
 
 security = HTTPBearer()
 
@@ -40,4 +41,6 @@ def get_current_username(token: str = Depends(get_token_from_header)) -> str:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
         )
+    # Ties the request's trace to its user (see /debug/trace/{id})
+    tracing.set_attribute("enduser.id", username)
     return username
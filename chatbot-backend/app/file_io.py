@@ -0,0 +1,38 @@
+# app/file_io.py
+"""Dedicated thread pool for blocking disk work called from async code.
+
+Async routes must not open(), json.load() or write files on the event loop
+thread: one slow read of a long chat stalls every other request in the
+worker. They await run_io() instead, which runs the function on a pool of
+FILE_IO_THREADS threads. The pool is separate from Starlette's threadpool
+(which also runs generation and sync routes), so disk work can neither
+starve them nor be starved by them, and its size bounds how many file
+operations hit the disk at once.
+
+The function runs in a copy of the caller's context, so tracing spans
+opened inside it are children of the request's span.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.metrics import Gauge
+
+FILE_IO_THREADS = int(os.environ.get("FILE_IO_THREADS", 8))
+
+_executor = ThreadPoolExecutor(max_workers=FILE_IO_THREADS, thread_name_prefix="file-io")
+
+FILE_IO_PENDING = Gauge(
+    "chatbot_file_io_pending", "File operations waiting for a file I/O thread",
+    collect=lambda: {(): _executor._work_queue.qsize()},
+)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking ``fn(*args, **kwargs)`` on the file I/O pool and await its result."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, fn, *args, **kwargs))
+
@@ -0,0 +1,138 @@
+# app/file_lock.py
+"""Cross-process advisory locks for files shared between uvicorn workers.
+
+Locks are striped over a fixed set of lock files under data/.locks so that
+deleting a chat never has to remove (and race on) its lock file.
+"""
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from app.config import DATA_DIR
+
+LOCK_DIR = DATA_DIR / ".locks"
+LOCK_STRIPES = 1024
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _try_lock(f) -> bool:
+        f.seek(0)
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _try_lock(f) -> bool:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+
+def _lock_path(path) -> Path:
+    digest = hashlib.sha1(str(Path(path).resolve()).encode("utf-8")).digest()
+    stripe = int.from_bytes(digest[:4], "big") % LOCK_STRIPES
+    return LOCK_DIR / f"{stripe:04d}.lock"
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock for ``path`` across threads and processes."""
+    lock_path = _lock_path(path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+b") as f:
+        _lock(f)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+
+def try_lock_file(f) -> bool:
+    """Lock the open file ``f`` unless another process holds it; never waits."""
+    return _try_lock(f)
+
+
+def _is_current(f, path) -> bool:
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def try_lock_path(path):
+    """Open ``path`` (creating it) and lock it unless another process holds it; never waits.
+
+    Returns the open, locked file, or None. Lock files are only removed by
+    whoever holds them (unlink_locked), so a lock that turns out to be on a
+    file removed meanwhile is dropped and the file now at ``path`` is tried.
+    """
+    while True:
+        f = open(path, "a+b")
+        if not _try_lock(f):
+            f.close()
+            return None
+        if _is_current(f, path):
+            return f
+        f.close()
+
+
+def unlink_locked(f, path):
+    """Remove the lock file ``path`` that ``f`` holds, then release it."""
+    if os.name == "nt":
+        # Windows can't remove a file that is open
+        f.close()
+        Path(path).unlink(missing_ok=True)
+        return
+    Path(path).unlink(missing_ok=True)
+    f.close()
+
+
+def fsync_dir(path):
+    """Make a rename or unlink in directory ``path`` durable (no-op where unsupported)."""
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write_json(path, data, indent=2, fsync=False):
+    """Write JSON to a temp file next to ``path`` and rename it into place.
+
+    With ``fsync`` the data and the rename are on disk when this returns.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if fsync:
+        fsync_dir(path.parent)
@@ -0,0 +1,251 @@
+# app/library.py
+"""Per-user document library.
+
+Every PDF or image a user uploads becomes a document in their library,
+identified by a hash of its content: uploading the same file again (in any
+chat) reuses the stored file and the vectors already embedded for it. A
+document is ingested once, into the vector store under the user and
+document rather than a chat, and attached by reference to any number of
+the user's chats; retrieval in a chat covers the documents attached to it.
+
+    data/library/<username>.json
+        {"documents": {doc_id: {...}}, "attachments": {chat_id: [doc_id, ...]}}
+
+Users only ever see, attach or search their own documents. A document
+lives as long as some chat has it attached: detaching it from its last
+chat or deleting that chat drops it from the library along with its file,
+and the caller tombstones its vectors. Retention forgets attachments of
+chats that no longer exist (prune()) and compacts away vectors of
+documents that no library holds (live_documents()).
+"""
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.config import DATA_DIR
+from app.file_lock import atomic_write_json, file_lock
+from app.uploads import delete_uploads, save_upload
+
+LIBRARY_DIR = DATA_DIR / "library"
+
+# Held while a document is being ingested so concurrent sends of the same
+# file embed it once; the library file records the result for other workers
+_ingest_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_ingest_locks_guard = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def _path(username: str) -> Path:
+    return LIBRARY_DIR / f"{username}.json"
+
+
+def _read(username: str) -> Dict:
+    try:
+        with open(_path(username), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"documents": {}, "attachments": {}}
+
+
+@contextmanager
+def _update(username: str):
+    path = _path(username)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(path):
+        library = _read(username)
+        yield library
+        atomic_write_json(path, library)
+
+
+def document_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def add_document(username: str, chat_id: str, data: bytes, filename: str, content_type: str) -> Tuple[Dict, bool]:
+    """Store an upload in the user's library and attach it to ``chat_id``; returns (document, created).
+
+    A file the library already holds is not stored again: the existing
+    document is attached and returned with created False.
+    """
+    doc_id = document_id(data)
+    with _update(username) as library:
+        attached = library["attachments"].setdefault(chat_id, [])
+        if doc_id not in attached:
+            attached.append(doc_id)
+        doc = library["documents"].get(doc_id)
+        if doc is not None:
+            return doc, False
+        doc = {
+            "id": doc_id,
+            "filename": filename,
+            "content_type": content_type or "",
+            "stored_as": save_upload(data, filename),
+            "size": len(data),
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "vectors": None,  # set once ingested
+        }
+        library["documents"][doc_id] = doc
+    return doc, True
+
+
+def get_document(username: str, doc_id: str) -> Optional[Dict]:
+    return _read(username)["documents"].get(doc_id)
+
+
+def list_documents(username: str, since_minutes: Optional[float] = None) -> List[Dict]:
+    """The user's documents, newest first; only those added in the last ``since_minutes`` if given."""
+    docs = list(_read(username)["documents"].values())
+    if since_minutes is not None:
+        cutoff = (datetime.utcnow() - timedelta(minutes=since_minutes)).isoformat() + "Z"
+        docs = [d for d in docs if d["created_at"] >= cutoff]
+    return sorted(docs, key=lambda d: d["created_at"], reverse=True)
+
+
+def mark_ingested(username: str, doc_id: str, vectors: int):
+    with _update(username) as library:
+        doc = library["documents"].get(doc_id)
+        if doc is not None:
+            doc["vectors"] = vectors
+
+
+@contextmanager
+def ingest_lock(username: str, doc_id: str):
+    key = (username, doc_id)
+    with _ingest_locks_guard:
+        lock = _ingest_locks.setdefault(key, threading.Lock())
+    with lock:
+        yield
+    with _ingest_locks_guard:
+        if not lock.locked():
+            _ingest_locks.pop(key, None)
+
+
+def attach(username: str, chat_id: str, doc_id: str) -> bool:
+    """Attach one of the user's documents to a chat; False if they have no such document."""
+    with _update(username) as library:
+        if doc_id not in library["documents"]:
+            return False
+        attached = library["attachments"].setdefault(chat_id, [])
+        if doc_id not in attached:
+            attached.append(doc_id)
+    return True
+
+
+def _drop_unattached(library: Dict, doc_ids: Iterable[str]) -> List[Dict]:
+    """Remove those of ``doc_ids`` that no chat has attached any more; returns them."""
+    attached = {d for ids in library["attachments"].values() for d in ids}
+    return [library["documents"].pop(d) for d in set(doc_ids) - attached if d in library["documents"]]
+
+
+def detach(username: str, chat_id: str, doc_id: str) -> Optional[List[Dict]]:
+    """Detach a document from a chat; None if it wasn't attached.
+
+    Returns the documents this dropped from the library: the detached one if
+    no other chat has it attached, else none. The caller removes their vectors.
+    """
+    with _update(username) as library:
+        attached = library["attachments"].get(chat_id, [])
+        if doc_id not in attached:
+            return None
+        attached.remove(doc_id)
+        if not attached:
+            del library["attachments"][chat_id]
+        dropped = _drop_unattached(library, [doc_id])
+    delete_uploads([d["stored_as"] for d in dropped])
+    return dropped
+
+
+def attached_ids(username: str, chat_id: str) -> List[str]:
+    return list(_read(username)["attachments"].get(chat_id, []))
+
+
+def attached_documents(username: str, chat_id: str) -> List[Dict]:
+    library = _read(username)
+    docs = library["documents"]
+    return [docs[d] for d in library["attachments"].get(chat_id, []) if d in docs]
+
+
+def forget_chat(username: str, chat_id: str) -> List[Dict]:
+    """Drop a deleted chat's attachments and the documents no other chat has attached.
+
+    Returns the dropped documents; the caller removes their vectors.
+    """
+    if not _path(username).exists():
+        return []
+    with _update(username) as library:
+        dropped = _drop_unattached(library, library["attachments"].pop(chat_id, []))
+    delete_uploads([d["stored_as"] for d in dropped])
+    return dropped
+
+
+def prune(live_chat_ids: Set[str]) -> int:
+    """Forget attachments of chats not in ``live_chat_ids`` in every library; returns the documents dropped.
+
+    Catches chats deleted while a send was attaching an upload to them. The
+    dropped documents' vectors are left to compaction (live_documents()).
+    """
+    dropped = []
+    for path in LIBRARY_DIR.glob("*.json"):
+        if all(c in live_chat_ids for c in _read(path.stem)["attachments"]):
+            continue
+        with _update(path.stem) as library:
+            gone = [c for c in library["attachments"] if c not in live_chat_ids]
+            doc_ids = [d for c in gone for d in library["attachments"].pop(c)]
+            dropped += _drop_unattached(library, doc_ids)
+    delete_uploads([d["stored_as"] for d in dropped])
+    return len(dropped)
+
+
+def live_documents() -> Optional[Set[Tuple[str, str]]]:
+    """(username, doc_id) of every document in a library, or None if a library can't be read."""
+    live = set()
+    for path in LIBRARY_DIR.glob("*.json"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                live.update((path.stem, doc_id) for doc_id in json.load(f)["documents"])
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Better to keep orphans one more round than drop a live document's vectors
+            logger.error("Can't read library %s, keeping orphaned document vectors: %s", path, e)
+            return None
+    return live
+
+
+def delete_document(username: str, doc_id: str) -> Optional[Dict]:
+    """Remove a document from the library, every chat it's attached to and its file.
+
+    The caller removes its vectors. Returns the document, or None if the
+    user has no such document.
+    """
+    with _update(username) as library:
+        doc = library["documents"].pop(doc_id, None)
+        if doc is None:
+            return None
+        for chat_id in list(library["attachments"]):
+            attached = [d for d in library["attachments"][chat_id] if d != doc_id]
+            if attached:
+                library["attachments"][chat_id] = attached
+            else:
+                del library["attachments"][chat_id]
+    delete_uploads([doc["stored_as"]])
+    return doc
+
+
+def library_uploads(username: Optional[str] = None) -> Set[str]:
+    """Upload names held by the library (one user's, or everyone's)."""
+    paths = [_path(username)] if username else LIBRARY_DIR.glob("*.json")
+    names = set()
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                names |= {d["stored_as"] for d in json.load(f)["documents"].values()}
+        except FileNotFoundError:
+            continue
+    return names
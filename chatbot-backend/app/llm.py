@@ -2,117 +2,47 @@
 import os
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 
-import requests
 import json
 import base64
+import logging
 import time
 from pathlib import Path
 from datetime import datetime
 from typing import List, Dict, Optional, Union
 import numpy as np
-import faiss
-import torch
 from PyPDF2 import PdfReader
 from app.chat_store import load_chat_messages
+from app import library
+from app.cancellation import CancelToken
+from app.chat_memory import CHAT_MEMORY, chat_memory
+from app.vector_service import get_vector_store
+from app.scheduler import scheduler
+from app.ollama_client import OllamaError
+from app.model_manager import model_manager
+from app.model_router import Route, model_router
+from app.tracing import span, traced
+from app.uploads import UPLOADS_DIR
+from app.metrics import (
+    EMBED_SECONDS, VECTOR_SEARCH_SECONDS, PROMPT_BUILD_SECONDS, GENERATION_TTFT_SECONDS,
+    GENERATION_SECONDS, PDF_PAGES_PER_SECOND, PDF_PAGES,
+)
+
+logger = logging.getLogger(__name__)
 
 MAX_CONTEXT_MESSAGES = 6
-UPLOADS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploads"))
-VECTOR_STORE_DIR = Path("vector_store")
+# Retrieved passages scoring below this cosine similarity stay out of the prompt
+VECTOR_MIN_SCORE = float(os.environ["VECTOR_MIN_SCORE"]) if os.environ.get("VECTOR_MIN_SCORE") else None
 SYSTEM_PROMPT = """You are a helpful technical assistant. Use uploaded file context (images or PDFs) where possible. Respond clearly, concisely, and factually."""
 
-USE_GPU = torch.cuda.is_available()
-if USE_GPU:
-    import faiss.contrib.torch_utils
-
-
-class VectorStore:
-    def __init__(self, dim: int = 768):
-        self.path = VECTOR_STORE_DIR
-        self.path.mkdir(parents=True, exist_ok=True)
-        self.index = faiss.IndexFlatL2(dim)
-        if USE_GPU:
-            res = faiss.StandardGpuResources()
-            self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
-
-        self.meta_path = self.path / "metadata.json"
-        self.index_path = self.path / "index.bin"
-        self.metadata = []
-
-        if self.index_path.exists() and self.meta_path.exists():
-            self.index = faiss.read_index(str(self.index_path))
-            with open(self.meta_path, "r") as f:
-                self.metadata = json.load(f)
-
-    def add(self, vectors: np.ndarray, metadatas: List[Dict]):
-        self.index.add(vectors)
-        self.metadata.extend(metadatas)
-        self._save()
-
-    def _save(self):
-        faiss.write_index(self.index, str(self.index_path))
-        with open(self.meta_path, "w") as f:
-            json.dump(self.metadata, f)
-
-    def search(self, vector: np.ndarray, k=4, chat_id=None, time_window_minutes=120) -> List[Dict]:
-        if self.index.ntotal == 0:
-            print("[DEBUG] Vector store is empty")
-            return []
-            
-        print(f"[DEBUG] Searching vector store with {self.index.ntotal} total vectors")
-        
-        # Simple kNN search
-        D, I = self.index.search(vector.reshape(1, -1), self.index.ntotal)
-        
-        current_time = datetime.now()
-        results = []
-        
-        for idx in I[0]:
-            if idx >= len(self.metadata):
-                continue
-                
-            m = self.metadata[idx]
-            
-            # Only filter by chat_id and time
-            if chat_id is not None and m["chat_id"] != chat_id:
-                continue
-                
-            try:
-                timestamp = datetime.fromisoformat(m["timestamp"])
-                time_diff = (current_time - timestamp).total_seconds() / 60
-                if time_diff > time_window_minutes:
-                    continue
-                    
-                if m["type"] == "pdf":
-                    content = f"[PDF Page {m['page']+1}]: {m['content']}"
-                elif m["type"] == "image":
-                    content = f"[Image]: {m['description']}"
-                else:
-                    continue
-                    
-                results.append({"content": content})
-                
-                if len(results) >= k:
-                    break
-                    
-            except Exception as e:
-                print(f"[DEBUG] Error processing result: {e}")
-                continue
-                
-        print(f"[DEBUG] Returning {len(results)} results")
-        return results
-
-
-store = VectorStore()
+store = get_vector_store()
 
 
 def embed_text(text: str) -> Optional[np.ndarray]:
     try:
-        r = requests.post("http://localhost:11434/api/embeddings", json={
-            "model": "nomic-embed-text",
-            "prompt": text
-        })
-        return np.array(r.json()["embedding"], dtype=np.float32)
-    except:
+        with EMBED_SECONDS.time():
+            return np.array(model_manager.embed(text), dtype=np.float32)
+    except OllamaError as e:
+        logger.error("Embedding failed: %s", e.message, extra={"code": e.code})
         return None
 
 
@@ -121,80 +51,122 @@ def encode_image_base64(path: str) -> str:
         return base64.b64encode(f.read()).decode()
 
 
-def process_pdf(path: str, chat_id: str):
-    print(f"[DEBUG] Processing PDF: {path}")
+def _scope(chat_id: Optional[str], username: Optional[str], doc_id: Optional[str]) -> Dict:
+    """Vector metadata placing an attachment's vectors in a chat or in a user's library."""
+    if doc_id:
+        return {"username": username, "doc_id": doc_id}
+    return {"chat_id": chat_id}
+
+
+@traced("attachment.process_pdf")
+def process_pdf(path: str, chat_id: Optional[str] = None, username: Optional[str] = None,
+                doc_id: Optional[str] = None) -> int:
+    """Embed a PDF's pages into the vector store; returns the number of vectors added."""
+    start = time.perf_counter()
     try:
-        reader = PdfReader(path)
-        print(f"[DEBUG] PDF loaded successfully with {len(reader.pages)} pages")
-        chunks, metadatas = [], []
-        
-        for i, page in enumerate(reader.pages):
-            print(f"[DEBUG] Processing page {i+1}")
-            text = page.extract_text() or ""
-            text = " ".join(text.split())
-            if len(text) < 100:
-                print(f"[DEBUG] Skipping page {i+1} - insufficient content length")
-                continue
-                
-            for j in range(0, len(text), 1000):
-                chunk = text[j:j+1000]
-                chunks.append(chunk)
-                metadatas.append({
-                    "type": "pdf", "chat_id": chat_id, "page": i,
-                    "content": chunk, "timestamp": str(datetime.now())
-                })
-                
-        print(f"[DEBUG] Extracted {len(chunks)} chunks from PDF")
-        
-        if chunks:
-            embeddings = []
+        with span("pdf.extract") as s:
+            reader = PdfReader(path)
+            chunks, metadatas = [], []
+
+            for i, page in enumerate(reader.pages):
+                text = page.extract_text() or ""
+                text = " ".join(text.split())
+                if len(text) < 100:
+                    continue
+
+                for j in range(0, len(text), 1000):
+                    chunk = text[j:j+1000]
+                    chunks.append(chunk)
+                    metadatas.append({
+                        "type": "pdf", **_scope(chat_id, username, doc_id), "page": i,
+                        "content": chunk, "timestamp": str(datetime.now())
+                    })
+            if s is not None:
+                s.set_attribute("pages", len(reader.pages))
+                s.set_attribute("chunks", len(chunks))
+
+        with span("pdf.embed", chunks=len(chunks)):
+            embeddings, embedded_metadatas = [], []
             for i, c in enumerate(chunks):
-                print(f"[DEBUG] Embedding chunk {i+1}/{len(chunks)}")
                 vec = embed_text(c)
                 if vec is not None:
                     embeddings.append(vec)
-                else:
-                    print(f"[DEBUG] Failed to embed chunk {i+1}")
-                    
-            if embeddings:
-                print(f"[DEBUG] Adding {len(embeddings)} embeddings to vector store")
-                store.add(np.array(embeddings, dtype=np.float32), metadatas)
-            else:
-                print("[DEBUG] No successful embeddings generated")
-        else:
-            print("[DEBUG] No chunks extracted from PDF")
-            
-    except Exception as e:
-        print(f"[ERROR] PDF processing failed: {str(e)}")
-
-
-def process_image(path: str, chat_id: str):
-    image_b64 = encode_image_base64(path)
-    r = requests.post("http://localhost:11434/api/generate", json={
-        "model": "llava",
-        "prompt": "Describe this image in detail",
-        "images": [image_b64],
-        "stream": False
-    })
-    desc = r.json().get("response", "")
+                    embedded_metadatas.append(metadatas[i])
+
+        if embeddings:
+            # Metadata must stay aligned with vector positions, so drop the failed chunks' entries
+            with span("vector.add", vectors=len(embeddings)):
+                store.add(np.array(embeddings, dtype=np.float32), embedded_metadatas)
+
+        elapsed = time.perf_counter() - start
+        pages = len(reader.pages)
+        PDF_PAGES.inc(pages)
+        if elapsed > 0:
+            PDF_PAGES_PER_SECOND.observe(pages / elapsed)
+        logger.debug("Ingested PDF", extra={
+            "chat_id": chat_id, "doc_id": doc_id, "pages": pages, "chunks": len(chunks),
+            "embedded": len(embeddings), "seconds": round(elapsed, 3),
+        })
+        return len(embeddings)
+    except Exception:
+        logger.exception("PDF processing failed", extra={"chat_id": chat_id, "doc_id": doc_id, "path": path})
+        return 0
+
+
+@traced("attachment.process_image")
+def process_image(path: str, chat_id: Optional[str] = None, username: str = "", doc_id: Optional[str] = None) -> int:
+    # Batched with other uploads so llava is loaded once per batch
+    desc = model_manager.describe_image(encode_image_base64(path))
     vec = embed_text(desc)
-    if vec is not None:
+    if vec is None:
+        return 0
+    with span("vector.add", vectors=1):
         store.add(np.array([vec], dtype=np.float32), [{
-            "type": "image", "chat_id": chat_id,
+            "type": "image", **_scope(chat_id, username, doc_id),
             "description": desc,
             "timestamp": str(datetime.now())
         }])
+    return 1
+
+
+@traced("attachment.ingest_document")
+def ingest_document(username: str, doc_id: str):
+    """Embed a library document unless that was done already (by any chat or worker)."""
+    with library.ingest_lock(username, doc_id):
+        doc = library.get_document(username, doc_id)
+        if doc is None or doc["vectors"] is not None:
+            return
+        path = os.path.join(UPLOADS_DIR, doc["stored_as"])
+        if doc["content_type"].startswith("image/"):
+            vectors = process_image(path, username=username, doc_id=doc_id)
+        elif doc["stored_as"].lower().endswith(".pdf"):
+            vectors = process_pdf(path, username=username, doc_id=doc_id)
+        else:
+            logger.warning("Unsupported attachment type",
+                           extra={"doc_id": doc_id, "content_type": doc["content_type"]})
+            vectors = 0
+        # A failed embedding leaves nothing to search; try again on the next send
+        if vectors:
+            library.mark_ingested(username, doc_id, vectors)
 
 
-def get_context(query: str, chat_id: str) -> str:
-    print(f"[DEBUG] Getting context for query: {query[:100]}...")
-    vec = embed_text(query)
+@traced("retrieval.get_context")
+def get_context(query: str, chat_id: str, username: Optional[str] = None, vec: Optional[np.ndarray] = None) -> str:
+    """Passages for the prompt from the chat's recent vectors and the documents attached to it.
+
+    ``vec`` is the query's embedding if the caller has it already.
+    """
+    if vec is None:
+        vec = embed_text(query)
     if vec is None:
-        print("[DEBUG] Failed to embed query")
         return ""
-        
-    results = store.search(vec, chat_id=chat_id, k=5)
-    print(f"[DEBUG] Found {len(results)} context matches")
+
+    doc_ids = library.attached_ids(username, chat_id) if username else None
+    with span("vector.search", k=5), VECTOR_SEARCH_SECONDS.time():
+        results = store.search(vec, chat_id=chat_id, k=5, username=username, doc_ids=doc_ids,
+                               min_score=VECTOR_MIN_SCORE)
+    logger.debug("Context search", extra={"chat_id": chat_id, "documents": len(doc_ids or []),
+                                          "matches": len(results)})
     
     if not results:
         return ""
@@ -202,10 +174,13 @@ def get_context(query: str, chat_id: str) -> str:
     return "\n\n".join(r["content"] for r in results)
 
 
-def build_prompt(messages, prompt, context=""):
+def build_prompt(messages, prompt, context="", recalled=()):
     lines = [f"[INST] <<SYS>>{SYSTEM_PROMPT}<</SYS>>"]
     if context:
         lines.append(f"Context:\n{context}")
+    if recalled:
+        lines.append("Earlier in this conversation:\n" + "\n".join(
+            f"{'User' if m['sender'] == 'user' else 'Assistant'}: {m['text']}" for m in recalled))
     for m in messages:
         if m["sender"] == "user":
             lines.append(f"[INST] {m['text']} [/INST]")
@@ -225,66 +200,61 @@ def is_image(meta) -> bool:
     return meta and meta.get("content_type", "").startswith("image/")
 
 
-def generate_llm_response(prompt: str, model_id: str, username: str, chat_id: str, attachment_meta=None) -> dict:
-    try:
-        file_path = get_file_path(attachment_meta)
-        if file_path:
-            print(f"[DEBUG] Processing attachment: {file_path}")
-            if is_image(attachment_meta):
-                print("[DEBUG] Attachment is an image")
-                process_image(file_path, chat_id)
-            elif file_path.lower().endswith(".pdf"):
-                print("[DEBUG] Attachment is a PDF")
-                process_pdf(file_path, chat_id)
-            else:
-                print(f"[DEBUG] Unsupported file type: {attachment_meta.get('content_type', 'unknown')}")
-
-        messages = load_chat_messages(username, chat_id)[-MAX_CONTEXT_MESSAGES:]
-        context = get_context(prompt, chat_id)
-        is_multimodal = is_image(attachment_meta) and model_id in ("llava", "llama3.2+llava")
-        model = "llava" if is_multimodal else "llama3.2"
-        payload = {
-            "model": model,
-            "prompt": prompt if is_multimodal else build_prompt(messages, prompt, context),
-            "stream": False
-        }
-
-        if is_multimodal:
-            payload["images"] = [encode_image_base64(file_path)]
-
-        for _ in range(3):
-            try:
-                r = requests.post("http://localhost:11434/api/generate", json=payload, timeout=60)
-                if r.status_code == 200:
-                    return {"text": r.json().get("response", "").strip(), "image": None}
-            except:
-                time.sleep(1)
-
-        return {"text": "Unable to get response", "image": None}
-    except Exception as e:
-        print(f"[FATAL] generate_llm_response failed: {e}")
-        return {"text": "Unable to get response", "image": None}
-        context = get_context(prompt, chat_id)
-        is_multimodal = is_image(attachment_meta) and model_id in ("llava", "llama3.2+llava")
-        model = "llava" if is_multimodal else "llama3.2"
-        payload = {
-            "model": model,
-            "prompt": prompt if is_multimodal else build_prompt(messages, prompt, context),
-            "stream": False
-        }
-
-        if is_multimodal:
-            payload["images"] = [encode_image_base64(file_path)]
-
-        for _ in range(3):
-            try:
-                r = requests.post("http://localhost:11434/api/generate", json=payload, timeout=60)
-                if r.status_code == 200:
-                    return {"text": r.json().get("response", "").strip(), "image": None}
-            except:
-                time.sleep(1)
-
-        return {"text": "Unable to get response", "image": None}
-    except Exception as e:
-        print(f"[FATAL] generate_llm_response failed: {e}")
-        return {"text": "Unable to get response", "image": None}
+def generate_llm_response(prompt: str, model_id: str, username: str, chat_id: str, attachment_meta=None,
+                          cancel: Optional[CancelToken] = None) -> dict:
+    """Run one chat turn. Raises OllamaError or QueueFullError for the route to report.
+
+    With ``cancel``, raises GenerationCancelled once it is cancelled: before
+    the prompt is built, while queued for a slot or during the generation.
+    The model is picked by model_router from ``model_id`` and the prompt.
+    """
+    file_path = get_file_path(attachment_meta)
+    if attachment_meta and attachment_meta.get("doc_id"):
+        ingest_document(username, attachment_meta["doc_id"])
+    elif file_path:
+        if is_image(attachment_meta):
+            process_image(file_path, chat_id, username)
+        elif file_path.lower().endswith(".pdf"):
+            process_pdf(file_path, chat_id)
+        else:
+            logger.warning("Unsupported attachment type",
+                           extra={"chat_id": chat_id, "content_type": attachment_meta.get("content_type")})
+
+    if cancel is not None:
+        cancel.check()
+
+    # One embedding of the prompt serves both the vector store and the chat's memory
+    query_vec = embed_text(prompt)
+    context = get_context(prompt, chat_id, username, vec=query_vec) if query_vec is not None else ""
+    vision_model = model_router.vision_model(model_id) if is_image(attachment_meta) else None
+    is_multimodal = vision_model is not None
+    with span("prompt.build"), PROMPT_BUILD_SECONDS.time():
+        history = load_chat_messages(username, chat_id)
+        messages = history[-MAX_CONTEXT_MESSAGES:]
+        recalled = []
+        if CHAT_MEMORY and query_vec is not None and not is_multimodal:
+            with span("memory.recall", earlier=max(0, len(history) - MAX_CONTEXT_MESSAGES)) as s:
+                recalled = chat_memory.recall(username, chat_id, query_vec, history, MAX_CONTEXT_MESSAGES)
+                if s is not None:
+                    s.set_attribute("recalled", len(recalled))
+        payload = {"prompt": prompt if is_multimodal else build_prompt(messages, prompt, context, recalled)}
+
+    if is_multimodal:
+        route = Route(vision_model, "vision")
+        payload["images"] = [encode_image_base64(file_path)]
+    else:
+        route = model_router.choose(model_id, len(payload["prompt"]))
+    model = payload["model"] = route.model
+
+    start = time.perf_counter()
+    with scheduler.slot(model, username, len(payload["prompt"]), cancel=cancel):
+        waited = time.perf_counter() - start
+        data = model_manager.generate(payload, cancel=cancel)
+    elapsed = time.perf_counter() - start
+    GENERATION_SECONDS.observe(elapsed, model=model)
+    model_router.record(route, elapsed, len(payload["prompt"]), data)
+    # Non-streaming: the first token came after the wait, the model load and prompt evaluation
+    if "prompt_eval_duration" in data:
+        ttft = waited + (data.get("load_duration", 0) + data["prompt_eval_duration"]) / 1e9
+        GENERATION_TTFT_SECONDS.observe(ttft, model=model)
+    return {"text": data.get("response", "").strip(), "image": None}
@@ -0,0 +1,69 @@
+# app/logging_config.py
+"""Leveled, structured logging for the backend.
+
+Modules log through ``logging.getLogger(__name__)`` with %-style arguments
+and ``extra={...}`` fields, so a disabled level costs one level check and no
+string formatting. configure_logging() installs one stderr handler:
+
+    LOG_LEVEL=DEBUG|INFO|WARNING|ERROR   (default INFO)
+    LOG_FORMAT=text|json                 (default text: logfmt-style key=value)
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    fields = {
+        "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+        "level": record.levelname.lower(),
+        "logger": record.name,
+        "msg": record.getMessage(),
+    }
+    for key, value in vars(record).items():
+        if key not in _RESERVED and not key.startswith("_"):
+            fields[key] = value
+    if record.exc_info:
+        fields["exc"] = logging.Formatter().formatException(record.exc_info)
+    return fields
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(_fields(record), default=str)
+
+
+class LogfmtFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        parts = []
+        for key, value in _fields(record).items():
+            value = str(value)
+            if not value or any(c in value for c in ' ="\n'):
+                value = json.dumps(value)
+            parts.append(f"{key}={value}")
+        return " ".join(parts)
+
+
+_configured = False
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Route the ``app`` loggers to stderr once per process."""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JSONFormatter() if fmt == "json" else LogfmtFormatter())
+    logger = logging.getLogger("app")
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
@@ -1,15 +1,56 @@
-from fastapi import FastAPI, Depends
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from fastapi.openapi.utils import get_openapi
 
 from app.auth import auth_router
 from app.chat_routes import chat_router
+from app.session_store import start_session_sweeper, stop_session_sweeper
+from app.model_manager import model_manager
+from app.ollama_client import start_ollama_health, stop_ollama_health
+from app.chat_store import CHAT_DIR, start_write_behind, stop_write_behind
+from app.search_index import start_backfill
+from app.chat_memory import start_chat_memory, stop_chat_memory
+from app.uploads import start_upload_gc, stop_upload_gc
+from app.retention import start_retention, stop_retention
+from app.vector_service import VECTOR_SERVICE_ADDRESS, get_vector_store
+from app.logging_config import configure_logging
+from app import metrics, tracing
+from app.debug_routes import debug_router
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_write_behind()
+    start_session_sweeper()
+    start_ollama_health()
+    model_manager.start()
+    start_backfill(CHAT_DIR)
+    start_chat_memory(CHAT_DIR)
+    start_upload_gc(CHAT_DIR)
+    if not VECTOR_SERVICE_ADDRESS:
+        # With a shared vector service, that process runs retention instead
+        start_retention(get_vector_store(), CHAT_DIR)
+    yield
+    stop_session_sweeper()
+    stop_ollama_health()
+    stop_upload_gc()
+    stop_retention()
+    stop_chat_memory()
+    stop_write_behind()
+
 
 app = FastAPI(
     title="Chatbot API",
     description="API backend for chatbot app with login and session",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 token_auth_scheme = HTTPBearer()
@@ -23,15 +64,59 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _route_label(request: Request) -> str:
+    """The route template (/chat/chat/{chat_id}/send), not the raw path, so ids
+    don't turn into unbounded label values."""
+    template = getattr(request.scope.get("route"), "path", None)
+    if template is None:
+        return "unmatched"
+    # Depending on the FastAPI version the route of an included router may lack
+    # the router's prefix: those are the path's segments before the template's
+    segments = request.scope["path"].rstrip("/").split("/")
+    depth = template.rstrip("/").count("/")
+    return "/".join(segments[:len(segments) - depth]) + template
+
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    start = time.perf_counter()
+    # Unless a response comes back, the handler raised: counted as the 500 the client gets
+    status = 500
+    try:
+        with tracing.span(f"HTTP {request.method}", traceparent=request.headers.get("traceparent"),
+                          kind=tracing.SPAN_KIND_SERVER, **{"http.method": request.method}) as root:
+            response = await call_next(request)
+            status = response.status_code
+            if root is not None:
+                route = _route_label(request)
+                root.name = f"HTTP {request.method} {route}"
+                root.set_attribute("http.route", route)
+                root.set_attribute("http.status_code", status)
+                if status >= 500:
+                    root.set_error(f"HTTP {status}")
+                response.headers["traceparent"] = root.traceparent
+                response.headers["X-Trace-Id"] = root.trace_id
+        return response
+    finally:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, method=request.method, route=_route_label(request), status=status,
+        )
+
 # Include API routes
 app.include_router(auth_router, prefix="/auth", tags=["Auth"])
 app.include_router(chat_router, prefix="/chat", tags=["Chat"])
+app.include_router(debug_router, prefix="/debug", tags=["Debug"])
 
 
 @app.get("/")
 def root():
     return {"message": "Chatbot backend is running"}
 
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint for this process."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 from fastapi.openapi.utils import get_openapi
 
 def custom_openapi():
@@ -0,0 +1,311 @@
+# app/model_manager.py
+"""Keeps the Ollama models this app uses loaded and warm.
+
+- At startup every model referenced by models/models.json (ids like
+  "llama3.2+llava" name several Ollama models, routed entries list theirs
+  under "routes") plus the embedding model is preloaded in the background.
+- Every request carries a keep_alive derived from how often that model has
+  been used recently, so busy models stay resident and idle ones are freed.
+- Image descriptions are collected into short batches and run back to back
+  on llava, instead of interleaving llava and llama3.2 and forcing Ollama to
+  swap models for every upload.
+- Latency is recorded per model and split into cold (model had to be
+  loaded) and warm calls; see report().
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+from app.ollama_client import client, embed_client, OllamaError
+from app.scheduler import scheduler
+from app.tracing import span
+
+MODELS_FILE = Path(__file__).parent.parent / "models" / "models.json"
+EMBED_MODEL = "nomic-embed-text"
+VISION_MODEL = "llava"
+
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "1") == "1"
+KEEP_ALIVE_MIN_SECONDS = int(os.environ.get("KEEP_ALIVE_MIN_SECONDS", 5 * 60))
+KEEP_ALIVE_MAX_SECONDS = int(os.environ.get("KEEP_ALIVE_MAX_SECONDS", 60 * 60))
+TRAFFIC_WINDOW_SECONDS = 60 * 60
+IMAGE_BATCH_SIZE = int(os.environ.get("IMAGE_BATCH_SIZE", 4))
+IMAGE_BATCH_WINDOW_SECONDS = float(os.environ.get("IMAGE_BATCH_WINDOW_SECONDS", 0.5))
+# Ollama reports load_duration in ns; anything above this counts as a cold start
+COLD_LOAD_SECONDS = 0.5
+# How often load_model_specs() checks models.json for changes
+MODELS_CHECK_INTERVAL_SECONDS = 2
+
+logger = logging.getLogger(__name__)
+
+
+_specs: Dict[str, Dict] = {}
+_specs_signature = None
+_specs_checked = float("-inf")
+_specs_lock = threading.Lock()
+
+
+def load_model_specs() -> Dict[str, Dict]:
+    """models.json as {model_id: {"name": ..., "routes": [...]}}; empty if the file is missing.
+
+    An entry is either a display name, whose routes are the Ollama models
+    named by its id, or an object with "name" and "routes" (see
+    app.model_router for the route fields); entries without a route are
+    left out. The file is parsed again only when it has changed, checked at
+    most every MODELS_CHECK_INTERVAL_SECONDS. Don't modify the result.
+    """
+    global _specs, _specs_signature, _specs_checked
+    with _specs_lock:
+        now = time.monotonic()
+        if now - _specs_checked < MODELS_CHECK_INTERVAL_SECONDS:
+            return _specs
+        _specs_checked = now
+        try:
+            st = MODELS_FILE.stat()
+            signature = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == _specs_signature:
+            return _specs
+        _specs, _specs_signature = _read_model_specs() if signature else {}, signature
+        return _specs
+
+
+def _read_model_specs() -> Dict[str, Dict]:
+    with open(MODELS_FILE, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    specs = {}
+    for model_id, entry in catalog.items():
+        if isinstance(entry, str):
+            entry = {"name": entry, "routes": [{"model": m} for m in ollama_models_for(model_id)]}
+        if not entry.get("routes"):
+            logger.warning("Skipping models.json entry %r: it names no Ollama model", model_id)
+            continue
+        specs[model_id] = entry
+    return specs
+
+
+def load_model_catalog() -> Dict[str, str]:
+    """models.json as {model_id: display name}; empty if the file is missing."""
+    return {model_id: spec["name"] for model_id, spec in load_model_specs().items()}
+
+
+def ollama_models_for(model_id: str) -> List[str]:
+    return [m for m in model_id.split("+") if m]
+
+
+class _LatencyStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> Dict:
+        avg = self.total / self.count if self.count else None
+        return {"count": self.count, "avg_seconds": avg, "max_seconds": self.max or None}
+
+
+class ModelManager:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uses: Dict[str, Deque[float]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._cold: Dict[str, _LatencyStats] = {}
+        self._warm: Dict[str, _LatencyStats] = {}
+        self._image_queue: Deque = deque()
+        self._image_cond = threading.Condition()
+        self._image_thread: Optional[threading.Thread] = None
+
+    def models(self) -> List[str]:
+        names = []
+        for spec in load_model_specs().values():
+            for route in spec["routes"]:
+                if route["model"] not in names:
+                    names.append(route["model"])
+        if EMBED_MODEL not in names:
+            names.append(EMBED_MODEL)
+        return names
+
+    # --- keep_alive ---------------------------------------------------------
+
+    @staticmethod
+    def _keep_alive(uses) -> int:
+        """Three times the 90th percentile gap between recent requests, so a
+        model in regular use never idles out, clamped to [MIN, MAX]."""
+        if len(uses) < 3:
+            return KEEP_ALIVE_MIN_SECONDS
+        gaps = sorted(b - a for a, b in zip(uses, list(uses)[1:]))
+        typical_gap = gaps[max(0, int(len(gaps) * 0.9) - 1)]
+        return int(min(KEEP_ALIVE_MAX_SECONDS, max(KEEP_ALIVE_MIN_SECONDS, 3 * typical_gap)))
+
+    def keep_alive_for(self, model: str) -> int:
+        """Seconds Ollama should keep ``model`` loaded after this request."""
+        with self._lock:
+            return self._keep_alive(self._uses.get(model, ()))
+
+    def is_loaded(self, model: str) -> bool:
+        """Whether ``model`` should still be resident: used within its current keep_alive."""
+        with self._lock:
+            last = self._last_used.get(model)
+            return last is not None and time.time() - last <= self._keep_alive(self._uses.get(model, ()))
+
+    def cold_start_seconds(self, model: str) -> Optional[float]:
+        """Average latency of ``model``'s cold requests so far, None before the first."""
+        with self._lock:
+            stats = self._cold.get(model)
+            return stats.total / stats.count if stats else None
+
+    def record(self, model: str, elapsed: float, response: Optional[Dict] = None):
+        """Note one request to ``model`` that took ``elapsed`` seconds."""
+        now = time.time()
+        with self._lock:
+            previous = self._last_used.get(model)
+            load_ns = (response or {}).get("load_duration")
+            if load_ns is not None:
+                cold = load_ns / 1e9 >= COLD_LOAD_SECONDS
+            else:
+                # No load_duration (embeddings): cold if it idled past its keep_alive
+                cold = previous is None or now - previous > self._keep_alive(self._uses.get(model, ()))
+            (self._cold if cold else self._warm).setdefault(model, _LatencyStats()).add(elapsed)
+
+            uses = self._uses.setdefault(model, deque())
+            uses.append(now)
+            while uses and now - uses[0] > TRAFFIC_WINDOW_SECONDS:
+                uses.popleft()
+            self._last_used[model] = now
+
+    # --- calls ----------------------------------------------------------------
+
+    def generate(self, payload: Dict, **kwargs) -> Dict:
+        model = payload["model"]
+        with span("ollama.generate", model=model, prompt_chars=len(payload.get("prompt", ""))) as s:
+            start = time.perf_counter()
+            data = client.generate(dict(payload, keep_alive=self.keep_alive_for(model)), **kwargs)
+            self.record(model, time.perf_counter() - start, data)
+            if s is not None:
+                # Ollama's own breakdown, so the span shows load vs prompt eval vs decoding
+                for key in ("load_duration", "prompt_eval_duration", "eval_duration"):
+                    if key in data:
+                        s.set_attribute(f"ollama.{key}_ms", round(data[key] / 1e6, 1))
+                if "eval_count" in data:
+                    s.set_attribute("ollama.eval_count", data["eval_count"])
+        return data
+
+    def embed(self, text: str) -> list:
+        with span("ollama.embed", model=EMBED_MODEL, chars=len(text)):
+            start = time.perf_counter()
+            vector = embed_client.embed(text, model=EMBED_MODEL, keep_alive=self.keep_alive_for(EMBED_MODEL))
+            self.record(EMBED_MODEL, time.perf_counter() - start)
+        return vector
+
+    def embed_batch(self, texts: List[str]) -> List[list]:
+        with span("ollama.embed", model=EMBED_MODEL, inputs=len(texts)):
+            start = time.perf_counter()
+            vectors = embed_client.embed_batch(texts, model=EMBED_MODEL, keep_alive=self.keep_alive_for(EMBED_MODEL))
+            self.record(EMBED_MODEL, time.perf_counter() - start)
+        return vectors
+
+    def warm_up(self):
+        """Load every configured model so the first user request doesn't pay for it."""
+        for model in self.models():
+            start = time.perf_counter()
+            try:
+                if model == EMBED_MODEL:
+                    embed_client.embed("warm up", model=model, keep_alive=self.keep_alive_for(model))
+                    data = None
+                else:
+                    # An empty prompt just loads the model
+                    data = client.post("/api/generate", {
+                        "model": model, "prompt": "", "stream": False,
+                        "keep_alive": self.keep_alive_for(model),
+                    }, timeout=300, retries=1)
+            except OllamaError as e:
+                logger.error("Warm-up of %s failed: %s", model, e.message, extra={"code": e.code})
+                continue
+            elapsed = time.perf_counter() - start
+            self.record(model, elapsed, data)
+            logger.info("Warmed up %s in %.1fs", model, elapsed)
+
+    # --- image batching -------------------------------------------------------
+
+    def describe_image(self, image_b64: str, prompt: str = "Describe this image in detail") -> str:
+        """Queue an image for the next llava batch and wait for its description."""
+        with span("image.describe"):
+            return self._describe_image(image_b64, prompt)
+
+    def _describe_image(self, image_b64: str, prompt: str) -> str:
+        future: Future = Future()
+        with self._image_cond:
+            self._image_queue.append((image_b64, prompt, future))
+            self._image_cond.notify()
+        self._ensure_image_worker()
+        return future.result()
+
+    def _ensure_image_worker(self):
+        with self._image_cond:
+            if self._image_thread is None or not self._image_thread.is_alive():
+                self._image_thread = threading.Thread(target=self._image_loop, name="image-batcher", daemon=True)
+                self._image_thread.start()
+
+    def _next_image_batch(self) -> list:
+        with self._image_cond:
+            while not self._image_queue:
+                self._image_cond.wait()
+            # Give other uploads a moment to join this batch
+            deadline = time.monotonic() + IMAGE_BATCH_WINDOW_SECONDS
+            while len(self._image_queue) < IMAGE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._image_cond.wait(remaining)
+            return [self._image_queue.popleft() for _ in range(min(IMAGE_BATCH_SIZE, len(self._image_queue)))]
+
+    def _image_loop(self):
+        while True:
+            batch = self._next_image_batch()
+            # One llava slot for the whole batch keeps the model loaded across it
+            try:
+                with scheduler.slot(VISION_MODEL, "", 0):
+                    for image_b64, prompt, future in batch:
+                        try:
+                            data = self.generate({"model": VISION_MODEL, "prompt": prompt, "images": [image_b64]})
+                            future.set_result(data.get("response", ""))
+                        except Exception as e:
+                            future.set_exception(e)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    # --- reporting ------------------------------------------------------------
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                model: {
+                    "keep_alive_seconds": self._keep_alive(self._uses.get(model, ())),
+                    "requests_last_hour": len(self._uses.get(model, ())),
+                    "cold": self._cold.get(model, _LatencyStats()).to_dict(),
+                    "warm": self._warm.get(model, _LatencyStats()).to_dict(),
+                }
+                for model in sorted(set(self._cold) | set(self._warm) | set(self._uses))
+            }
+
+    def start(self):
+        if MODEL_WARMUP:
+            threading.Thread(target=self.warm_up, name="model-warmup", daemon=True).start()
+
+
+model_manager = ModelManager()
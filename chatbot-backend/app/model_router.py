@@ -0,0 +1,201 @@
+# app/model_router.py
+"""Picks the Ollama model each chat turn is generated with.
+
+A models.json entry lists its routes, most preferred (smallest, fastest)
+first:
+
+    "auto": {"name": "Auto", "routes": [
+        {"model": "llama3.2:1b", "max_prompt_chars": 2000},
+        {"model": "llama3.2"},
+        {"model": "llava", "images": true}
+    ]}
+
+    model              the Ollama model
+    max_prompt_chars   longest prompt (history and retrieved context
+                       included) sent to it; unlimited if left out
+    images             takes image attachments; defaults to model == llava
+
+Only ids in models.json are accepted (UnknownModelError otherwise). Plain
+entries like "llama3.2+llava" route to the models in their id, so picking
+one pins the turn to it: text goes to its text model, an image
+attachment to its vision model. For an entry with several text routes the
+router takes the first whose max_prompt_chars fits, unless a later one
+that fits has a slot to spare and is expected to answer sooner: expected
+time is the scheduler's queue wait plus the route's own prompt and
+decoding rates measured on past turns, plus a load when the model has
+idled out. A model whose queue is full is only picked if every route's is.
+
+Reasons, as counted in chatbot_routed_total: choice (the entry has one
+text model), vision (image attachment), size (first route that fits),
+load (a later route, to get around a queue). MODEL_ROUTING_BALANCE=0
+keeps to size.
+"""
+import math
+import os
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from app.metrics import Counter, Histogram
+from app.model_manager import VISION_MODEL, load_model_specs, model_manager
+from app.scheduler import QueueFullError, scheduler
+
+MODEL_ROUTING_BALANCE = os.environ.get("MODEL_ROUTING_BALANCE", "1") == "1"
+# Assumed load time of a model that isn't resident, until one of its cold requests has been seen
+MODEL_ROUTING_LOAD_SECONDS = float(os.environ.get("MODEL_ROUTING_LOAD_SECONDS", 10))
+EWMA_ALPHA = 0.2
+
+ROUTED = Counter("chatbot_routed_total", "Chat turns generated per model and routing reason", ("model", "reason"))
+ROUTE_SECONDS = Histogram(
+    "chatbot_route_seconds", "Slot wait plus generation per model and routing reason", ("model", "reason"),
+)
+ROUTE_TOKENS_PER_SECOND = Histogram(
+    "chatbot_route_tokens_per_second", "Decoding throughput per model", ("model",),
+    buckets=(1, 2, 5, 10, 20, 40, 80, 160, 320),
+)
+
+
+class UnknownModelError(ValueError):
+    """The model id isn't in models.json."""
+
+
+class Route(NamedTuple):
+    model: str
+    reason: str
+
+
+def _ewma(old: Optional[float], new: float) -> float:
+    return new if old is None else old + EWMA_ALPHA * (new - old)
+
+
+class _RouteStats:
+    __slots__ = ("requests", "reasons", "seconds", "prompt_chars_per_second", "tokens_per_second",
+                 "response_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.reasons: Dict[str, int] = {}
+        self.seconds: Optional[float] = None
+        self.prompt_chars_per_second: Optional[float] = None
+        self.tokens_per_second: Optional[float] = None
+        self.response_tokens: Optional[float] = None
+
+    def add(self, reason: str, seconds: float, prompt_chars: int, response: Dict):
+        self.requests += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        self.seconds = _ewma(self.seconds, seconds)
+        if response.get("prompt_eval_duration"):
+            self.prompt_chars_per_second = _ewma(self.prompt_chars_per_second,
+                                                 prompt_chars / (response["prompt_eval_duration"] / 1e9))
+        if response.get("eval_count") and response.get("eval_duration"):
+            self.tokens_per_second = _ewma(self.tokens_per_second,
+                                           response["eval_count"] / (response["eval_duration"] / 1e9))
+            self.response_tokens = _ewma(self.response_tokens, response["eval_count"])
+
+    def service_seconds(self, prompt_chars: int) -> Optional[float]:
+        if not (self.prompt_chars_per_second and self.tokens_per_second):
+            return None
+        return prompt_chars / self.prompt_chars_per_second + self.response_tokens / self.tokens_per_second
+
+
+class ModelRouter:
+    def __init__(self, specs: Callable[[], Dict[str, Dict]] = load_model_specs, balance: bool = MODEL_ROUTING_BALANCE):
+        self._specs = specs
+        self.balance = balance
+        self._stats: Dict[str, _RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def _routes(self, model_id: str) -> List[Dict]:
+        spec = self._specs().get(model_id)
+        if spec is None:
+            raise UnknownModelError(model_id)
+        return spec["routes"]
+
+    @staticmethod
+    def _takes_images(route: Dict) -> bool:
+        return route.get("images", route["model"] == VISION_MODEL)
+
+    def _text_routes(self, model_id: str) -> List[Dict]:
+        routes = self._routes(model_id)
+        # A vision model alone answers text as well
+        return [r for r in routes if not self._takes_images(r)] or routes
+
+    def vision_model(self, model_id: str) -> Optional[str]:
+        """The model an image attachment goes to, None if ``model_id`` has none (the image is described instead)."""
+        return next((r["model"] for r in self._routes(model_id) if self._takes_images(r)), None)
+
+    def check_capacity(self, model_id: str, image: bool = False):
+        """Raise QueueFullError now if every model the turn could go to has a full queue, UnknownModelError
+        if ``model_id`` isn't offered."""
+        vision = self.vision_model(model_id) if image else None
+        models = [vision] if vision else [r["model"] for r in self._text_routes(model_id)]
+        errors = []
+        for model in models:
+            try:
+                scheduler.check_capacity(model)
+                return
+            except QueueFullError as e:
+                errors.append(e)
+        if errors:
+            raise min(errors, key=lambda e: e.retry_after)
+
+    def _has_room(self, model: str) -> bool:
+        try:
+            scheduler.check_capacity(model)
+            return True
+        except QueueFullError:
+            return False
+
+    def estimate(self, model: str, prompt_chars: int) -> float:
+        """Expected seconds until a ``prompt_chars`` prompt sent to ``model`` now is answered."""
+        with self._lock:
+            stats = self._stats.get(model)
+            service = stats.service_seconds(prompt_chars) if stats else None
+        if service is None:
+            service = scheduler.service_seconds(model)
+        if not model_manager.is_loaded(model):
+            cold = model_manager.cold_start_seconds(model)
+            service = cold if cold is not None else service + MODEL_ROUTING_LOAD_SECONDS
+        return scheduler.expected_wait(model) + service
+
+    def choose(self, model_id: str, prompt_chars: int) -> Route:
+        """The model for a text turn whose prompt is ``prompt_chars`` long."""
+        routes = self._text_routes(model_id)
+        if len(routes) == 1:
+            return Route(routes[0]["model"], "choice")
+        fits = [r for r in routes if prompt_chars <= r.get("max_prompt_chars", math.inf)] or routes[-1:]
+        if not self.balance or len(fits) == 1:
+            return Route(fits[0]["model"], "size")
+        # A later route only takes the turn if it still has a slot to spare afterwards, for the long
+        # prompts only it can serve
+        candidates = [fits[0]] + [r for r in fits[1:] if scheduler.free_slots(r["model"]) > 1]
+        candidates = [r for r in candidates if self._has_room(r["model"])] or fits
+        # min() keeps the earlier route on a tie
+        best = min(candidates, key=lambda r: self.estimate(r["model"], prompt_chars))
+        return Route(best["model"], "size" if best is fits[0] else "load")
+
+    def record(self, route: Route, seconds: float, prompt_chars: int, response: Dict):
+        """Note a turn generated on ``route`` in ``seconds`` (slot wait included)."""
+        ROUTED.inc(model=route.model, reason=route.reason)
+        ROUTE_SECONDS.observe(seconds, model=route.model, reason=route.reason)
+        if response.get("eval_count") and response.get("eval_duration"):
+            ROUTE_TOKENS_PER_SECOND.observe(response["eval_count"] / (response["eval_duration"] / 1e9),
+                                            model=route.model)
+        with self._lock:
+            self._stats.setdefault(route.model, _RouteStats()).add(route.reason, seconds, prompt_chars, response)
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                model: {
+                    "requests": s.requests,
+                    "reasons": dict(s.reasons),
+                    "avg_seconds": s.seconds,
+                    "prompt_chars_per_second": s.prompt_chars_per_second,
+                    "tokens_per_second": s.tokens_per_second,
+                    "avg_response_tokens": s.response_tokens,
+                }
+                for model, s in sorted(self._stats.items())
+            }
+
+
+model_router = ModelRouter()
@@ -24,6 +24,7 @@ class FileAttachment(BaseModel):
     stored_as: str
     content_type: str
     size: Optional[int] = None
+    doc_id: Optional[str] = None  # the upload's entry in the user's document library
 
 class Message(BaseModel):
     text: str
@@ -47,4 +48,8 @@ class NewMessageRequest(BaseModel):
     model_id: str  # model_id is now required
 
 class RenameChatRequest(BaseModel):
-    title: str
\ No newline at end of file
+    title: str
+
+# Attach a library document to a chat
+class AttachDocumentRequest(BaseModel):
+    doc_id: str
@@ -0,0 +1,455 @@
+# app/ollama_client.py
+"""HTTP client for Ollama with deadlines, retries and a circuit breaker.
+
+Every call gets a total time budget (its deadline) that covers all attempts
+and the backoff between them, so a hung server can hold a worker thread for
+at most that long. Retries use exponential backoff with full jitter and only
+happen for errors that can succeed on retry (connection errors, timeouts,
+5xx). After OLLAMA_BREAKER_FAILURES consecutive failures the breaker opens
+and calls fail immediately with CircuitOpenError until a trial request
+succeeds OLLAMA_BREAKER_RESET_SECONDS later.
+
+A generation given a CancelToken is streamed, so that cancelling it can shut
+the connection down mid-response: Ollama stops generating as soon as its
+client is gone. Cancelled calls raise GenerationCancelled and don't count
+against the breaker.
+
+A client is a pool of one or more Ollama servers (OLLAMA_URLS for
+generations, OLLAMA_EMBED_URLS for embeddings, so a burst of uploads can't
+queue behind chat replies), each with its own breaker. Every attempt goes
+to a backend that is healthy and whose breaker is closed, a different one
+on retry if there is one. Among those, backends without the model pulled
+are skipped and the one with the fewest requests outstanding from this
+process wins, counting a backend that doesn't have the model loaded as
+OLLAMA_POOL_LOAD_COST requests busier. A health thread polls /api/ps and
+/api/tags of every backend every OLLAMA_HEALTH_INTERVAL_SECONDS for what
+is loaded and pulled where.
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import requests
+
+from app.cancellation import CancelToken, GenerationCancelled
+from app.metrics import Counter, Gauge
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+# Comma-separated; both default to OLLAMA_URL
+OLLAMA_URLS = [u for u in os.environ.get("OLLAMA_URLS", OLLAMA_URL).split(",") if u.strip()]
+OLLAMA_EMBED_URLS = [u for u in os.environ.get("OLLAMA_EMBED_URLS", ",".join(OLLAMA_URLS)).split(",") if u.strip()]
+OLLAMA_HEALTH_INTERVAL_SECONDS = float(os.environ.get("OLLAMA_HEALTH_INTERVAL_SECONDS", 10))
+# Outstanding requests a backend may have beyond another before loading the model there is preferred
+OLLAMA_POOL_LOAD_COST = float(os.environ.get("OLLAMA_POOL_LOAD_COST", 4))
+OLLAMA_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT_SECONDS", 3))
+OLLAMA_GENERATE_TIMEOUT_SECONDS = float(os.environ.get("OLLAMA_GENERATE_TIMEOUT_SECONDS", 180))
+OLLAMA_EMBED_TIMEOUT_SECONDS = float(os.environ.get("OLLAMA_EMBED_TIMEOUT_SECONDS", 15))
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", 3))
+OLLAMA_BACKOFF_BASE_SECONDS = float(os.environ.get("OLLAMA_BACKOFF_BASE_SECONDS", 0.5))
+OLLAMA_BACKOFF_MAX_SECONDS = float(os.environ.get("OLLAMA_BACKOFF_MAX_SECONDS", 8))
+OLLAMA_BREAKER_FAILURES = int(os.environ.get("OLLAMA_BREAKER_FAILURES", 5))
+OLLAMA_BREAKER_RESET_SECONDS = float(os.environ.get("OLLAMA_BREAKER_RESET_SECONDS", 30))
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_REQUESTS = Counter(
+    "chatbot_ollama_requests_total", "Attempts sent to each Ollama backend", ("pool", "backend", "outcome"),
+)
+
+
+class OllamaError(Exception):
+    """Base class; ``code`` and ``status_code`` are what the API reports."""
+    code = "ollama_error"
+    status_code = 502
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict:
+        detail = {"error": self.code, "message": self.message}
+        if self.retry_after is not None:
+            detail["retry_after"] = self.retry_after
+        return detail
+
+
+class OllamaUnavailable(OllamaError):
+    code = "ollama_unavailable"
+    status_code = 503
+
+
+class OllamaTimeout(OllamaError):
+    code = "ollama_timeout"
+    status_code = 504
+
+
+class OllamaBadResponse(OllamaError):
+    code = "ollama_bad_response"
+    status_code = 502
+
+
+class CircuitOpenError(OllamaUnavailable):
+    code = "ollama_circuit_open"
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = OLLAMA_BREAKER_FAILURES,
+                 reset_timeout: float = OLLAMA_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            waited = time.monotonic() - self.opened_at
+            if self.state == self.OPEN and waited >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_after = round(max(1.0, self.reset_timeout - waited), 1)
+        raise CircuitOpenError("Ollama is unavailable, failing fast", retry_after=retry_after)
+
+    def is_open(self) -> bool:
+        """Whether allow() would refuse a request now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN and self._trial_in_flight
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_cancelled(self):
+        """The caller gave up: that says nothing about the server, but frees a trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def _stream_closer(raw) -> Callable[[], None]:
+    """A callable that ends a read blocked on ``raw`` (a urllib3 response) from another thread."""
+    shutdown = getattr(raw, "shutdown", None)
+    if shutdown is not None:
+        return shutdown  # urllib3 >= 2.3
+
+    def shut_socket():
+        # Older urllib3: shut the connection's socket down ourselves (close() alone doesn't wake the reader)
+        sock = getattr(getattr(raw, "_connection", None), "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # already closed
+
+    return shut_socket
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given 0-based retry attempt."""
+    return random.uniform(0, min(OLLAMA_BACKOFF_MAX_SECONDS, OLLAMA_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _model_name(name: str) -> str:
+    # Ollama lists "llama3.2:latest" for "llama3.2"
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+class Backend:
+    """One Ollama server of a pool, and what this process knows about it."""
+
+    def __init__(self, url: str, breaker: Optional[CircuitBreaker] = None):
+        self.url = url.strip().rstrip("/")
+        self.breaker = breaker or CircuitBreaker()
+        self.outstanding = 0
+        self.healthy = True
+        # Models in memory (/api/ps) and pulled (/api/tags); None until the first health check
+        self.loaded: set = set()
+        self.available: Optional[set] = None
+        self.checked_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url, "healthy": self.healthy, "breaker": self.breaker.state,
+            "outstanding": self.outstanding, "loaded": sorted(self.loaded),
+            "available": sorted(self.available) if self.available is not None else None,
+            "checked_at": self.checked_at,
+        }
+
+
+class OllamaClient:
+    def __init__(self, base_urls: Sequence[str] = (OLLAMA_URL,), name: str = "generate",
+                 breaker: Optional[CircuitBreaker] = None, load_cost: float = OLLAMA_POOL_LOAD_COST):
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        self.name = name
+        self.load_cost = load_cost
+        # A breaker passed in is for a single backend (tests, benchmarks)
+        self.backends = [Backend(url, breaker if len(base_urls) == 1 else None) for url in base_urls]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _pick(self, model: Optional[str], tried: List[Backend]) -> Backend:
+        """The backend for the next attempt; see the module docstring."""
+        usable = [b for b in self.backends if b.healthy and not b.breaker.is_open()] or self.backends
+        candidates = [b for b in usable if b not in tried] or usable
+        if model:
+            candidates = [b for b in candidates if b.available is None or model in b.available] or candidates
+        with self._lock:
+            backend = min(candidates, key=lambda b: b.outstanding + (
+                0 if not model or model in b.loaded else self.load_cost))
+            backend.outstanding += 1
+        return backend
+
+    def _pick_would_repeat(self, tried: List[Backend]) -> bool:
+        return all(b in tried for b in self.backends if b.healthy and not b.breaker.is_open())
+
+    def _done(self, backend: Backend, model: Optional[str], outcome: str):
+        with self._lock:
+            backend.outstanding -= 1
+            if model and outcome == "ok":
+                # Ollama keeps it loaded after serving it, at least until the next health check says otherwise
+                backend.loaded.add(model)
+        OLLAMA_REQUESTS.inc(pool=self.name, backend=backend.url, outcome=outcome)
+
+    def check_health(self):
+        """Ask every backend what it has loaded and pulled; unreachable ones are skipped until they answer."""
+        for backend in self.backends:
+            try:
+                timeout = (OLLAMA_CONNECT_TIMEOUT_SECONDS, OLLAMA_CONNECT_TIMEOUT_SECONDS)
+                ps = requests.get(backend.url + "/api/ps", timeout=timeout)
+                tags = requests.get(backend.url + "/api/tags", timeout=timeout)
+                ps.raise_for_status()
+                tags.raise_for_status()
+                loaded = {_model_name(m["name"]) for m in ps.json().get("models", [])}
+                available = {_model_name(m["name"]) for m in tags.json().get("models", [])}
+            except (requests.RequestException, ValueError, KeyError) as e:
+                if backend.healthy:
+                    logger.warning("Ollama backend %s is unhealthy: %s", backend.url, e.__class__.__name__,
+                                   extra={"pool": self.name})
+                backend.healthy = False
+            else:
+                if not backend.healthy:
+                    logger.info("Ollama backend %s is healthy again", backend.url, extra={"pool": self.name})
+                with self._lock:
+                    backend.healthy, backend.loaded, backend.available = True, loaded, available
+            backend.checked_at = time.time()
+
+    def report(self) -> List[Dict]:
+        with self._lock:
+            return [b.to_dict() for b in self.backends]
+
+    def _session(self) -> requests.Session:
+        # Keep-alive connections per thread; requests.Session isn't thread safe
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def post(self, path: str, payload: Dict, timeout: float, retries: int = OLLAMA_MAX_RETRIES,
+             cancel: Optional[CancelToken] = None) -> Dict:
+        """POST and return the JSON response; with ``cancel``, stream it (see _read_stream)."""
+        deadline = Deadline(timeout)
+        last_error: OllamaError = OllamaTimeout(f"{path} exceeded its {timeout:.0f}s budget")
+        model = payload.get("model")
+        tried: List[Backend] = []
+        for attempt in range(retries + 1):
+            if deadline.expired:
+                break
+            if cancel is not None:
+                cancel.check()
+            backend = self._pick(model, tried)
+            tried.append(backend)
+            outcome = "error"
+            try:
+                backend.breaker.allow()
+                data, last_error = self._attempt(backend, path, payload, timeout, deadline, cancel)
+                if data is not None:
+                    outcome = "ok"
+                    return data
+            except GenerationCancelled:
+                outcome = "cancelled"
+                raise
+            finally:
+                self._done(backend, model, outcome)
+
+            # Failing over to a backend not tried yet needs no backoff
+            if attempt < retries and self._pick_would_repeat(tried):
+                delay = min(backoff_delay(attempt), deadline.remaining())
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    raise GenerationCancelled(cancel.reason)
+        raise last_error
+
+    def _attempt(self, backend: Backend, path: str, payload: Dict, timeout: float, deadline: Deadline,
+                 cancel: Optional[CancelToken]):
+        """One request to ``backend``: (response, None), or (None, the error to retry on)."""
+        breaker = backend.breaker
+        try:
+            r = self._session().post(
+                backend.url + path, json=payload, stream=cancel is not None,
+                timeout=(min(OLLAMA_CONNECT_TIMEOUT_SECONDS, deadline.remaining()), deadline.remaining()),
+            )
+            if cancel is not None and r.status_code == 200:
+                data = self._read_stream(r, path, deadline, cancel)
+                breaker.record_success()
+                return data, None
+        except GenerationCancelled:
+            breaker.record_cancelled()
+            raise
+        except OllamaBadResponse:
+            # Failed mid-stream, but the server answered
+            breaker.record_success()
+            raise
+        except requests.Timeout:
+            breaker.record_failure()
+            return None, OllamaTimeout(f"{path} timed out after {timeout:.0f}s")
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            breaker.record_failure()
+            return None, OllamaUnavailable(f"Cannot reach Ollama at {backend.url}: {e.__class__.__name__}")
+        if r.status_code < 500:
+            # The server answered, so it is healthy even if it rejected the request
+            breaker.record_success()
+            if r.status_code != 200:
+                raise OllamaBadResponse(f"{path} returned {r.status_code}: {r.text[:200]}")
+            try:
+                return r.json(), None
+            except ValueError:
+                raise OllamaBadResponse(f"{path} returned invalid JSON")
+        breaker.record_failure()
+        return None, OllamaUnavailable(f"{path} returned {r.status_code}: {r.text[:200]}")
+
+    @staticmethod
+    def _read_stream(r: requests.Response, path: str, deadline: Deadline, cancel: CancelToken) -> Dict:
+        """Collect a streamed response into the one a non-streaming call returns.
+
+        Cancelling shuts the socket down from the cancelling thread, which
+        also ends a read that is waiting for the first token.
+        """
+        parts = []
+        try:
+            with cancel.on_cancel(_stream_closer(r.raw)):
+                for line in r.iter_lines():
+                    cancel.check()
+                    if deadline.expired:
+                        raise requests.Timeout(f"{path} stream exceeded its deadline")
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except ValueError:
+                        raise OllamaBadResponse(f"{path} streamed invalid JSON")
+                    if "error" in chunk:
+                        raise OllamaBadResponse(f"{path} failed: {str(chunk['error'])[:200]}")
+                    parts.append(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        return dict(chunk, response="".join(parts))
+        except (requests.RequestException, OSError):
+            cancel.check()
+            raise
+        finally:
+            r.close()
+        cancel.check()
+        raise requests.exceptions.ChunkedEncodingError(f"{path} stream ended early")
+
+    def generate(self, payload: Dict, timeout: float = OLLAMA_GENERATE_TIMEOUT_SECONDS,
+                 cancel: Optional[CancelToken] = None) -> Dict:
+        return self.post("/api/generate", dict(payload, stream=cancel is not None), timeout, cancel=cancel)
+
+    def embed(self, text: str, model: str = "nomic-embed-text",
+              timeout: float = OLLAMA_EMBED_TIMEOUT_SECONDS, keep_alive=None) -> list:
+        payload = {"model": model, "prompt": text}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        data = self.post("/api/embeddings", payload, timeout)
+        if "embedding" not in data:
+            raise OllamaBadResponse("embedding missing from /api/embeddings response")
+        return data["embedding"]
+
+    def embed_batch(self, texts: List[str], model: str = "nomic-embed-text",
+                    timeout: float = OLLAMA_EMBED_TIMEOUT_SECONDS, keep_alive=None) -> List[list]:
+        """One embedding per text from a single /api/embed call."""
+        payload = {"model": model, "input": list(texts)}
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        data = self.post("/api/embed", payload, timeout)
+        if len(data.get("embeddings") or []) != len(texts):
+            raise OllamaBadResponse("embeddings missing from /api/embed response")
+        return data["embeddings"]
+
+
+client = OllamaClient(OLLAMA_URLS, name="generate")
+embed_client = OllamaClient(OLLAMA_EMBED_URLS, name="embed")
+
+OLLAMA_BACKEND_OUTSTANDING = Gauge(
+    "chatbot_ollama_backend_outstanding", "Requests this process has in flight per Ollama backend",
+    ("pool", "backend"),
+    collect=lambda: {(pool.name, b["url"]): b["outstanding"] for pool in (client, embed_client) for b in pool.report()},
+)
+OLLAMA_BACKEND_HEALTHY = Gauge(
+    "chatbot_ollama_backend_healthy", "1 if the Ollama backend answered its last health check", ("pool", "backend"),
+    collect=lambda: {(pool.name, b["url"]): int(b["healthy"]) for pool in (client, embed_client) for b in pool.report()},
+)
+
+_health_stop = threading.Event()
+_health_thread: Optional[threading.Thread] = None
+
+
+def _health_loop():
+    while True:
+        for pool in (client, embed_client):
+            pool.check_health()
+        if _health_stop.wait(OLLAMA_HEALTH_INTERVAL_SECONDS):
+            return
+
+
+def start_ollama_health():
+    """Start the background thread that polls every Ollama backend's health and loaded models."""
+    global _health_thread
+    if _health_thread is not None and _health_thread.is_alive():
+        return
+    _health_stop.clear()
+    _health_thread = threading.Thread(target=_health_loop, name="ollama-health", daemon=True)
+    _health_thread.start()
+
+
+def stop_ollama_health():
+    _health_stop.set()
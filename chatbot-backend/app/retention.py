@@ -0,0 +1,98 @@
+# app/retention.py
+"""Scheduled retention for the vector store.
+
+VectorStore.search() never returns context older than its time window, and
+vectors of chats (or library documents) that no longer exist can't be
+asked for either, yet both stay in the index and are scanned by every
+search. Every VECTOR_RETENTION_INTERVAL_SECONDS the libraries forget
+attachments of deleted chats, dropping documents no chat has attached, and
+the store is compacted without any of these vectors; the rebuilt index is
+swapped in atomically, so searches never wait on it.
+
+The loop runs wherever the index lives: in the app process, or in the
+vector service when several workers share one.
+
+    python -m app.retention          # run once and print the report
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from app import library
+
+VECTOR_RETENTION_MINUTES = float(os.environ.get("VECTOR_RETENTION_MINUTES", 120))
+VECTOR_RETENTION_INTERVAL_SECONDS = int(os.environ.get("VECTOR_RETENTION_INTERVAL_SECONDS", 60 * 60))
+
+_retention_stop = threading.Event()
+_retention_thread: Optional[threading.Thread] = None
+last_report: Optional[Dict] = None
+
+logger = logging.getLogger(__name__)
+
+
+def live_chat_ids(chat_dir: Path) -> Optional[Set[str]]:
+    """Ids of every existing chat, or None if a chat list can't be read."""
+    ids = set()
+    for chat_list in Path(chat_dir).glob("*/chat_list.json"):
+        try:
+            with open(chat_list, "r", encoding="utf-8") as f:
+                ids.update(chat["id"] for chat in json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Better to keep orphans one more round than drop live context
+            logger.error("Retention can't read %s, keeping orphaned vectors: %s", chat_list, e)
+            return None
+    return ids
+
+
+def run_retention(store, chat_dir: Path) -> Dict:
+    """Compact ``store`` once; returns what was removed, reclaimed bytes and scan speedup."""
+    global last_report
+    live = live_chat_ids(chat_dir)
+    if live is not None:
+        dropped = library.prune(live)
+        if dropped:
+            logger.info("Vector retention dropped %d library documents of deleted chats", dropped)
+    report = store.compact(max_age_minutes=VECTOR_RETENTION_MINUTES, live_chat_ids=live,
+                           live_documents=library.live_documents())
+    last_report = report
+    if report["removed"]:
+        logger.info("Vector retention removed %d vectors", report["removed"], extra={
+            "removed_by_reason": report["removed_by_reason"], "reclaimed_bytes": report["reclaimed_bytes"],
+            "scan_ms_before": report["scan_ms_before"], "scan_ms_after": report["scan_ms_after"],
+        })
+    return report
+
+
+def _retention_loop(store, chat_dir: Path):
+    while not _retention_stop.wait(VECTOR_RETENTION_INTERVAL_SECONDS):
+        try:
+            run_retention(store, chat_dir)
+        except Exception:
+            logger.exception("Vector retention failed")
+
+
+def start_retention(store, chat_dir: Path):
+    """Start the background thread that periodically compacts ``store``."""
+    global _retention_thread
+    if _retention_thread is not None and _retention_thread.is_alive():
+        return
+    _retention_stop.clear()
+    _retention_thread = threading.Thread(
+        target=_retention_loop, args=(store, chat_dir), name="vector-retention", daemon=True
+    )
+    _retention_thread.start()
+
+
+def stop_retention():
+    _retention_stop.set()
+
+
+if __name__ == "__main__":
+    from app.logging_config import configure_logging
+    configure_logging()
+    from app.chat_store import CHAT_DIR
+    from app.vector_service import get_vector_store
+    print(json.dumps(run_retention(get_vector_store(), CHAT_DIR), indent=2))
@@ -0,0 +1,265 @@
+# app/scheduler.py
+"""Admission control and fair queueing for Ollama generations.
+
+Each model gets a bounded number of concurrent generations. Requests beyond
+that wait in per-user FIFO queues that are served round-robin, so one user
+firing many messages can't starve everyone else. Short prompts are served
+before long ones, and a long prompt that has waited PRIORITY_AGING_SECONDS
+is treated as short so it can't starve either. When a model's queue is full
+callers get QueueFullError with a Retry-After estimate.
+
+Blocking by design: generations run in worker threads, never on the event loop.
+A waiter whose turn is cancelled leaves the queue at once.
+
+Slots and queues live in the process. With several uvicorn workers the
+limits below are for the whole deployment and each of the
+GENERATION_WORKERS processes (app.serve sets it to --workers) gets an equal
+share, at least one slot per model. Workers don't lend each other unused
+slots, so a worker can turn a request away while another has room.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+from app.cancellation import CancelToken, GenerationCancelled
+from app.config import GENERATION_WORKERS
+from app.metrics import Gauge, Histogram
+from app.tracing import span
+
+GENERATION_CONCURRENCY = int(os.environ.get("GENERATION_CONCURRENCY", 2))
+# e.g. '{"llava": 1, "llama3.2": 4}'
+GENERATION_CONCURRENCY_PER_MODEL: Dict[str, int] = json.loads(
+    os.environ.get("GENERATION_CONCURRENCY_PER_MODEL", "{}")
+)
+GENERATION_MAX_QUEUE = int(os.environ.get("GENERATION_MAX_QUEUE", 16))
+GENERATION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("GENERATION_QUEUE_TIMEOUT_SECONDS", 120))
+SHORT_PROMPT_CHARS = int(os.environ.get("SHORT_PROMPT_CHARS", 1000))
+PRIORITY_AGING_SECONDS = float(os.environ.get("PRIORITY_AGING_SECONDS", 10))
+
+
+class QueueFullError(Exception):
+    """The model's queue is full (or the wait timed out); retry later."""
+
+    def __init__(self, model: str, retry_after: float, queued: int):
+        super().__init__(f"Generation queue for {model} is full")
+        self.model = model
+        self.retry_after = retry_after
+        self.queued = queued
+
+
+class _Waiter:
+    __slots__ = ("username", "prompt_len", "enqueued_at", "granted")
+
+    def __init__(self, username: str, prompt_len: int):
+        self.username = username
+        self.prompt_len = prompt_len
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class _ModelQueue:
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.queued = 0
+        # username -> FIFO of that user's waiters; order of keys is the round-robin order
+        self.users: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self.avg_service_seconds = 5.0
+
+    def _is_priority(self, waiter: _Waiter, now: float) -> bool:
+        return (waiter.prompt_len <= SHORT_PROMPT_CHARS
+                or now - waiter.enqueued_at >= PRIORITY_AGING_SECONDS)
+
+    def dispatch_order(self) -> List[_Waiter]:
+        """The order queued waiters would be granted slots in, without granting any."""
+        users = OrderedDict((u, deque(q)) for u, q in self.users.items())
+        order = []
+        now = time.monotonic()
+        while users:
+            order.append(self._pick(users, now))
+        return order
+
+    def _pick(self, users, now) -> _Waiter:
+        chosen = None
+        for username, q in users.items():
+            if self._is_priority(q[0], now):
+                chosen = username
+                break
+        if chosen is None:
+            chosen = next(iter(users))
+        q = users.pop(chosen)
+        waiter = q.popleft()
+        if q:
+            users[chosen] = q  # back of the round-robin order
+        return waiter
+
+    def grant_next(self) -> Optional[_Waiter]:
+        if not self.users or self.active >= self.max_concurrency:
+            return None
+        waiter = self._pick(self.users, time.monotonic())
+        self.queued -= 1
+        self.active += 1
+        waiter.granted = True
+        return waiter
+
+    def remove(self, waiter: _Waiter):
+        q = self.users.get(waiter.username)
+        if q is not None and waiter in q:
+            q.remove(waiter)
+            self.queued -= 1
+            if not q:
+                del self.users[waiter.username]
+
+
+class GenerationScheduler:
+    def __init__(self, concurrency: int = GENERATION_CONCURRENCY,
+                 per_model: Optional[Dict[str, int]] = None,
+                 max_queue: int = GENERATION_MAX_QUEUE,
+                 queue_timeout: float = GENERATION_QUEUE_TIMEOUT_SECONDS):
+        self.concurrency = concurrency
+        self.per_model = dict(GENERATION_CONCURRENCY_PER_MODEL if per_model is None else per_model)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._models: Dict[str, _ModelQueue] = {}
+        self._cond = threading.Condition()
+
+    def _queue(self, model: str) -> _ModelQueue:
+        mq = self._models.get(model)
+        if mq is None:
+            mq = self._models[model] = _ModelQueue(self.per_model.get(model, self.concurrency))
+        return mq
+
+    def _retry_after(self, mq: _ModelQueue) -> float:
+        return round(mq.avg_service_seconds * (mq.queued + 1) / mq.max_concurrency, 1)
+
+    def check_capacity(self, model: str):
+        """Raise QueueFullError now instead of after the caller has done other work."""
+        with self._cond:
+            mq = self._queue(model)
+            if mq.active >= mq.max_concurrency and mq.queued >= self.max_queue:
+                raise QueueFullError(model, self._retry_after(mq), mq.queued)
+
+    def expected_wait(self, model: str) -> float:
+        """Seconds a request for ``model`` arriving now would wait for a slot, by queue and average slot time."""
+        with self._cond:
+            mq = self._queue(model)
+            ahead = mq.active + mq.queued + 1 - mq.max_concurrency
+            return max(0, ahead) * mq.avg_service_seconds / mq.max_concurrency
+
+    def free_slots(self, model: str) -> int:
+        """Slots of ``model`` a request arriving now could take without queueing."""
+        with self._cond:
+            mq = self._queue(model)
+            return 0 if mq.users else max(0, mq.max_concurrency - mq.active)
+
+    def service_seconds(self, model: str) -> float:
+        """Moving average of how long ``model``'s slots are held."""
+        with self._cond:
+            return self._queue(model).avg_service_seconds
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def acquire(self, model: str, username: str, prompt_len: int, cancel: Optional[CancelToken] = None):
+        if cancel is None:
+            self._acquire(model, username, prompt_len, None)
+            return
+        with cancel.on_cancel(self._wake):
+            self._acquire(model, username, prompt_len, cancel)
+
+    def _acquire(self, model: str, username: str, prompt_len: int, cancel: Optional[CancelToken]):
+        with self._cond:
+            if cancel is not None:
+                cancel.check()
+            mq = self._queue(model)
+            if mq.active < mq.max_concurrency and not mq.users:
+                mq.active += 1
+                return
+            if mq.queued >= self.max_queue:
+                raise QueueFullError(model, self._retry_after(mq), mq.queued)
+
+            waiter = _Waiter(username, prompt_len)
+            mq.users.setdefault(username, deque()).append(waiter)
+            mq.queued += 1
+            deadline = waiter.enqueued_at + self.queue_timeout
+            while not waiter.granted:
+                if cancel is not None and cancel.cancelled:
+                    mq.remove(waiter)
+                    raise GenerationCancelled(cancel.reason)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    mq.remove(waiter)
+                    raise QueueFullError(model, self._retry_after(mq), mq.queued)
+                self._cond.wait(remaining)
+
+    def release(self, model: str, held_seconds: Optional[float] = None):
+        with self._cond:
+            mq = self._queue(model)
+            mq.active -= 1
+            if held_seconds is not None:
+                mq.avg_service_seconds = 0.8 * mq.avg_service_seconds + 0.2 * held_seconds
+            granted = False
+            while mq.grant_next() is not None:
+                granted = True
+            if granted:
+                self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, model: str, username: str, prompt_len: int, cancel: Optional[CancelToken] = None):
+        """Hold one of ``model``'s generation slots for the duration of the block."""
+        start = time.monotonic()
+        with span("scheduler.wait", model=model):
+            self.acquire(model, username, prompt_len, cancel)
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - start, model=model)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(model, time.monotonic() - start)
+
+    def snapshot(self, username: Optional[str] = None) -> Dict:
+        """Per-model load plus, if given, the 1-based queue positions of ``username``."""
+        with self._cond:
+            result = {}
+            for model, mq in self._models.items():
+                info = {
+                    "active": mq.active,
+                    "queued": mq.queued,
+                    "max_concurrency": mq.max_concurrency,
+                    "max_queue": self.max_queue,
+                    "retry_after": self._retry_after(mq),
+                }
+                if username is not None:
+                    info["positions"] = [
+                        i + 1 for i, w in enumerate(mq.dispatch_order()) if w.username == username
+                    ]
+                result[model] = info
+            return result
+
+
+def _per_worker(limit: int) -> int:
+    """This process's share of a deployment-wide limit."""
+    return max(1, limit // GENERATION_WORKERS) if limit > 0 else limit
+
+
+scheduler = GenerationScheduler(
+    concurrency=_per_worker(GENERATION_CONCURRENCY),
+    per_model={model: _per_worker(n) for model, n in GENERATION_CONCURRENCY_PER_MODEL.items()},
+    max_queue=_per_worker(GENERATION_MAX_QUEUE),
+)
+
+QUEUE_WAIT_SECONDS = Histogram("chatbot_generation_queue_wait_seconds", "Wait for a generation slot", ("model",))
+GENERATION_QUEUE_DEPTH = Gauge(
+    "chatbot_generation_queue_depth", "Generations waiting for a slot", ("model",),
+    collect=lambda: {(model,): info["queued"] for model, info in scheduler.snapshot().items()},
+)
+GENERATION_ACTIVE = Gauge(
+    "chatbot_generation_active", "Generations holding a slot", ("model",),
+    collect=lambda: {(model,): info["active"] for model, info in scheduler.snapshot().items()},
+)
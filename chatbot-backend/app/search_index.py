@@ -0,0 +1,252 @@
+# app/search_index.py
+"""Full-text search over chat messages, backed by SQLite FTS5.
+
+Messages live in a plain ``messages`` table; ``messages_fts`` is an
+external-content FTS5 index over their text kept in sync by triggers, so
+deleting a chat is an indexed DELETE on (username, chat_id). Each user owns
+a contiguous rowid range (user_id << 32), so a query passes that range to
+FTS5 and only the searching user's matches are read and ranked. chat_store calls index_message() from
+save_message() and remove_chat() from delete_user_chat(). Existing chat
+files are indexed once in the background the first time the app starts
+with an empty index.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import DATA_DIR
+
+SEARCH_DB_PATH = Path(os.environ.get("SEARCH_DB_PATH", DATA_DIR / "search.db"))
+SEARCH_MAX_PAGE_SIZE = 100
+USER_ROWID_BITS = 32
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    sender TEXT,
+    timestamp TEXT,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, username TEXT NOT NULL UNIQUE);
+CREATE UNIQUE INDEX IF NOT EXISTS messages_key ON messages(username, chat_id, message_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text, content='messages', content_rowid='rowid',
+    tokenize='porter unicode61', prefix='3'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_TOKEN_RE = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query where every word must match.
+
+    A word ending in ``*`` is matched as a prefix. That is opt-in because a
+    prefix expands to every indexed term it starts and can't use the
+    per-user rowid range, which makes it far slower than a plain word.
+    """
+    terms = [f'"{word}"{star}' for word, star in _TOKEN_RE.findall(query.lower())]
+    if not terms:
+        return None
+    return " AND ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, path: Path = SEARCH_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def index_message(self, username: str, chat_id: str, message: dict):
+        self.index_messages(username, chat_id, [message])
+
+    def _user_range(self, conn: sqlite3.Connection, username: str, create: bool):
+        """(first, last) rowid reserved for ``username``, or None if unknown."""
+        row = conn.execute("SELECT user_id FROM users WHERE username = ?", (username,)).fetchone()
+        if row is None:
+            if not create:
+                return None
+            row = (conn.execute("INSERT INTO users (username) VALUES (?)", (username,)).lastrowid,)
+        first = row[0] << USER_ROWID_BITS
+        return first, first + (1 << USER_ROWID_BITS) - 1
+
+    def index_messages(self, username: str, chat_id: str, messages: List[dict]):
+        messages = [m for m in messages if m.get("text")]
+        if not messages:
+            return
+        conn = self._conn()
+        with conn:
+            # Take the write lock before reading MAX(rowid): under a deferred transaction two writers
+            # read the same value and hand out the same rowids
+            conn.execute("BEGIN IMMEDIATE")
+            first, last = self._user_range(conn, username, create=True)
+            next_rowid = conn.execute(
+                "SELECT IFNULL(MAX(rowid) + 1, ?) FROM messages WHERE rowid BETWEEN ? AND ?",
+                (first, first, last),
+            ).fetchone()[0]
+            rows = [
+                (next_rowid + i, username, chat_id, m.get("id") or f"{m.get('timestamp', '')}:{i}",
+                 m.get("sender"), m.get("timestamp"), m["text"])
+                for i, m in enumerate(messages)
+            ]
+            # A message indexed before (backfill re-run) is skipped; any other conflict raises
+            conn.executemany(
+                "INSERT INTO messages (rowid, username, chat_id, message_id, sender, timestamp, text)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (username, chat_id, message_id) DO NOTHING",
+                rows,
+            )
+
+    def remove_chat(self, username: str, chat_id: str) -> int:
+        conn = self._conn()
+        with conn:
+            cur = conn.execute("DELETE FROM messages WHERE username = ? AND chat_id = ?", (username, chat_id))
+        return cur.rowcount
+
+    def search(self, username: str, query: str, page: int = 1, page_size: int = 20) -> Dict:
+        """Best-ranked (BM25) matches first. Fetches one extra row to know if there are more."""
+        page = max(1, page)
+        page_size = max(1, min(SEARCH_MAX_PAGE_SIZE, page_size))
+        empty = {"results": [], "page": page, "page_size": page_size, "has_more": False}
+        match = build_match_query(query)
+        if match is None:
+            return empty
+        conn = self._conn()
+        user_range = self._user_range(conn, username, create=False)
+        if user_range is None:
+            return empty
+
+        # Rank this user's matches only, then build snippets for just the one page
+        hits = conn.execute(
+            """
+            SELECT rowid, bm25(messages_fts) AS score FROM messages_fts
+            WHERE messages_fts MATCH ? AND rowid BETWEEN ? AND ?
+            ORDER BY score LIMIT ? OFFSET ?
+            """,
+            (match, user_range[0], user_range[1], page_size + 1, (page - 1) * page_size),
+        ).fetchall()
+        if not hits:
+            return empty
+        page_ids = [rowid for rowid, _ in hits[:page_size]]
+        placeholders = ",".join("?" * len(page_ids))
+        details = {
+            r[0]: r[1:]
+            for r in conn.execute(
+                f"""
+                SELECT m.rowid, m.chat_id, m.message_id, m.sender, m.timestamp,
+                       snippet(messages_fts, 0, '<mark>', '</mark>', '…', 16)
+                FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND messages_fts.rowid IN ({placeholders})
+                """,
+                (match, *page_ids),
+            )
+        }
+        rows = [details[rowid] + (score,) for rowid, score in hits[:page_size] if rowid in details]
+
+        results = [
+            {"chat_id": r[0], "message_id": r[1], "sender": r[2], "timestamp": r[3],
+             "snippet": r[4], "score": -r[5]}
+            for r in rows
+        ]
+        return {"results": results, "page": page, "page_size": page_size, "has_more": len(hits) > page_size}
+
+    def is_backfilled(self) -> bool:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'backfilled'").fetchone()
+        return row is not None
+
+    def backfill(self, chat_dir: Path) -> int:
+        """Index every existing <chat_id>.json under chat_dir. Safe to re-run."""
+        count = 0
+        for user_dir in Path(chat_dir).iterdir() if Path(chat_dir).exists() else []:
+            if not user_dir.is_dir():
+                continue
+            for chat_file in user_dir.glob("*.json"):
+                if chat_file.name == "chat_list.json":
+                    continue
+                try:
+                    with open(chat_file, "r", encoding="utf-8") as f:
+                        messages = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.error("Search backfill skipped %s: %s", chat_file, e)
+                    continue
+                self.index_messages(user_dir.name, chat_file.stem, messages)
+                count += len(messages)
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', '1')")
+        return count
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SearchIndex()
+    return _index
+
+
+def index_message(username: str, chat_id: str, message: dict):
+    """Add one message; never lets an indexing problem fail the write that triggered it."""
+    try:
+        get_search_index().index_message(username, chat_id, message)
+    except sqlite3.Error as e:
+        logger.error("Search indexing failed for chat %s: %s", chat_id, e)
+
+
+def index_messages(username: str, chat_id: str, messages: List[dict]):
+    """Add several messages of one chat in one transaction; never raises on indexing problems."""
+    try:
+        get_search_index().index_messages(username, chat_id, messages)
+    except sqlite3.Error as e:
+        logger.error("Search indexing failed for chat %s: %s", chat_id, e)
+
+
+def remove_chat(username: str, chat_id: str):
+    try:
+        get_search_index().remove_chat(username, chat_id)
+    except sqlite3.Error as e:
+        logger.error("Search index cleanup failed for chat %s: %s", chat_id, e)
+
+
+def start_backfill(chat_dir: Path):
+    """Index existing chat files in the background if that hasn't happened yet."""
+    def run():
+        index = get_search_index()
+        if not index.is_backfilled():
+            logger.info("Indexed %d existing messages for search", index.backfill(chat_dir))
+
+    threading.Thread(target=run, name="search-backfill", daemon=True).start()
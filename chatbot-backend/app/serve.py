@@ -0,0 +1,53 @@
+# app/serve.py
+"""Run the backend, optionally with several uvicorn workers.
+
+    python -m app.serve --workers 8
+
+With more than one worker this switches to the shared-state deployment mode:
+sessions move to the SQLite backend, a single vector service process owns
+the FAISS index, and workers reach it over local IPC. Chat files are
+already protected by cross-process file locks (app/file_lock.py), and each
+worker takes its share of the generation limits (app/scheduler.py).
+"""
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the chatbot backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--vector-service", default="127.0.0.1:8765",
+                        help="host:port for the vector service in multi-worker mode")
+    args = parser.parse_args()
+
+    service = None
+    if args.workers > 1:
+        # Worker processes inherit these before they import the app
+        os.environ.setdefault("SESSION_BACKEND", "sqlite")
+        os.environ.setdefault("VECTOR_SERVICE_ADDRESS", args.vector_service)
+        os.environ.setdefault("VECTOR_SERVICE_AUTHKEY", secrets.token_hex(16))
+        os.environ.setdefault("GENERATION_WORKERS", str(args.workers))
+
+        from app import vector_service
+        service = subprocess.Popen([sys.executable, "-m", "app.vector_service"])
+        if not vector_service.wait_for_service(os.environ["VECTOR_SERVICE_ADDRESS"]):
+            service.terminate()
+            sys.exit("Vector service did not start")
+
+    try:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+
+if __name__ == "__main__":
+    main()
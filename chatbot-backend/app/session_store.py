@@ -1,20 +1,196 @@
 # app/session_store.py
+import logging
+import os
+import sqlite3
+import threading
+import time
 import uuid
-from typing import Dict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.config import DATA_DIR
+
+# Sessions expire after SESSION_TTL_SECONDS of inactivity (sliding expiration).
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", 8 * 60 * 60))
+SESSION_SWEEP_INTERVAL_SECONDS = int(os.environ.get("SESSION_SWEEP_INTERVAL_SECONDS", 300))
+# "memory" keeps sessions in this process only, "sqlite" shares them between workers.
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = Path(os.environ.get("SESSION_DB_PATH", DATA_DIR / "sessions.db"))
+logger = logging.getLogger(__name__)
+
+
+# Only push the expiry forward when this much of the TTL has been used up,
+# so validating a token is a read and not a write on every request.
+_REFRESH_AFTER_SECONDS = max(1, SESSION_TTL_SECONDS // 10)
+
+
+class MemorySessionBackend:
+    """Process-local sessions: token -> [username, expires_at]."""
+
+    def __init__(self):
+        self._sessions: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def create(self, token: str, username: str, expires_at: float):
+        with self._lock:
+            self._sessions[token] = [username, expires_at]
+
+    def get(self, token: str) -> Optional[Tuple[str, float]]:
+        entry = self._sessions.get(token)
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    def touch(self, token: str, expires_at: float):
+        entry = self._sessions.get(token)
+        if entry is not None:
+            entry[1] = expires_at
+
+    def delete(self, token: str):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def sweep(self, now: float) -> int:
+        with self._lock:
+            expired = [t for t, (_, exp) in self._sessions.items() if exp <= now]
+            for t in expired:
+                del self._sessions[t]
+        return len(expired)
+
+    def count(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteSessionBackend:
+    """Sessions in a WAL-mode SQLite file, visible to every worker on the host."""
+
+    def __init__(self, path: Path = SESSION_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " token TEXT PRIMARY KEY,"
+            " username TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions(expires_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, token: str, username: str, expires_at: float):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (token, username, expires_at) VALUES (?, ?, ?)",
+                (token, username, expires_at),
+            )
+
+    def get(self, token: str) -> Optional[Tuple[str, float]]:
+        row = self._conn().execute(
+            "SELECT username, expires_at FROM sessions WHERE token = ?", (token,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def touch(self, token: str, expires_at: float):
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE token = ?", (expires_at, token))
+
+    def delete(self, token: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def sweep(self, now: float) -> int:
+        conn = self._conn()
+        with conn:
+            cur = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+        return cur.rowcount
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def make_backend(name: str):
+    if name == "memory":
+        return MemorySessionBackend()
+    if name == "sqlite":
+        return SQLiteSessionBackend()
+    raise ValueError(f"Unknown session backend: {name}")
+
+
+_backend = make_backend(SESSION_BACKEND)
+_sweeper_stop = threading.Event()
+_sweeper_thread: Optional[threading.Thread] = None
+
+
+def set_backend(backend):
+    """Swap the active session backend (used by benchmarks and deployment modes)."""
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    return _backend
 
-# This dict will map token string -> username
-_active_sessions: Dict[str, str] = {}
 
 def create_session(username: str) -> str:
     """Create a new session token for a username."""
     token = str(uuid.uuid4())
-    _active_sessions[token] = username
+    _backend.create(token, username, time.time() + SESSION_TTL_SECONDS)
     return token
 
 def get_username(token: str) -> str | None:
-    """Return the username associated with a token, or None if invalid."""
-    return _active_sessions.get(token)
+    """Return the username associated with a token, or None if invalid or expired."""
+    entry = _backend.get(token)
+    if entry is None:
+        return None
+    username, expires_at = entry
+    now = time.time()
+    if expires_at <= now:
+        _backend.delete(token)
+        return None
+    # Sliding expiration, throttled so most checks don't write
+    new_expiry = now + SESSION_TTL_SECONDS
+    if new_expiry - expires_at >= _REFRESH_AFTER_SECONDS:
+        _backend.touch(token, new_expiry)
+    return username
 
 def delete_session(token: str):
     """Remove a session token when user logs out or session expires."""
-    _active_sessions.pop(token, None)
+    _backend.delete(token)
+
+def sweep_expired_sessions() -> int:
+    """Drop every expired session. Returns the number removed."""
+    return _backend.sweep(time.time())
+
+
+def _sweep_loop():
+    while not _sweeper_stop.wait(SESSION_SWEEP_INTERVAL_SECONDS):
+        try:
+            sweep_expired_sessions()
+        except Exception:
+            logger.exception("Session sweep failed")
+
+def start_session_sweeper():
+    """Start the background thread that periodically removes expired sessions."""
+    global _sweeper_thread
+    if _sweeper_thread is not None and _sweeper_thread.is_alive():
+        return
+    _sweeper_stop.clear()
+    _sweeper_thread = threading.Thread(target=_sweep_loop, name="session-sweeper", daemon=True)
+    _sweeper_thread.start()
+
+def stop_session_sweeper():
+    _sweeper_stop.set()
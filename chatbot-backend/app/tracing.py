@@ -0,0 +1,304 @@
+# app/tracing.py
+"""Span-based tracing of requests, compatible with OpenTelemetry.
+
+Every HTTP request gets a root span (continuing the caller's W3C
+``traceparent`` if it sent one) and the stages below it open child spans:
+
+    with span("vector.search", k=5):
+        ...
+
+    @traced("chat_store.save_message")
+    def save_message(...): ...
+
+The current span lives in a contextvar, so it follows the request into
+run_in_threadpool. Ids, span kinds, status codes and attribute encoding
+follow the OTLP data model. When the root span ends the whole trace is
+kept in a ring buffer of the last TRACE_BUFFER_SIZE traces (served as a
+waterfall by /debug/trace/{id}) and handed to a background exporter:
+
+    TRACE_EXPORT_FILE=traces.jsonl       one OTLP/JSON ExportTraceServiceRequest per line
+    TRACE_EXPORT_URL=http://host:4318    POSTed to <url>/v1/traces (OTLP/HTTP JSON)
+
+TRACING=0 turns every span into a no-op.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+TRACING = os.environ.get("TRACING", "1") == "1"
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", 200))
+# Spans of a trace whose local root hasn't ended within this long are dropped
+TRACE_OPEN_SECONDS = float(os.environ.get("TRACE_OPEN_SECONDS", 600))
+TRACE_EXPORT_FILE = os.environ.get("TRACE_EXPORT_FILE", "")
+TRACE_EXPORT_URL = os.environ.get("TRACE_EXPORT_URL", "").rstrip("/")
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "chatbot-backend")
+
+# OTLP enums
+SPAN_KIND_INTERNAL, SPAN_KIND_SERVER = 1, 2
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "status_message", "is_local_root")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int, is_local_root: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict = {}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.is_local_root = is_local_root
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message} if self.status else {},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent span id) from a W3C traceparent header, or None."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+class _TraceStore:
+    """Spans of traces still in progress, plus a ring buffer of finished ones.
+
+    A span that ends after its local root (threadpool work outliving a
+    cancelled request) joins the finished trace; it is exported only if
+    another request continues the trace. Traces in progress for longer than
+    ``open_seconds`` (their root never ended, or they finished long enough
+    ago to have left the ring buffer) are dropped.
+    """
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, open_seconds: float = TRACE_OPEN_SECONDS):
+        self.size = size
+        self.open_seconds = open_seconds
+        # trace id -> (monotonic time its first span ended, spans), oldest first
+        self._open: "OrderedDict[str, Tuple[float, List[Span]]]" = OrderedDict()
+        self._done: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> Optional[List[Span]]:
+        """Record a finished span; returns the whole trace when its local root ends."""
+        now = time.monotonic()
+        with self._lock:
+            while self._open and now - next(iter(self._open.values()))[0] > self.open_seconds:
+                self._open.popitem(last=False)
+            if not span.is_local_root and span.trace_id not in self._open and span.trace_id in self._done:
+                self._done[span.trace_id].append(span)
+                return None
+            spans = self._open.setdefault(span.trace_id, (now, []))[1]
+            spans.append(span)
+            if not span.is_local_root:
+                return None
+            del self._open[span.trace_id]
+            # A trace id that came in from a caller may span several of our requests
+            spans = self._done.pop(span.trace_id, []) + spans
+            self._done[span.trace_id] = spans
+            while len(self._done) > self.size:
+                self._done.popitem(last=False)
+            return list(spans)
+
+    def get(self, trace_id: str) -> Optional[List[Span]]:
+        with self._lock:
+            spans = self._done.get(trace_id) or self._open.get(trace_id, (0, None))[1]
+            return list(spans) if spans else None
+
+
+class _Exporter:
+    """Writes finished traces to a file and/or an OTLP/HTTP collector off the request path."""
+
+    def __init__(self, path: str = TRACE_EXPORT_FILE, url: str = TRACE_EXPORT_URL):
+        self.path = path
+        self.url = url
+        self._queue: "queue.Queue[List[Span]]" = queue.Queue(maxsize=1000)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.url)
+
+    def submit(self, spans: List[Span]):
+        if not self.enabled:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            logger.warning("Trace export queue full, dropping trace %s", spans[0].trace_id)
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Pick up whatever else finished meanwhile, up to a second's worth
+            deadline = time.monotonic() + 1.0
+            while len(batch) < 64 and time.monotonic() < deadline:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self.export([s for spans in batch for s in spans])
+
+    def export(self, spans: List[Span]):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(body) + "\n")
+            except OSError as e:
+                logger.warning("Trace export to %s failed: %s", self.path, e)
+        if self.url:
+            try:
+                requests.post(self.url + "/v1/traces", json=body, timeout=5).raise_for_status()
+            except requests.RequestException as e:
+                logger.warning("Trace export to %s failed: %s", self.url, e)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+traces = _TraceStore()
+exporter = _Exporter()
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def set_attribute(key: str, value):
+    """Attach an attribute to the current span, if any."""
+    span = _current.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """Time the block as a child of the current span, or as a new trace's root."""
+    if not TRACING:
+        yield None
+        return
+    parent = _current.get()
+    if parent is not None:
+        s = Span(name, parent.trace_id, parent.span_id, kind, is_local_root=False)
+    else:
+        remote = parse_traceparent(traceparent)
+        trace_id, parent_id = remote or ("%032x" % random.getrandbits(128), None)
+        s = Span(name, trace_id, parent_id, kind, is_local_root=True)
+    s.attributes.update(attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current.reset(token)
+        s.end_ns = time.time_ns()
+        finished = traces.add(s)
+        if finished is not None:
+            exporter.submit(finished)
+
+
+def traced(name: str):
+    """Decorator form of span() for functions that are always a stage of their own."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def waterfall(spans: List[Span]) -> List[Dict]:
+    """Spans in tree order with their depth and offsets from the trace start, in ms."""
+    start = min(s.start_ns for s in spans)
+    children: Dict[Optional[str], List[Span]] = {}
+    ids = {s.span_id for s in spans}
+    for s in sorted(spans, key=lambda s: s.start_ns):
+        # Parents outside this process (or not finished) are shown at the top level
+        children.setdefault(s.parent_id if s.parent_id in ids else None, []).append(s)
+
+    rows = []
+
+    def walk(parent_id, depth):
+        for s in children.get(parent_id, []):
+            rows.append({
+                "name": s.name, "span_id": s.span_id, "parent_id": s.parent_id, "depth": depth,
+                "offset_ms": round((s.start_ns - start) / 1e6, 3),
+                "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 3) if s.end_ns else None,
+                "status": {STATUS_ERROR: "error", STATUS_OK: "ok"}.get(s.status, "unset"),
+                "status_message": s.status_message,
+                "attributes": s.attributes,
+            })
+            walk(s.span_id, depth + 1)
+
+    walk(None, 0)
+    return rows
@@ -0,0 +1,129 @@
+# app/uploads.py
+"""Uploaded files and their cleanup.
+
+Every attachment is stored once in uploads/ under a random name and
+referenced from messages' ``file.stored_as``. Uploads registered in a
+user's document library (app.library) live as long as the document does.
+Deleting a chat removes its other uploads straight away; a periodic sweep
+also removes blobs neither a chat nor a library references any more (sends that failed after the upload was written,
+files left behind by older versions). Files younger than
+UPLOAD_GC_GRACE_SECONDS are never swept, because an upload is written to
+disk before the message that references it is saved.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+from app.file_io import run_io
+
+UPLOADS_DIR = Path(__file__).parent.parent / "uploads"
+UPLOAD_GC_INTERVAL_SECONDS = int(os.environ.get("UPLOAD_GC_INTERVAL_SECONDS", 60 * 60))
+UPLOAD_GC_GRACE_SECONDS = int(os.environ.get("UPLOAD_GC_GRACE_SECONDS", 60 * 60))
+
+_gc_stop = threading.Event()
+_gc_thread: Optional[threading.Thread] = None
+
+logger = logging.getLogger(__name__)
+
+
+def save_upload(data: bytes, filename: str) -> str:
+    """Store an uploaded file under a new random name (keeping its extension); returns the name."""
+    stored_as = f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}"
+    with open(UPLOADS_DIR / stored_as, "wb") as f:
+        f.write(data)
+    return stored_as
+
+
+async def save_upload_async(data: bytes, filename: str) -> str:
+    return await run_io(save_upload, data, filename)
+
+
+def referenced_uploads(messages: Iterable[dict]) -> Set[str]:
+    """Upload names (``stored_as``) referenced by these messages."""
+    names = set()
+    for m in messages:
+        meta = m.get("file")
+        if isinstance(meta, dict) and meta.get("stored_as"):
+            names.add(os.path.basename(meta["stored_as"]))
+    return names
+
+
+def delete_uploads(names: Iterable[str]) -> int:
+    """Remove these uploads; returns the number of bytes freed."""
+    freed = 0
+    for name in names:
+        path = UPLOADS_DIR / os.path.basename(name)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+            freed += size
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error("Could not delete upload %s: %s", name, e)
+    return freed
+
+
+def collect_garbage(chat_dir: Path, grace_seconds: int = UPLOAD_GC_GRACE_SECONDS) -> Dict:
+    """Delete uploads that no chat under ``chat_dir`` references."""
+    if not UPLOADS_DIR.exists():
+        return {"removed": 0, "bytes": 0}
+    cutoff = time.time() - grace_seconds
+    # List candidates before scanning chats: anything uploaded after this
+    # point is younger than the cutoff and left alone
+    candidates = []
+    for entry in os.scandir(UPLOADS_DIR):
+        if entry.is_file() and not entry.name.startswith(".") and entry.stat().st_mtime < cutoff:
+            candidates.append(entry.name)
+    if not candidates:
+        return {"removed": 0, "bytes": 0}
+
+    # app.library imports this module
+    from app.library import library_uploads
+    try:
+        referenced = library_uploads()
+    except (OSError, ValueError) as e:
+        logger.error("Upload GC skipped, unreadable document library: %s", e)
+        return {"removed": 0, "bytes": 0}
+    for chat_file in Path(chat_dir).glob("*/*.json"):
+        if chat_file.name == "chat_list.json":
+            continue
+        try:
+            with open(chat_file, "r", encoding="utf-8") as f:
+                referenced |= referenced_uploads(json.load(f))
+        except (OSError, ValueError) as e:
+            # Can't tell what this chat references; keep everything this round
+            logger.error("Upload GC skipped, unreadable chat %s: %s", chat_file, e)
+            return {"removed": 0, "bytes": 0}
+
+    orphans = [name for name in candidates if name not in referenced]
+    return {"removed": len(orphans), "bytes": delete_uploads(orphans)}
+
+
+def _gc_loop(chat_dir: Path):
+    while not _gc_stop.wait(UPLOAD_GC_INTERVAL_SECONDS):
+        try:
+            result = collect_garbage(chat_dir)
+            if result["removed"]:
+                logger.info("Removed %d unreferenced uploads (%d bytes)", result["removed"], result["bytes"])
+        except Exception:
+            logger.exception("Upload GC failed")
+
+
+def start_upload_gc(chat_dir: Path):
+    """Start the background thread that periodically removes unreferenced uploads."""
+    global _gc_thread
+    if _gc_thread is not None and _gc_thread.is_alive():
+        return
+    _gc_stop.clear()
+    _gc_thread = threading.Thread(target=_gc_loop, args=(chat_dir,), name="upload-gc", daemon=True)
+    _gc_thread.start()
+
+
+def stop_upload_gc():
+    _gc_stop.set()
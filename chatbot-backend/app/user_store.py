@@ -0,0 +1,231 @@
+# app/user_store.py
+"""Indexed view of data/users.csv with salted password hashes.
+
+The CSV is parsed once into a dict keyed by username. Lookups stat the file
+at most every USER_STORE_CHECK_INTERVAL_SECONDS and reload it when it has
+changed: appended rows are parsed from the previous end of file, any other
+edit triggers a full re-read that is applied as a diff.
+
+Run ``python -m app.user_store migrate`` to replace plaintext ``password``
+columns with ``password_hash`` values.
+"""
+import asyncio
+import base64
+import csv
+import hashlib
+import hmac
+import io
+import os
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.config import DATA_DIR
+
+USERS_CSV_PATH = DATA_DIR / "users.csv"
+USER_STORE_CHECK_INTERVAL_SECONDS = float(os.environ.get("USER_STORE_CHECK_INTERVAL_SECONDS", 2))
+PASSWORD_HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", 260_000))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 4))
+
+HASH_ALGORITHM = "pbkdf2_sha256"
+FIELDNAMES = ["username", "password_hash", "profile_pic"]
+
+_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+
+
+def hash_password(password: str, iterations: int = PASSWORD_HASH_ITERATIONS) -> str:
+    """Return an encoded ``pbkdf2_sha256$iterations$salt$hash`` string."""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join([
+        HASH_ALGORITHM,
+        str(iterations),
+        base64.b64encode(salt).decode(),
+        base64.b64encode(digest).decode(),
+    ])
+
+
+def verify_password(password: str, encoded: str) -> bool:
+    """False for a wrong password and for a malformed ``encoded`` value alike."""
+    try:
+        algorithm, iterations, salt, expected = encoded.split("$", 3)
+        if algorithm != HASH_ALGORITHM:
+            return False
+        rounds = int(iterations)
+        salt_bytes = base64.b64decode(salt, validate=True)
+        expected_bytes = base64.b64decode(expected, validate=True)
+    except ValueError:
+        # binascii.Error is a ValueError too
+        return False
+    if rounds < 1:
+        return False
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt_bytes, rounds)
+    return hmac.compare_digest(digest, expected_bytes)
+
+
+# Verified against when the username is unknown so that a miss costs as much as a hit
+_DUMMY_HASH = hash_password(secrets.token_hex(8))
+
+
+class UserStore:
+    def __init__(self, path: Path = USERS_CSV_PATH):
+        self.path = Path(path)
+        self._users: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._header: Optional[list] = None
+        self._stat = None
+        self._offset = 0
+        self._tail = b""
+        self._next_check = 0.0
+        self.full_reloads = 0
+        self.incremental_reloads = 0
+        self.reload(force=True)
+
+    def __len__(self):
+        return len(self._users)
+
+    def get(self, username: str) -> Optional[dict]:
+        self._maybe_reload()
+        return self._users.get(username)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + USER_STORE_CHECK_INTERVAL_SECONDS
+        self.reload()
+
+    def reload(self, force: bool = False):
+        """Re-read the CSV if it changed on disk since the last load."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._users = {}
+                self._stat = None
+                return
+            signature = (st.st_mtime_ns, st.st_size)
+            if not force and self._stat == signature:
+                return
+
+            with open(self.path, "rb") as f:
+                if not force and self._is_append(f, st.st_size):
+                    f.seek(self._offset)
+                    data = f.read()
+                    self._apply_rows(self._parse(data, self._header), replace=False)
+                    self.incremental_reloads += 1
+                else:
+                    # _is_append may have moved the position
+                    f.seek(0)
+                    data = f.read()
+                    text = data.decode("utf-8-sig")
+                    header = next(csv.reader(io.StringIO(text)), None)
+                    self._header = header
+                    body = text.split("\n", 1)[1] if "\n" in text else ""
+                    self._apply_rows(self._parse(body.encode("utf-8"), header), replace=True)
+                    self.full_reloads += 1
+
+            self._stat = signature
+            self._offset = st.st_size
+            self._tail = data[-64:] if len(data) >= 64 else self._read_tail(st.st_size)
+
+    def _read_tail(self, size: int) -> bytes:
+        with open(self.path, "rb") as f:
+            f.seek(max(0, size - 64))
+            return f.read()
+
+    def _is_append(self, f, size: int) -> bool:
+        """True if the file only grew past the previous end and kept its old tail."""
+        if self._header is None or size <= self._offset or not self._tail:
+            return False
+        f.seek(self._offset - len(self._tail))
+        return f.read(len(self._tail)) == self._tail and self._tail.endswith(b"\n")
+
+    @staticmethod
+    def _parse(data: bytes, header) -> Dict[str, dict]:
+        rows = {}
+        if not header:
+            return rows
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8")), fieldnames=header)
+        for row in reader:
+            username = row.get("username")
+            if username:
+                rows[username] = row
+        return rows
+
+    def _apply_rows(self, rows: Dict[str, dict], replace: bool):
+        if not replace:
+            self._users.update(rows)
+            return
+        # Diff against the current index so unchanged users keep their entries
+        for username in self._users.keys() - rows.keys():
+            del self._users[username]
+        for username, row in rows.items():
+            if self._users.get(username) != row:
+                self._users[username] = row
+
+
+_store: Optional[UserStore] = None
+_store_lock = threading.Lock()
+
+
+def get_user_store() -> UserStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = UserStore()
+    return _store
+
+
+def check_credentials(username: str, password: str, store: Optional[UserStore] = None) -> Optional[str]:
+    """Return the user's profile_pic if the password matches, else None. CPU bound."""
+    user = (store or get_user_store()).get(username)
+    if user is None:
+        verify_password(password, _DUMMY_HASH)
+        return None
+    if user.get("password_hash"):
+        ok = verify_password(password, user["password_hash"])
+    else:
+        # Rows not migrated yet still carry a plaintext password
+        ok = hmac.compare_digest((user.get("password") or "").encode(), password.encode())
+    return user.get("profile_pic") if ok else None
+
+
+async def check_credentials_async(username: str, password: str) -> Optional[str]:
+    """check_credentials on the password hashing pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_pool, check_credentials, username, password)
+
+
+def migrate_plaintext_passwords(path: Path = USERS_CSV_PATH) -> int:
+    """Rewrite the CSV with hashed passwords. Returns the number of rows converted."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    converted = 0
+    for row in rows:
+        if not row.get("password_hash"):
+            row["password_hash"] = hash_password(row.get("password") or "")
+            converted += 1
+
+    tmp_path = Path(str(path) + ".tmp")
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return converted
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        print(f"Hashed {migrate_plaintext_passwords()} password(s) in {USERS_CSV_PATH}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "hash":
+        print(hash_password(sys.argv[2]))
+    else:
+        print("usage: python -m app.user_store migrate | hash <password>")
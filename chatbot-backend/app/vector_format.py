@@ -0,0 +1,578 @@
+# app/vector_format.py
+"""Versioned on-disk format for the vector store.
+
+One directory (VECTOR_STORE_PATH, default data/vector_store) holds:
+
+    MANIFEST.json           format name/version, dim, count and the files below
+    index-<gen>.faiss       the FAISS index without its vectors: an empty
+                            flat index, or the trained int8/pq/fp16 codec
+    floats-<gen>.f32        every vector, raw float32 rows in index order,
+                            memory-mapped; the index is filled from it at
+                            load and quantized stores re-rank from it (see
+                            VECTOR_QUANTIZATION)
+    metadata-<gen>.jsonl    one JSON metadata entry per vector, in index order
+    tombstones-<gen>.json   positions of deleted vectors not compacted yet
+
+floats and metadata are append-only: adding vectors appends their rows and
+lines, fsyncs them and records the new length in the manifest, so an add
+costs O(added) whatever the size of the store. Everything else (a rebuild,
+compaction, a change of VECTOR_QUANTIZATION) writes the files under a new
+generation number. Compaction first writes them under staging names
+(.index-staged.faiss etc., left alone by other commits), appends the rows
+added meanwhile and renames them into the new generation just before the
+commit (stage_store, commit_staged). Either way the change only takes
+effect when MANIFEST.json is atomically replaced; files the new manifest no longer
+references are removed afterwards. A crash at any point leaves the previous
+manifest intact, and bytes appended past the lengths it records are cut
+off at the next load.
+
+The manifest records each file's size and SHA-256 (per HASH_BLOCK_BYTES
+block for the append-only files, so an append only re-hashes the last,
+partial block). check_integrity() runs at startup and only compares sizes
+against the manifest (O(manifest), no data is read); ``python -m
+app.vector_format verify --full`` also checks the hashes.
+
+Chunk text stays on disk: load_store() returns the metadata entries without
+their ``content`` and ``description``, and a MetadataFile that reads whole
+entries back from the memory-mapped metadata file when search() needs them.
+
+Stores in format version 1 (a serialized index holding the vectors and one
+metadata JSON array, both rewritten on every add) are converted on load.
+
+Older versions left stores in several places (vector_store/ relative to
+wherever uvicorn was started, app/vector_store/). import_legacy() merges
+every 768-dim FAISS index + metadata.json pair it finds into one store and
+runs automatically when no manifest exists yet:
+
+    python -m app.vector_format import [extra legacy dirs...]
+    python -m app.vector_format info
+"""
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+import hashlib
+import json
+import logging
+import mmap
+import sys
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import faiss
+import numpy as np
+
+from app.config import BASE_DIR, DATA_DIR
+
+VECTOR_STORE_PATH = Path(os.environ.get("VECTOR_STORE_PATH", DATA_DIR / "vector_store")).resolve()
+FORMAT_NAME = "chatbot-vector-store"
+FORMAT_VERSION = 2
+# Versions read_manifest() accepts; load_store() converts older ones
+READABLE_VERSIONS = (1, 2)
+MANIFEST_NAME = "MANIFEST.json"
+# Checksum granularity of the append-only files
+HASH_BLOCK_BYTES = 4 << 20
+# Rows copied into the index at a time when it is filled at load
+FILL_ROWS = 65536
+# Metadata keys kept out of memory (the chunk's text)
+TEXT_KEYS = ("content", "description")
+FILE_PREFIXES = ("index", "vectors", "floats", "metadata", "tombstones")
+# Where earlier versions wrote their stores
+LEGACY_DIRS = [BASE_DIR / "vector_store", BASE_DIR / "app" / "vector_store", Path("vector_store")]
+LEGACY_INDEX_NAMES = ["index.bin", "vectors.index"]
+
+logger = logging.getLogger(__name__)
+
+Entry = Union[Dict, bytes]
+
+
+class VectorStoreCorrupt(Exception):
+    """The on-disk store doesn't match its manifest."""
+
+
+def read_manifest(path: Path = VECTOR_STORE_PATH) -> Optional[Dict]:
+    manifest_path = Path(path) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_NAME:
+        raise VectorStoreCorrupt(f"{manifest_path} is not a {FORMAT_NAME} manifest")
+    if manifest.get("version") not in READABLE_VERSIONS:
+        raise VectorStoreCorrupt(
+            f"{manifest_path} has format version {manifest.get('version')}, this build reads {FORMAT_VERSION}"
+        )
+    return manifest
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class _BlockHasher:
+    """SHA-256 of every HASH_BLOCK_BYTES block of a byte stream."""
+
+    def __init__(self, digests: Sequence[str] = (), size: int = 0):
+        # ``digests`` of the ``size`` bytes before, which must be whole blocks
+        self.size = size
+        self._done = list(digests)
+        self._block = hashlib.sha256()
+        self._fill = 0
+
+    def update(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            n = min(len(view), HASH_BLOCK_BYTES - self._fill)
+            self._block.update(view[:n])
+            self._fill += n
+            self.size += n
+            view = view[n:]
+            if self._fill == HASH_BLOCK_BYTES:
+                self._done.append(self._block.hexdigest())
+                self._block, self._fill = hashlib.sha256(), 0
+
+    def digests(self) -> List[str]:
+        return self._done + ([self._block.hexdigest()] if self._fill else [])
+
+
+def _block_digests(path: Path, size: int) -> List[str]:
+    hasher = _BlockHasher()
+    with open(path, "rb") as f:
+        while hasher.size < size:
+            data = f.read(min(1 << 20, size - hasher.size))
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.digests()
+
+
+def check_integrity(path: Path = VECTOR_STORE_PATH, full: bool = False) -> Dict:
+    """Compare every file against the manifest; raises VectorStoreCorrupt.
+
+    Only stats the files unless ``full``, so it costs O(manifest). An
+    append-only file may be longer than recorded (an append that crashed
+    before its manifest was written); only the recorded length counts.
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise VectorStoreCorrupt(f"no {MANIFEST_NAME} in {path}")
+    for part, entry in manifest["files"].items():
+        file_path = Path(path) / entry["name"]
+        try:
+            size = file_path.stat().st_size
+        except FileNotFoundError:
+            raise VectorStoreCorrupt(f"{part} file {file_path} is missing")
+        appended = "blocks" in entry
+        if size < entry["bytes"] or (size != entry["bytes"] and not appended):
+            raise VectorStoreCorrupt(f"{part} file {file_path} is {size} bytes, manifest says {entry['bytes']}")
+        if full:
+            ok = (_block_digests(file_path, entry["bytes"]) == entry["blocks"] if appended
+                  else _sha256(file_path) == entry["sha256"])
+            if not ok:
+                raise VectorStoreCorrupt(f"{part} file {file_path} does not match its checksum")
+    return manifest
+
+
+def _write_file(path: Path, data: bytes) -> Dict:
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return {"name": path.name, "bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def _write_blocks(path: Path, chunks: Iterable[bytes]) -> Dict:
+    """Write an append-only file from scratch."""
+    hasher = _BlockHasher()
+    with open(path, "wb") as f:
+        for data in chunks:
+            f.write(data)
+            hasher.update(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return {"name": path.name, "bytes": hasher.size, "blocks": hasher.digests()}
+
+
+def _append_blocks(path: Path, entry: Dict, chunks: Iterable[bytes]) -> Dict:
+    """Append to a file after the ``entry["bytes"]`` the manifest records; only the last block is re-hashed."""
+    committed = entry["bytes"]
+    whole = committed // HASH_BLOCK_BYTES
+    hasher = _BlockHasher(entry["blocks"][:whole], whole * HASH_BLOCK_BYTES)
+    with open(path, "r+b") as f:
+        if os.fstat(f.fileno()).st_size != committed:
+            # Left over from an append whose manifest was never written
+            f.truncate(committed)
+        f.seek(hasher.size)
+        hasher.update(f.read(committed - hasher.size))
+        for data in chunks:
+            f.write(data)
+            hasher.update(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return {"name": entry["name"], "bytes": hasher.size, "blocks": hasher.digests()}
+
+
+def _float_chunks(blocks: Sequence[np.ndarray]) -> Iterable[bytes]:
+    """float32 rows a slice at a time, so memory-mapped input is never loaded whole."""
+    for block in blocks:
+        for i in range(0, len(block), FILL_ROWS):
+            yield np.ascontiguousarray(block[i:i + FILL_ROWS], dtype=np.float32).tobytes()
+
+
+def without_text(m: Dict) -> Dict:
+    """The metadata entry as held in memory: without its chunk text."""
+    return {key: value for key, value in m.items() if key not in TEXT_KEYS}
+
+
+def entry_line(m: Dict) -> bytes:
+    """The metadata file line of an entry (deletion is recorded in the tombstones file, not here)."""
+    return json.dumps({key: value for key, value in m.items() if key != "deleted"}).encode("utf-8") + b"\n"
+
+
+def _empty_like(index):
+    """``index`` without its vectors: what the index file holds."""
+    if isinstance(index, faiss.IndexFlat):
+        return faiss.IndexFlat(index.d, index.metric_type)
+    empty = faiss.clone_index(index)
+    empty.reset()
+    return empty
+
+
+class MetadataFile:
+    """Metadata entries of a store read back from its memory-mapped metadata file."""
+
+    def __init__(self, path: Path, line_lengths: Iterable[int] = ()):
+        self.path = Path(path)
+        self._offsets = array("q", [0])
+        self._map = None
+        self.extend_lengths(line_lengths)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def extend(self, lines: Sequence[bytes]):
+        """Take in ``lines`` just appended to the file."""
+        self.extend_lengths(len(line) for line in lines)
+
+    def extend_lengths(self, line_lengths: Iterable[int]):
+        end = self._offsets[-1]
+        for length in line_lengths:
+            end += length
+            self._offsets.append(end)
+        if end:
+            # A new, larger map; searches holding the old one can keep reading it
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ)
+
+    def line(self, pos: int) -> bytes:
+        return self._map[self._offsets[pos]:self._offsets[pos + 1]]
+
+    def entry(self, pos: int) -> Dict:
+        return json.loads(self.line(pos))
+
+
+def _commit(path: Path, generation: int, files: Dict, dim: int, count: int, quantization: str,
+            metric: str) -> Dict:
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "generation": generation,
+        "dim": dim,
+        "count": count,
+        "quantization": quantization,
+        "metric": metric,
+        "updated_at": datetime.now().isoformat(),
+        "files": files,
+    }
+    tmp = path / f".{MANIFEST_NAME}.{os.getpid()}.tmp"
+    _write_file(tmp, json.dumps(manifest, indent=2).encode("utf-8"))
+    os.replace(tmp, path / MANIFEST_NAME)
+
+    # Only now are the old generation's files unreferenced
+    keep = {entry["name"] for entry in files.values()} | {MANIFEST_NAME}
+    for old in path.glob("*-*.*"):
+        if old.name not in keep and old.name.split("-", 1)[0] in FILE_PREFIXES:
+            try:
+                old.unlink(missing_ok=True)
+            except OSError:
+                pass  # still memory-mapped (Windows); a later save removes it
+    return manifest
+
+
+def save_store(path: Path, index, metadata: Iterable[Entry], floats: Optional[Sequence[np.ndarray]] = None,
+               deleted: Optional[Iterable[int]] = None, quantization: str = "flat", metric: str = "l2") -> Dict:
+    """Write every file under a new generation and switch the manifest to it.
+
+    ``floats`` are the vectors as float32 arrays written after one another;
+    None takes them from ``index``, which must then be flat. ``metadata``
+    entries are dicts or metadata file lines (entry_line, MetadataFile.line).
+    ``deleted`` positions default to the dict entries flagged ``deleted``.
+    """
+    staged = stage_store(path, index, metadata, floats)
+    return commit_staged(path, staged, deleted=deleted, quantization=quantization, metric=metric)
+
+
+def stage_store(path: Path, index, metadata: Iterable[Entry],
+                floats: Optional[Sequence[np.ndarray]] = None) -> Dict:
+    """Write the index, floats and metadata files of a new store under staging names; the manifest is
+    untouched until commit_staged(). Arguments as for save_store().
+
+    Staged files of an earlier, interrupted compaction are overwritten.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    if floats is None:
+        floats = [index.reconstruct_n(0, index.ntotal)] if index.ntotal else []
+
+    flagged = []
+
+    def lines():
+        for pos, m in enumerate(metadata):
+            if isinstance(m, bytes):
+                yield m
+            else:
+                if m.get("deleted"):
+                    flagged.append(pos)
+                yield entry_line(m)
+
+    files = {
+        "index": _write_file(path / ".index-staged.faiss", faiss.serialize_index(_empty_like(index)).tobytes()),
+        "floats": _write_blocks(path / ".floats-staged.f32", _float_chunks(floats)),
+        "metadata": _write_blocks(path / ".metadata-staged.jsonl", lines()),
+    }
+    return {"files": files, "dim": index.d, "deleted": flagged}
+
+
+def commit_staged(path: Path, staged: Dict, vectors: Optional[np.ndarray] = None, metadata: Sequence[Entry] = (),
+                  deleted: Optional[Iterable[int]] = None, index=None, quantization: str = "flat",
+                  metric: str = "l2") -> Dict:
+    """Make a staged store the store: append ``vectors`` and their ``metadata`` entries (added since
+    staging), move the files into a new generation and switch the manifest to it.
+
+    ``index`` replaces the staged index file, for one retrained meanwhile.
+    ``deleted`` positions default to the entries flagged when staging.
+    """
+    path = Path(path)
+    previous = read_manifest(path)
+    generation = previous["generation"] + 1 if previous else 1
+    files = dict(staged["files"])
+    if vectors is not None and len(vectors):
+        files["floats"] = _append_blocks(path / files["floats"]["name"], files["floats"], _float_chunks([vectors]))
+        files["metadata"] = _append_blocks(path / files["metadata"]["name"], files["metadata"],
+                                           (m if isinstance(m, bytes) else entry_line(m) for m in metadata))
+    if index is not None:
+        files["index"] = _write_file(path / files["index"]["name"],
+                                     faiss.serialize_index(_empty_like(index)).tobytes())
+    for part, suffix in (("index", "faiss"), ("floats", "f32"), ("metadata", "jsonl")):
+        name = f"{part}-{generation}.{suffix}"
+        os.replace(path / files[part]["name"], path / name)
+        files[part] = dict(files[part], name=name)
+    files["tombstones"] = _write_file(
+        path / f"tombstones-{generation}.json",
+        json.dumps(sorted(int(p) for p in (staged["deleted"] if deleted is None else deleted))).encode("utf-8"),
+    )
+    return _commit(path, generation, files, staged["dim"], files["floats"]["bytes"] // (4 * staged["dim"]),
+                   quantization, metric)
+
+
+def append_store(path: Path, vectors: np.ndarray, metadata: Sequence[Entry], index=None) -> Dict:
+    """Append vectors and their metadata entries; O(len(vectors)).
+
+    ``index`` rewrites the index file too, for an index that was just
+    (re)trained; an index that only grew doesn't change it.
+    """
+    path = Path(path)
+    previous = read_manifest(path)
+    generation = previous["generation"] + 1
+    files = dict(previous["files"])
+    files["floats"] = _append_blocks(path / files["floats"]["name"], files["floats"], _float_chunks([vectors]))
+    files["metadata"] = _append_blocks(path / files["metadata"]["name"], files["metadata"],
+                                       (m if isinstance(m, bytes) else entry_line(m) for m in metadata))
+    if index is not None:
+        files["index"] = _write_file(path / f"index-{generation}.faiss",
+                                     faiss.serialize_index(_empty_like(index)).tobytes())
+    return _commit(path, generation, files, previous["dim"], previous["count"] + len(vectors),
+                   previous["quantization"], previous["metric"])
+
+
+def save_tombstones(path: Path, deleted: Iterable[int]) -> Dict:
+    """Record the positions of deleted vectors; nothing else is rewritten."""
+    path = Path(path)
+    previous = read_manifest(path)
+    generation = previous["generation"] + 1
+    files = dict(previous["files"])
+    files["tombstones"] = _write_file(path / f"tombstones-{generation}.json",
+                                      json.dumps(sorted(int(p) for p in deleted)).encode("utf-8"))
+    return _commit(path, generation, files, previous["dim"], previous["count"], previous["quantization"],
+                   previous["metric"])
+
+
+def _upgrade_v1(path: Path, manifest: Dict):
+    """Rewrite a format version 1 store (index with its vectors, metadata JSON array) in the current format."""
+    files = manifest["files"]
+    index = faiss.read_index(str(path / files["vectors"]["name"]))
+    with open(path / files["metadata"]["name"], "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    if "floats" in files:
+        floats = [np.memmap(path / files["floats"]["name"], dtype=np.float32, mode="r",
+                            shape=(manifest["count"], manifest["dim"]))] if manifest["count"] else []
+    else:
+        floats = None  # flat: the index holds them
+    save_store(path, index, metadata, floats=floats, quantization=manifest.get("quantization", "flat"),
+               metric=manifest.get("metric", "l2"))
+    logger.info("Converted vector store in %s to format version %d", path, FORMAT_VERSION,
+                extra={"vectors": manifest["count"]})
+
+
+def _truncate(path: Path, size: int):
+    if path.stat().st_size != size:
+        with open(path, "r+b") as f:
+            f.truncate(size)
+
+
+def load_store(path: Path = VECTOR_STORE_PATH) -> Tuple[object, List[Dict], MetadataFile]:
+    """Check the manifest, then read the store it points to.
+
+    Returns the index filled with the stored vectors, the metadata entries
+    without their text (deleted ones flagged ``deleted``) and the
+    MetadataFile to read whole entries from.
+    """
+    path = Path(path)
+    manifest = check_integrity(path)
+    if manifest["version"] == 1:
+        _upgrade_v1(path, manifest)
+        manifest = check_integrity(path)
+    files = manifest["files"]
+    for part in ("floats", "metadata"):
+        _truncate(path / files[part]["name"], files[part]["bytes"])
+
+    index = faiss.read_index(str(path / files["index"]["name"]))
+    floats = load_floats(path)
+    for i in range(0, len(floats), FILL_ROWS):
+        index.add(np.ascontiguousarray(floats[i:i + FILL_ROWS]))
+
+    metadata, lengths = [], []
+    with open(path / files["metadata"]["name"], "rb") as f:
+        for line in f:
+            metadata.append(without_text(json.loads(line)))
+            lengths.append(len(line))
+    with open(path / files["tombstones"]["name"], "r", encoding="utf-8") as f:
+        for pos in json.load(f):
+            metadata[pos]["deleted"] = True
+    if index.ntotal != manifest["count"] or len(metadata) != index.ntotal:
+        raise VectorStoreCorrupt(
+            f"{path}: manifest count {manifest['count']}, index {index.ntotal}, metadata {len(metadata)}"
+        )
+    return index, metadata, MetadataFile(path / files["metadata"]["name"], lengths)
+
+
+def load_floats(path: Path = VECTOR_STORE_PATH) -> np.ndarray:
+    """Memory-map the stored vectors (the rows the manifest counts)."""
+    manifest = read_manifest(path)
+    shape = (manifest["count"], manifest["dim"])
+    if manifest["count"] == 0:
+        return np.empty(shape, dtype=np.float32)
+    return np.memmap(Path(path) / manifest["files"]["floats"]["name"], dtype=np.float32, mode="r", shape=shape)
+
+
+# --- legacy import ----------------------------------------------------------------
+
+
+def find_legacy_stores(extra_dirs: Optional[List[Path]] = None) -> List[Tuple[Path, Path]]:
+    """(index file, metadata.json) pairs left by earlier versions, deduplicated."""
+    found, seen = [], set()
+    for directory in list(LEGACY_DIRS) + [Path(d) for d in extra_dirs or []]:
+        meta_path = directory / "metadata.json"
+        for name in LEGACY_INDEX_NAMES:
+            index_path = directory / name
+            if index_path.exists() and meta_path.exists() and index_path.resolve() not in seen:
+                seen.add(index_path.resolve())
+                found.append((index_path, meta_path))
+    return found
+
+
+def _entry_key(m: Dict):
+    return (m.get("chat_id"), m.get("type"), m.get("page"), m.get("chunk"), m.get("content") or m.get("description"))
+
+
+def import_legacy(path: Path = VECTOR_STORE_PATH, dim: int = 768,
+                  extra_dirs: Optional[List[Path]] = None) -> Dict:
+    """Merge every legacy store into a new store at ``path``.
+
+    Stores with another dimension (the 384-dim langchain index.faiss /
+    index.pkl pair came from a different embedding model) can't share an
+    index with nomic-embed-text vectors and are skipped; index.pkl is never
+    unpickled. Duplicate chunks are kept once. Legacy files are left as they
+    are.
+    """
+    index = faiss.IndexFlatL2(dim)
+    metadata: List[Dict] = []
+    seen = set()
+    report = {"imported": [], "skipped": [], "duplicates": 0}
+
+    for index_path, meta_path in find_legacy_stores(extra_dirs):
+        try:
+            legacy = faiss.read_index(str(index_path))
+            with open(meta_path, "r", encoding="utf-8") as f:
+                legacy_meta = json.load(f)
+        except (RuntimeError, OSError, ValueError) as e:
+            report["skipped"].append({"path": str(index_path), "reason": f"unreadable: {e}"})
+            continue
+        if legacy.d != dim:
+            report["skipped"].append({"path": str(index_path), "reason": f"dimension {legacy.d}, expected {dim}"})
+            continue
+        if not isinstance(legacy_meta, list):
+            report["skipped"].append({"path": str(index_path), "reason": "metadata.json is not a list"})
+            continue
+
+        # Older code could write more metadata entries than vectors; only the
+        # aligned prefix is trustworthy
+        count = min(legacy.ntotal, len(legacy_meta))
+        vectors = legacy.reconstruct_n(0, count) if count else np.empty((0, dim), dtype=np.float32)
+        keep = []
+        for i, m in enumerate(legacy_meta[:count]):
+            key = _entry_key(m)
+            if key in seen:
+                report["duplicates"] += 1
+                continue
+            seen.add(key)
+            keep.append(i)
+        if keep:
+            index.add(vectors[keep])
+            metadata.extend(legacy_meta[i] for i in keep)
+        report["imported"].append({"path": str(index_path), "vectors": len(keep),
+                                   "misaligned": abs(legacy.ntotal - len(legacy_meta))})
+
+    manifest = save_store(path, index, metadata)
+    report["count"] = manifest["count"]
+    report["path"] = str(path)
+    return report
+
+
+def main(argv: List[str]):
+    command = argv[0] if argv else "info"
+    if command == "import":
+        if read_manifest(VECTOR_STORE_PATH) is not None:
+            sys.exit(f"{VECTOR_STORE_PATH} already holds a store; move it away to re-import")
+        print(json.dumps(import_legacy(extra_dirs=[Path(p) for p in argv[1:]]), indent=2))
+    elif command == "verify":
+        try:
+            manifest = check_integrity(VECTOR_STORE_PATH, full="--full" in argv)
+        except VectorStoreCorrupt as e:
+            sys.exit(f"corrupt: {e}")
+        print(f"ok: generation {manifest['generation']}, {manifest['count']} vectors")
+    elif command == "info":
+        print(json.dumps(read_manifest(VECTOR_STORE_PATH), indent=2))
+    else:
+        sys.exit("usage: python -m app.vector_format [info | verify [--full] | import [dirs...]]")
+
+
+if __name__ == "__main__":
+    from app.logging_config import configure_logging
+    configure_logging()
+    main(sys.argv[1:])
@@ -0,0 +1,597 @@
+# app/vector_index.py
+import logging
+import os
+os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
+
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime, timedelta
+from typing import Iterable, List, Dict, Optional, Set, Tuple
+import numpy as np
+import faiss
+import torch
+
+from app import vector_format
+from app.vector_format import VECTOR_STORE_PATH
+
+# Deleted chats leave tombstoned vectors behind; they are skipped by search()
+# and physically removed by a background compaction this long after the
+# last deletion, so a burst of deletions costs one rebuild.
+VECTOR_COMPACT_DELAY_SECONDS = float(os.environ.get("VECTOR_COMPACT_DELAY_SECONDS", 30))
+
+# How vectors are held in memory. "flat" keeps exact float32 vectors in the
+# index (3 KB per 768-dim embedding). "fp16", "int8" and "pq" keep 2-byte,
+# 1-byte or product-quantized codes (VECTOR_PQ_M bytes); search() takes
+# VECTOR_RERANK_FACTOR * k candidates from the codes and re-ranks them by
+# exact distance, read from the store's memory-mapped floats file. int8 and pq
+# learn their codes from the data, so they use fp16 until the store holds
+# VECTOR_TRAIN_MIN vectors and retrain whenever the index is rebuilt.
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION", "flat")
+VECTOR_PQ_M = int(os.environ.get("VECTOR_PQ_M", 96))
+VECTOR_RERANK_FACTOR = int(os.environ.get("VECTOR_RERANK_FACTOR", 4))
+VECTOR_TRAIN_MIN = int(os.environ.get("VECTOR_TRAIN_MIN", 10000))
+QUANTIZATIONS = ("flat", "fp16", "int8", "pq")
+# Vectors sampled to train int8 ranges and PQ codebooks
+TRAIN_SAMPLE = 65536
+
+# "cosine" (what nomic-embed-text is trained for) normalizes vectors as
+# they are added and ranks by inner product, so search() returns a
+# ``score`` between -1 and 1 and results scoring below ``min_score`` are
+# cut off (see VECTOR_MIN_SCORE in app.llm). "l2" ranks raw vectors by
+# Euclidean ``distance``. Stores written before this setting existed are l2;
+# with cosine configured they are normalized and converted at startup.
+VECTOR_METRIC = os.environ.get("VECTOR_METRIC", "cosine")
+METRICS = ("cosine", "l2")
+
+USE_GPU = torch.cuda.is_available()
+if USE_GPU:
+    import faiss.contrib.torch_utils
+
+logger = logging.getLogger(__name__)
+
+
+class _ReadWriteLock:
+    """Any number of readers or one writer. Waiting writers go first, so a
+    steady stream of searches can't hold off an add()."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+def _epoch(m: Dict) -> float:
+    try:
+        return datetime.fromisoformat(m["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return float("nan")  # never inside a time window
+
+
+def _scan_seconds(index, repeats: int = 3) -> float:
+    """Time of one full-index scan, which is what every search() pays."""
+    if index.ntotal == 0:
+        return 0.0
+    probe = np.zeros((1, index.d), dtype=np.float32)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        index.search(probe, index.ntotal)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _index_kind(index) -> str:
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "int8" if index.sq.qtype == faiss.ScalarQuantizer.QT_8bit else "fp16"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "pq"
+    return "flat"
+
+
+def _index_metric(index) -> str:
+    return "cosine" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length copies of the rows (all-zero rows stay zero)."""
+    vectors = np.array(vectors, dtype=np.float32, copy=True)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _training_sample(blocks: List[np.ndarray], dim: int) -> np.ndarray:
+    total = sum(len(b) for b in blocks)
+    if total <= TRAIN_SAMPLE:
+        return np.concatenate([np.asarray(b) for b in blocks] + [np.empty((0, dim), dtype=np.float32)])
+    rows = np.sort(np.random.default_rng(0).choice(total, TRAIN_SAMPLE, replace=False))
+    sample, offset = [], 0
+    for b in blocks:
+        mine = rows[(rows >= offset) & (rows < offset + len(b))] - offset
+        sample.append(np.asarray(b[mine]))
+        offset += len(b)
+    return np.concatenate(sample)
+
+
+def build_index(dim: int, kind: str, blocks: List[np.ndarray], metric: str = VECTOR_METRIC):
+    """A ``kind`` index holding these float32 arrays' rows, trained on them if it needs training.
+
+    With the cosine metric the rows must already be normalized.
+    """
+    ip = metric == "cosine"
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dim) if ip else faiss.IndexFlatL2(dim)
+    elif kind == "pq":
+        # A single inverted list scans every code like IndexPQ, but unlike
+        # IndexPQ it accepts the ID selectors search() filters with
+        coarse = faiss.IndexFlatIP(dim) if ip else faiss.IndexFlatL2(dim)
+        index = faiss.IndexIVFPQ(coarse, dim, 1, VECTOR_PQ_M, 8,
+                                 faiss.METRIC_INNER_PRODUCT if ip else faiss.METRIC_L2)
+    else:
+        qtype = faiss.ScalarQuantizer.QT_8bit if kind == "int8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT if ip else faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(_training_sample(blocks, dim))
+    for b in blocks:
+        for i in range(0, len(b), TRAIN_SAMPLE):
+            index.add(np.ascontiguousarray(b[i:i + TRAIN_SAMPLE], dtype=np.float32))
+    return index
+
+
+def _search_params(index, ids: np.ndarray):
+    sel = faiss.IDSelectorBatch(ids)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=1)
+    return faiss.SearchParameters(sel=sel)
+
+
+def _drop_reason(m: Dict, cutoff: Optional[datetime], live_chat_ids: Optional[Set[str]],
+                 live_documents: Optional[Set[Tuple[str, str]]]) -> Optional[str]:
+    if m.get("deleted"):
+        return "deleted"
+    if m.get("doc_id"):
+        # Library documents belong to no chat and don't expire; they go with the document
+        if live_documents is not None and (m.get("username"), m["doc_id"]) not in live_documents:
+            return "orphaned"
+        return None
+    if live_chat_ids is not None and m.get("chat_id") not in live_chat_ids:
+        return "orphaned"
+    if cutoff is not None:
+        try:
+            if datetime.fromisoformat(m["timestamp"]) < cutoff:
+                return "expired"
+        except (KeyError, TypeError, ValueError):
+            # search() can never return an entry without a valid timestamp
+            return "expired"
+    return None
+
+
+class VectorStore:
+    def __init__(self, dim: int = 768, path: Optional[Path] = None, quantization: str = VECTOR_QUANTIZATION,
+                 metric: str = VECTOR_METRIC):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"VECTOR_QUANTIZATION must be one of {', '.join(QUANTIZATIONS)}, not {quantization!r}")
+        if metric not in METRICS:
+            raise ValueError(f"VECTOR_METRIC must be one of {', '.join(METRICS)}, not {metric!r}")
+        # Always the configured absolute path, never relative to the CWD
+        self.path = Path(path or VECTOR_STORE_PATH)
+        self.quantization = quantization
+        self.metric = metric
+        self.gpu = False  # set once the index is loaded
+        self.index = faiss.IndexFlatL2(dim)
+        # Entries without their chunk text, which search() reads from _entries
+        self.metadata = []
+        self._entries: Optional[vector_format.MetadataFile] = None
+        # Every vector's exact float32 row, memory-mapped from the store
+        self._floats = np.empty((0, dim), dtype=np.float32)
+        # add() appends to the store's files; never let two writers interleave
+        self._lock = threading.Lock()
+        # FAISS indexes aren't safe to search while add() grows them in place:
+        # searches read the index under this lock, add() writes it. Taken
+        # after _lock, never the other way round.
+        self._index_lock = _ReadWriteLock()
+        # Positions of live vectors by chat, by (user, document) and by user,
+        # plus every vector's timestamp, so search() can hand FAISS the exact
+        # candidate set instead of filtering its results in Python
+        self._chat_positions: Dict[str, List[int]] = {}
+        self._doc_positions: Dict[Tuple[str, str], List[int]] = {}
+        self._user_positions: Dict[str, List[int]] = {}
+        self._times = np.empty(0, dtype=np.float64)
+        self._live = np.empty(0, dtype=bool)
+        self._compact_timer = None
+        # One rebuild at a time (tombstone timer and retention can overlap)
+        self._compact_lock = threading.Lock()
+
+        if vector_format.read_manifest(self.path) is None:
+            if self.path == VECTOR_STORE_PATH:
+                # First start with this format: bring over what older versions stored
+                report = vector_format.import_legacy(self.path, dim)
+                logger.info("Created vector store in %s with %d vectors from %d legacy stores",
+                            self.path, report["count"], len(report["imported"]), extra={"import": report})
+            else:
+                vector_format.save_store(self.path, self.index, self.metadata)
+        # Raises VectorStoreCorrupt rather than serving from a damaged store
+        self.index, self.metadata, self._entries = vector_format.load_store(self.path)
+        self._floats = vector_format.load_floats(self.path)
+        kind = self._target_kind(self.index.ntotal)
+        if _index_kind(self.index) != kind or _index_metric(self.index) != metric:
+            self._convert(kind)
+        self.gpu = USE_GPU and quantization == "flat"
+        if self.gpu:
+            self.index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, self.index)
+        self._rebuild_positions()
+
+    def _target_kind(self, count: int) -> str:
+        # PQ's k-means needs at least as many vectors as its 256 centroids
+        if self.quantization in ("int8", "pq") and count < max(VECTOR_TRAIN_MIN, 256):
+            return "fp16"
+        return self.quantization
+
+    def _convert(self, kind: str):
+        """Rebuild the index as ``kind`` (the store was written with another
+        VECTOR_QUANTIZATION or VECTOR_METRIC).
+
+        Going from l2 to cosine normalizes the stored vectors; going back
+        keeps them normalized, since the raw norms are gone.
+        """
+        before = f"{_index_kind(self.index)}/{_index_metric(self.index)}"
+        blocks = [self._floats] if len(self._floats) else []
+        if self.metric == "cosine" and _index_metric(self.index) != "cosine":
+            blocks = [_normalized(b) for b in blocks]
+        start = time.perf_counter()
+        self.index = build_index(self.index.d, kind, blocks, self.metric)
+        self._rewrite(blocks, range(len(self.metadata)))
+        logger.info("Converted vector store from %s to %s/%s", before, kind, self.metric,
+                    extra={"vectors": self.index.ntotal, "seconds": round(time.perf_counter() - start, 3)})
+
+    def add(self, vectors: np.ndarray, metadatas: List[Dict]):
+        """Append vectors to the index and the store's files; costs O(len(vectors)) on disk."""
+        if self.metric == "cosine":
+            vectors = _normalized(vectors)
+        else:
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        lines = [vector_format.entry_line(m) for m in metadatas]
+        with self._lock:
+            start = len(self.metadata)
+            trained = None
+            kind = self._target_kind(start + len(vectors))
+            if _index_kind(self.index) != kind:
+                # Enough vectors to train int8 / pq now; happens once
+                trained = build_index(self.index.d, kind, [self._floats, vectors], self.metric)
+            # Disk first: if the append fails the store in memory still matches it
+            vector_format.append_store(self.path, vectors, lines, index=trained)
+            if trained is not None:
+                self.index = trained
+            else:
+                with self._index_lock.writing():
+                    self.index.add(vectors)
+            self._floats = vector_format.load_floats(self.path)
+            self._entries.extend(lines)
+            self.metadata.extend(vector_format.without_text(m) for m in metadatas)
+            self._index_positions(start)
+
+    def _rebuild_positions(self):
+        self._chat_positions, self._doc_positions, self._user_positions = {}, {}, {}
+        self._times = np.empty(0, dtype=np.float64)
+        self._live = np.empty(0, dtype=bool)
+        self._index_positions(0)
+
+    def _index_positions(self, start: int):
+        """Add metadata[start:] to the position maps (holding the lock)."""
+        new = self.metadata[start:]
+        for pos, m in enumerate(new, start):
+            if m.get("deleted"):
+                continue
+            if m.get("doc_id"):
+                self._doc_positions.setdefault((m.get("username"), m["doc_id"]), []).append(pos)
+                self._user_positions.setdefault(m.get("username"), []).append(pos)
+            else:
+                self._chat_positions.setdefault(m.get("chat_id"), []).append(pos)
+        self._times = np.concatenate([self._times, np.array([_epoch(m) for m in new], dtype=np.float64)])
+        self._live = np.concatenate([self._live, np.array([not m.get("deleted") for m in new], dtype=bool)])
+
+    def _rewrite(self, floats: List[np.ndarray], positions: Iterable[int]):
+        """Write the store anew: ``floats`` and the metadata lines at ``positions``
+        of the current metadata file, which self.metadata must already match."""
+        lengths = []
+
+        def lines():
+            for pos in positions:
+                line = self._entries.line(pos)
+                lengths.append(len(line))
+                yield line
+
+        cpu_index = faiss.index_gpu_to_cpu(self.index) if self.gpu else self.index
+        manifest = vector_format.save_store(
+            self.path, cpu_index, lines(), floats=floats,
+            deleted=[pos for pos, m in enumerate(self.metadata) if m.get("deleted")],
+            quantization=self.quantization, metric=self.metric,
+        )
+        self._entries = vector_format.MetadataFile(self.path / manifest["files"]["metadata"]["name"], lengths)
+        self._floats = vector_format.load_floats(self.path)
+
+    def memory_bytes(self) -> int:
+        """Bytes the index holds in memory (the floats file is memory-mapped, paged in on demand)."""
+        if self.gpu:
+            return self.index.ntotal * self.index.d * 4
+        # Inverted lists (pq) also store an 8-byte id per vector
+        per_vector = self.index.sa_code_size() + (8 if isinstance(self.index, faiss.IndexIVF) else 0)
+        return self.index.ntotal * per_vector
+
+    @property
+    def deleted(self) -> int:
+        return sum(1 for m in self.metadata if m.get("deleted"))
+
+    def delete_chat(self, chat_id: str) -> int:
+        """Tombstone every vector of ``chat_id``; compaction reclaims them later."""
+        with self._lock:
+            return self._tombstone(self._chat_positions.pop(chat_id, []))
+
+    def delete_document(self, username: str, doc_id: str) -> int:
+        """Tombstone every vector of one of ``username``'s library documents."""
+        with self._lock:
+            positions = self._doc_positions.pop((username, doc_id), [])
+            if positions:
+                gone = set(positions)
+                self._user_positions[username] = [p for p in self._user_positions.get(username, []) if p not in gone]
+            return self._tombstone(positions)
+
+    def _tombstone(self, positions: List[int]) -> int:
+        for pos in positions:
+            self.metadata[pos]["deleted"] = True
+        if positions:
+            self._live[positions] = False
+            vector_format.save_tombstones(self.path, np.flatnonzero(~self._live))
+            self._schedule_compaction()
+        return len(positions)
+
+    def _schedule_compaction(self):
+        if self._compact_timer is not None:
+            self._compact_timer.cancel()
+        self._compact_timer = threading.Timer(VECTOR_COMPACT_DELAY_SECONDS, self._compact_in_background)
+        self._compact_timer.daemon = True
+        self._compact_timer.start()
+
+    def _compact_in_background(self):
+        try:
+            result = self.compact()
+            logger.info("Vector store compacted", extra={"removed": result["removed"], "vectors": result["vectors"]})
+        except Exception:
+            logger.exception("Vector store compaction failed")
+
+    def disk_bytes(self) -> int:
+        manifest = vector_format.read_manifest(self.path)
+        return sum(entry["bytes"] for entry in manifest["files"].values()) if manifest else 0
+
+    def compact(self, max_age_minutes: Optional[float] = None, live_chat_ids: Optional[Set[str]] = None,
+                live_documents: Optional[Set[Tuple[str, str]]] = None) -> Dict:
+        """Rebuild the index without dead vectors and swap it in.
+
+        Dead means tombstoned, older than ``max_age_minutes``, belonging to a
+        chat not in ``live_chat_ids`` or to a library document not in
+        ``live_documents`` (each check only if given). The copy and its
+        files are built without holding the lock so searches and adds keep
+        going; under the lock only the vectors added meanwhile are appended
+        before the manifest, index and metadata are swapped.
+        """
+        with self._compact_lock:
+            return self._compact(max_age_minutes, live_chat_ids, live_documents)
+
+    def _compact(self, max_age_minutes, live_chat_ids, live_documents) -> Dict:
+        cutoff = datetime.now() - timedelta(minutes=max_age_minutes) if max_age_minutes is not None else None
+        with self._lock:
+            old_index, old_floats, entries = self.index, self._floats, self._entries
+            snapshot = old_index.ntotal
+            metadata = self.metadata[:snapshot]
+            bytes_before = self.disk_bytes()
+
+        removed = {"deleted": 0, "expired": 0, "orphaned": 0}
+        keep = []
+        for i, m in enumerate(metadata):
+            reason = _drop_reason(m, cutoff, live_chat_ids, live_documents)
+            if reason:
+                removed[reason] += 1
+            else:
+                keep.append(i)
+        result = {"removed": snapshot - len(keep), "removed_by_reason": removed, "vectors": snapshot,
+                  "bytes_before": bytes_before, "bytes_after": bytes_before, "reclaimed_bytes": 0}
+        if len(keep) == snapshot:
+            return result
+
+        # Rebuild (and retrain) from the exact vectors, and write the new files
+        kept = np.asarray(old_floats[keep]) if keep else np.empty((0, old_index.d), dtype=np.float32)
+        index = build_index(old_index.d, self._target_kind(len(keep)), [kept], self.metric)
+        lengths = []
+
+        def lines():
+            for pos in keep:
+                line = entries.line(pos)
+                lengths.append(len(line))
+                yield line
+
+        staged = vector_format.stage_store(self.path, index, lines(), floats=[kept])
+        if self.gpu:
+            index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index)
+
+        with self._lock:
+            total = self.index.ntotal
+            added = np.asarray(self._floats[snapshot:total])
+            added_lines = [self._entries.line(pos) for pos in range(snapshot, total)]
+            retrained = None
+            if _index_kind(index) != self._target_kind(len(keep) + total - snapshot):
+                index = retrained = build_index(index.d, self._target_kind(len(keep) + total - snapshot),
+                                                [kept, added], self.metric)
+            elif total > snapshot:
+                index.add(added)
+            # Entries are shared dicts, so tombstones set during the rebuild carry over
+            metadata = [metadata[i] for i in keep] + self.metadata[snapshot:]
+            manifest = vector_format.commit_staged(
+                self.path, staged, vectors=added, metadata=added_lines,
+                deleted=[pos for pos, m in enumerate(metadata) if m.get("deleted")], index=retrained,
+                quantization=self.quantization, metric=self.metric,
+            )
+            self.index = index
+            self.metadata = metadata
+            self._rebuild_positions()
+            self._entries = vector_format.MetadataFile(self.path / manifest["files"]["metadata"]["name"],
+                                                       lengths + [len(line) for line in added_lines])
+            self._floats = vector_format.load_floats(self.path)
+            result["vectors"] = self.index.ntotal
+            result["bytes_after"] = self.disk_bytes()
+        result["reclaimed_bytes"] = bytes_before - result["bytes_after"]
+
+        scan_before = _scan_seconds(old_index)
+        with self._index_lock.reading():
+            # Live now: add() may be growing it
+            scan_after = _scan_seconds(index)
+        result["scan_ms_before"] = round(scan_before * 1000, 3)
+        result["scan_ms_after"] = round(scan_after * 1000, 3)
+        result["search_speedup"] = round(scan_before / scan_after, 2) if scan_after else None
+        return result
+
+    def _candidates(self, chat_id, time_window_minutes, username, doc_ids) -> np.ndarray:
+        """Positions search() may return (holding the lock).
+
+        Vectors of ``chat_id`` (every chat if neither a chat nor a user is
+        given) from the last ``time_window_minutes``, plus ``username``'s
+        library documents: those in ``doc_ids``, or all of them if it's None.
+        """
+        parts = []
+        if chat_id is not None or username is None:
+            if chat_id is not None:
+                chat = np.array(self._chat_positions.get(chat_id, []), dtype=np.int64)
+            else:
+                chat = np.flatnonzero(self._live)
+            if time_window_minutes is not None and chat.size:
+                cutoff = time.time() - time_window_minutes * 60
+                chat = chat[self._times[chat] >= cutoff]
+            parts.append(chat)
+        if username is not None:
+            if doc_ids is None:
+                parts.append(np.array(self._user_positions.get(username, []), dtype=np.int64))
+            else:
+                parts.extend(np.array(self._doc_positions.get((username, d), []), dtype=np.int64) for d in doc_ids)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        ids = np.unique(np.concatenate(parts))
+        return ids[self._live[ids]]
+
+    def _nearest(self, index, floats: np.ndarray, query: np.ndarray, ids: np.ndarray, k: int, cosine: bool,
+                 min_score: Optional[float] = None):
+        """(scores or distances, positions) of the best ``k`` of ``ids``, best first; (None, None) if
+        none of them is in ``index`` yet. The caller holds the index read lock.
+
+        With ``min_score`` (cosine only) a flat index is range-searched: only
+        matches at or above it are kept and ranked, not the top ``k`` of all
+        candidates. Quantized indexes score approximately, so they search the
+        top ``k`` and the caller applies the cut-off to the exact scores.
+        """
+        ids = ids[ids < index.ntotal]
+        if ids.size == 0:
+            return None, None
+        k = min(k, ids.size)
+        if self.gpu:
+            # GPU indexes take no ID selector; score the candidates' vectors directly
+            candidates = np.vstack([index.reconstruct(int(i)) for i in ids])
+            D, I = faiss.knn(query, candidates, k, metric=index.metric_type)
+            return D[0], ids[I[0]]
+        rerank = _index_kind(index) != "flat"
+        # FAISS computes distances only for the selected ids (all of them need no selector)
+        params = None if ids.size == index.ntotal else _search_params(index, ids)
+        if cosine and min_score is not None and not rerank:
+            # Keeps scores above the radius; one float below min_score keeps those equal to it too
+            _, D, I = index.range_search(query, float(np.nextafter(np.float32(min_score), np.float32(-2))),
+                                         params=params)
+            if D.size > k:
+                top = np.argpartition(-D, k - 1)[:k]
+                D, I = D[top], I[top]
+            order = np.argsort(-D, kind="stable")
+            return D[order], I[order]
+        shortlist = min(ids.size, k * VECTOR_RERANK_FACTOR) if rerank else k
+        D, I = index.search(query, shortlist, params=params)
+        D, I = D[0], I[0]
+        if rerank:
+            # Re-rank the shortlist by exact score or distance
+            I = I[I >= 0]
+            exact = np.asarray(floats[I])
+            if cosine:
+                D = exact @ query[0]
+                order = np.argsort(-D, kind="stable")[:k]
+            else:
+                D = ((exact - query) ** 2).sum(axis=1)
+                order = np.argsort(D, kind="stable")[:k]
+            D, I = D[order], I[order]
+        return D, I
+
+    def search(self, vector: np.ndarray, k=4, chat_id=None, time_window_minutes=120,
+               username=None, doc_ids=None, min_score=None) -> List[Dict]:
+        """Nearest vectors among the candidates picked by the filters (see _candidates).
+
+        With the cosine metric, matches scoring below ``min_score`` are dropped,
+        so a query unrelated to everything stored gets nothing back.
+        """
+        # compact() swaps index, metadata and positions together; take a consistent set
+        with self._lock:
+            index, entries, floats = self.index, self._entries, self._floats
+            ids = self._candidates(chat_id, time_window_minutes, username, doc_ids)
+        cosine = self.metric == "cosine"
+        query = _normalized(vector.reshape(1, -1)) if cosine else vector.reshape(1, -1).astype(np.float32)
+        with self._index_lock.reading():
+            D, I = self._nearest(index, floats, query, ids, k, cosine, min_score)
+        if D is None:
+            return []
+        if cosine and min_score is not None:
+            # Scores come best first (a range search has applied the cut-off already)
+            keep = D >= min_score
+            D, I = D[keep], I[keep]
+
+        results = []
+        for value, idx in zip(D, I):
+            if idx < 0:
+                continue
+            m = entries.entry(idx)
+            if m.get("type") == "pdf":
+                content = f"[PDF Page {m['page']+1}]: {m['content']}"
+            elif m.get("type") == "image":
+                content = f"[Image]: {m['description']}"
+            else:
+                logger.debug("Skipping vector metadata of unknown type at %d", idx)
+                continue
+            result = {"content": content, "score" if cosine else "distance": float(value)}
+            if m.get("doc_id"):
+                result["doc_id"] = m["doc_id"]
+            if "page" in m:
+                result["page"] = m["page"]
+            results.append(result)
+        return results
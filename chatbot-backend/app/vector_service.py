@@ -0,0 +1,189 @@
+# app/vector_service.py
+"""Single-writer vector store service for multi-worker deployments.
+
+With several uvicorn workers each process would otherwise load its own copy
+of the FAISS index and overwrite the others' files on every add(). Instead
+one process owns the VectorStore and workers talk to it over a local
+multiprocessing connection:
+
+    python -m app.vector_service            # started for you by app.serve
+
+Workers use it when VECTOR_SERVICE_ADDRESS is set (``host:port``). The
+service unpickles whatever its clients send, so both sides need the same
+secret VECTOR_SERVICE_AUTHKEY; there is no default, and app.serve generates
+one per run. To start the service by hand, export a key of your own first.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Dict, List, Optional
+
+VECTOR_SERVICE_ADDRESS = os.environ.get("VECTOR_SERVICE_ADDRESS", "")
+VECTOR_SERVICE_AUTHKEY = os.environ.get("VECTOR_SERVICE_AUTHKEY", "").encode()
+
+# Calls the service will dispatch to the VectorStore
+_ALLOWED_METHODS = {"add", "search", "delete_chat", "delete_document", "compact", "stats"}
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_address(address: str):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def _require_authkey(authkey: bytes) -> bytes:
+    if not authkey:
+        raise ValueError("VECTOR_SERVICE_AUTHKEY is not set")
+    return authkey
+
+
+class RemoteVectorStore:
+    """Client with the same add()/search()/delete_*() interface as VectorStore."""
+
+    def __init__(self, address: str = VECTOR_SERVICE_ADDRESS, authkey: bytes = VECTOR_SERVICE_AUTHKEY):
+        self.address = _parse_address(address)
+        self.authkey = _require_authkey(authkey)
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _call(self, method: str, *args, **kwargs):
+        for attempt in range(2):
+            try:
+                conn = self._conn()
+                conn.send((method, args, kwargs))
+                status, result = conn.recv()
+                break
+            except (EOFError, OSError):
+                # Service restarted or connection dropped; reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        if status == "error":
+            raise RuntimeError(f"vector service: {result}")
+        return result
+
+    def add(self, vectors, metadatas: List[Dict]):
+        return self._call("add", vectors, metadatas)
+
+    def search(self, vector, k=4, chat_id=None, time_window_minutes=120, username=None, doc_ids=None,
+               min_score=None) -> List[Dict]:
+        return self._call("search", vector, k=k, chat_id=chat_id, time_window_minutes=time_window_minutes,
+                          username=username, doc_ids=doc_ids, min_score=min_score)
+
+    def delete_chat(self, chat_id: str) -> int:
+        return self._call("delete_chat", chat_id)
+
+    def delete_document(self, username: str, doc_id: str) -> int:
+        return self._call("delete_document", username, doc_id)
+
+    def compact(self, max_age_minutes=None, live_chat_ids=None, live_documents=None) -> Dict:
+        return self._call("compact", max_age_minutes=max_age_minutes, live_chat_ids=live_chat_ids,
+                          live_documents=live_documents)
+
+    def stats(self) -> Dict:
+        return self._call("stats")
+
+
+def open_vector_store():
+    """The store this process should use: remote if a service is configured."""
+    if VECTOR_SERVICE_ADDRESS:
+        return RemoteVectorStore(VECTOR_SERVICE_ADDRESS)
+    from app.vector_index import VectorStore
+    return VectorStore()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """Process-wide store shared by llm.py and chat deletion."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = open_vector_store()
+    return _store
+
+
+def wait_for_service(address: str = VECTOR_SERVICE_ADDRESS, timeout: float = 30.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            RemoteVectorStore(address).stats()
+            return True
+        except (OSError, EOFError):
+            time.sleep(0.2)
+    return False
+
+
+class VectorService:
+    def __init__(self, store, address: str, authkey: bytes = VECTOR_SERVICE_AUTHKEY):
+        self.store = store
+        self.listener = Listener(_parse_address(address), authkey=_require_authkey(authkey))
+
+    def stats(self) -> Dict:
+        return {"vectors": self.store.index.ntotal, "metadata": len(self.store.metadata),
+                "deleted": self.store.deleted, "quantization": self.store.quantization,
+                "metric": self.store.metric,
+                "index_memory_bytes": self.store.memory_bytes()}
+
+    def _dispatch(self, method: str, args, kwargs):
+        if method not in _ALLOWED_METHODS:
+            raise ValueError(f"unknown method {method}")
+        if method == "stats":
+            return self.stats()
+        # Connections are served on their own threads; VectorStore lets searches run concurrently and
+        # applies writes one at a time
+        return getattr(self.store, method)(*args, **kwargs)
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    method, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", self._dispatch(method, args, kwargs)))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    def serve_forever(self):
+        logger.info("Vector service listening on %s", self.listener.address)
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                # Bad authkey or a client that hung up during the handshake
+                logger.error("Vector service rejected a connection: %s", e)
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+
+def main(address: Optional[str] = None):
+    if not VECTOR_SERVICE_AUTHKEY:
+        sys.exit("VECTOR_SERVICE_AUTHKEY must be set to a secret shared with the workers")
+    from app.logging_config import configure_logging
+    configure_logging()
+    from app.chat_store import CHAT_DIR
+    from app.retention import start_retention
+    from app.vector_index import VectorStore
+    store = VectorStore()
+    # Workers don't run retention against a shared store; the owner does
+    start_retention(store, CHAT_DIR)
+    VectorService(store, address or VECTOR_SERVICE_ADDRESS or "127.0.0.1:8765").serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# app/write_buffer.py
+"""Write-behind buffering of chat messages with group commit.
+
+Without it, save_message() rewrites the whole chat file and indexes the
+message before returning, twice per chat turn. While the buffer runs,
+save_message() appends one line to this process's journal and returns; a
+flusher thread applies everything buffered every CHAT_FLUSH_INTERVAL_MS
+(sooner once CHAT_FLUSH_MAX_MESSAGES are waiting), rewriting each touched
+chat once per batch. load_chat_messages() merges buffered messages in, so a
+process always sees its own writes; other uvicorn workers see them after
+the next flush.
+
+Durability, set by CHAT_FSYNC:
+
+    always    save_message() returns once the journal is fsynced; writers
+              that arrive together share one fsync (group commit). An
+              acknowledged message survives a crash or power loss.
+    interval  chat files are fsynced at every flush. An acknowledged message
+              survives a process crash; power loss can lose the last
+              interval.
+    off       no fsync. Survives a process crash; after power loss, whatever
+              the OS had written.
+
+Each process journals into its own segments under data/journal/ and holds a
+lock on data/journal/<owner>.lock while it runs; it has the lock before it
+writes its first segment. Segments are deleted once their messages are in
+the chat files. At startup, segments whose owner lock is free (that process
+died) are replayed; messages a chat file already holds are skipped, so
+replaying a partly applied batch is harmless.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import DATA_DIR
+from app.file_lock import fsync_dir, try_lock_path, unlink_locked
+from app.metrics import Gauge, Histogram
+
+CHAT_WRITE_BEHIND = os.environ.get("CHAT_WRITE_BEHIND", "1") == "1"
+CHAT_FSYNC = os.environ.get("CHAT_FSYNC", "interval")
+CHAT_FLUSH_INTERVAL_MS = float(os.environ.get("CHAT_FLUSH_INTERVAL_MS", 50))
+CHAT_FLUSH_MAX_MESSAGES = int(os.environ.get("CHAT_FLUSH_MAX_MESSAGES", 256))
+JOURNAL_DIR = DATA_DIR / "journal"
+# Tries at taking this process's owner lock, 50 ms apart
+OWNER_LOCK_ATTEMPTS = 100
+
+FSYNC_POLICIES = ("always", "interval", "off")
+
+logger = logging.getLogger(__name__)
+
+# apply(username, chat_id, messages, fsync, replay) writes messages to the chat file
+ApplyFn = Callable[[str, str, List[dict], bool, bool], List[dict]]
+Key = Tuple[str, str]
+
+CHAT_FLUSH_SECONDS = Histogram("chatbot_chat_flush_seconds", "Group commit of buffered chat messages")
+CHAT_FLUSH_MESSAGES = Histogram(
+    "chatbot_chat_flush_messages", "Messages per group commit", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+class WriteBuffer:
+    def __init__(self, journal_dir: Path = JOURNAL_DIR, fsync: str = CHAT_FSYNC,
+                 interval_ms: float = CHAT_FLUSH_INTERVAL_MS, max_messages: int = CHAT_FLUSH_MAX_MESSAGES):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"CHAT_FSYNC must be one of {', '.join(FSYNC_POLICIES)}, not {fsync!r}")
+        self.journal_dir = Path(journal_dir)
+        self.fsync = fsync
+        self.interval = interval_ms / 1000
+        self.max_messages = max_messages
+        self.running = False
+        self._apply: Optional[ApplyFn] = None
+        # _lock guards the buffers and journal writes; _sync_lock is taken
+        # first by anything that fsyncs or replaces the journal file
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._sync_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Key, List[dict]] = {}
+        self._pending_count = 0
+        self._applying: Dict[Key, List[dict]] = {}
+        self._owner = uuid.uuid4().hex
+        self._owner_lock = None
+        self._segment = 0
+        self._journal = None
+        self._sealed: List[Path] = []
+        self._written = 0
+        self._synced = 0
+        self._thread: Optional[threading.Thread] = None
+
+    # --- lifecycle --------------------------------------------------------------------
+
+    def start(self, apply: ApplyFn):
+        """Replay journals of dead processes, then start buffering."""
+        if self.running:
+            return
+        self._apply = apply
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self._owner_lock = self._lock_owner()
+        self.recover()
+        with self._lock:
+            self._journal = open(self._segment_path(self._segment), "ab", buffering=0)
+            self.running = True
+        self._thread = threading.Thread(target=self._flush_loop, name="chat-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop buffering and write everything buffered to the chat files."""
+        with self._cond:
+            if not self.running:
+                return
+            self.running = False
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+        with self._sync_lock, self._lock:
+            self._journal.close()
+            self._journal = None
+            unwritten = self._pending_count
+        if unwritten:
+            # Left for the next start to replay
+            logger.error("%d chat messages could not be written; keeping the journal", unwritten)
+        else:
+            for path in self._sealed + [self._segment_path(self._segment)]:
+                path.unlink(missing_ok=True)
+            self._sealed = []
+        unlink_locked(self._owner_lock, self.journal_dir / f"{self._owner}.lock")
+
+    def _lock_owner(self):
+        path = self.journal_dir / f"{self._owner}.lock"
+        for _ in range(OWNER_LOCK_ATTEMPTS):
+            lock = try_lock_path(path)
+            if lock is not None:
+                return lock
+            # Another worker's recover() got to the new file first; finding no
+            # segments it removes the file and lets go
+            time.sleep(0.05)
+        raise RuntimeError(f"Could not lock {path}")
+
+    # --- writes and reads -------------------------------------------------------------
+
+    def append(self, username: str, chat_id: str, message: dict) -> bool:
+        """Journal and buffer a message; False if the buffer isn't running (write it directly)."""
+        line = (json.dumps({"username": username, "chat_id": chat_id, "message": message}) + "\n").encode("utf-8")
+        with self._cond:
+            if not self.running:
+                return False
+            self._journal.write(line)
+            self._written += len(line)
+            position = self._written
+            self._pending.setdefault((username, chat_id), []).append(message)
+            self._pending_count += 1
+            if self._pending_count >= self.max_messages:
+                self._cond.notify()
+        if self.fsync == "always":
+            self._sync_journal(position)
+        return True
+
+    def buffered(self, username: str, chat_id: str) -> List[dict]:
+        """Messages of this chat not yet written to its file, oldest first."""
+        key = (username, chat_id)
+        with self._lock:
+            return self._applying.get(key, []) + self._pending.get(key, [])
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._pending_count + sum(len(m) for m in self._applying.values())
+
+    def _sync_journal(self, position: int):
+        # Group commit: whoever gets here first fsyncs everything written so
+        # far; writers queued behind it usually find their line covered
+        with self._sync_lock:
+            if self._synced >= position:
+                return
+            with self._lock:
+                target = self._written
+                fd = self._journal.fileno()
+            os.fsync(fd)
+            self._synced = target
+
+    # --- flushing ---------------------------------------------------------------------
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self.running or self._pending_count >= self.max_messages,
+                                    timeout=self.interval)
+                if not self.running:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Chat write-behind flush failed")
+
+    def flush(self):
+        """Write everything buffered so far to the chat files, one rewrite per chat."""
+        with self._flush_lock:
+            with self._sync_lock, self._lock:
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, {}
+                count, self._pending_count = self._pending_count, 0
+                self._applying = dict(batch)
+                self._sealed.append(self._rotate())
+
+            start = time.perf_counter()
+            failed = False
+            for key, messages in batch.items():
+                try:
+                    self._apply(key[0], key[1], messages, self.fsync != "off", False)
+                    requeue = []
+                except Exception:
+                    logger.exception("Could not write %d buffered messages to chat %s", len(messages), key[1])
+                    failed, requeue = True, messages
+                with self._lock:
+                    # Removed only now that the file has them, so readers never miss them
+                    del self._applying[key]
+                    if requeue:
+                        self._pending[key] = requeue + self._pending.get(key, [])
+                        self._pending_count += len(requeue)
+            CHAT_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            CHAT_FLUSH_MESSAGES.observe(count)
+
+            # Segments are only dropped once everything they hold is applied
+            if not failed:
+                for path in self._sealed:
+                    path.unlink(missing_ok=True)
+                self._sealed = []
+
+    def _rotate(self) -> Path:
+        """Seal the current journal segment and start a new one (holding both locks)."""
+        if self.fsync == "always" and self._synced < self._written:
+            os.fsync(self._journal.fileno())
+        self._synced = self._written
+        self._journal.close()
+        sealed = self._segment_path(self._segment)
+        self._segment += 1
+        self._journal = open(self._segment_path(self._segment), "ab", buffering=0)
+        return sealed
+
+    def _segment_path(self, n: int) -> Path:
+        return self.journal_dir / f"{self._owner}-{n:08d}.jsonl"
+
+    # --- recovery ---------------------------------------------------------------------
+
+    def recover(self) -> int:
+        """Replay journal segments left by processes that died; returns messages restored."""
+        owners = {p.name.split("-")[0] for p in self.journal_dir.glob("*-*.jsonl")}
+        owners |= {p.stem for p in self.journal_dir.glob("*.lock")}
+        owners.discard(self._owner)
+        restored = 0
+        for owner in sorted(owners):
+            lock_path = self.journal_dir / f"{owner}.lock"
+            lock = try_lock_path(lock_path)
+            if lock is None:
+                continue  # that process is still running
+            try:
+                segments = sorted(self.journal_dir.glob(f"{owner}-*.jsonl"))
+                restored += self._replay(segments)
+                for path in segments:
+                    path.unlink()
+            except BaseException:
+                lock.close()
+                raise
+            unlink_locked(lock, lock_path)
+        if owners:
+            fsync_dir(self.journal_dir)
+        return restored
+
+    def _replay(self, segments: List[Path]) -> int:
+        by_chat: Dict[Key, List[dict]] = {}
+        for path in segments:
+            with open(path, "rb") as f:
+                for n, line in enumerate(f, 1):
+                    try:
+                        entry = json.loads(line)
+                        key = (entry["username"], entry["chat_id"])
+                    except (ValueError, KeyError, TypeError):
+                        # The process died mid-write; nothing after this was acknowledged
+                        logger.warning("Skipping torn journal line %s:%d", path.name, n)
+                        continue
+                    by_chat.setdefault(key, []).append(entry["message"])
+        restored = 0
+        for (username, chat_id), messages in by_chat.items():
+            restored += len(self._apply(username, chat_id, messages, True, True))
+        if restored:
+            logger.info("Recovered %d chat messages from %d journal segments", restored, len(segments))
+        return restored
+
+
+write_buffer = WriteBuffer()
+
+CHAT_BUFFERED_MESSAGES = Gauge(
+    "chatbot_chat_buffered_messages", "Chat messages journaled but not yet in their chat file",
+    collect=lambda: {(): write_buffer.pending_count()},
+)
@@ -0,0 +1,60 @@
+# benchmarks/bench_auth_check.py
+"""Per-request cost of validating a bearer token.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_auth_check --sessions 100000 --checks 200000
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from app import session_store
+from app.dependencies import get_current_username
+
+
+def run(backend_name: str, sessions: int, checks: int) -> dict:
+    tmp = tempfile.TemporaryDirectory()
+    if backend_name == "sqlite":
+        backend = session_store.SQLiteSessionBackend(Path(tmp.name) / "sessions.db")
+    else:
+        backend = session_store.MemorySessionBackend()
+    session_store.set_backend(backend)
+
+    tokens = [session_store.create_session(f"user{i}") for i in range(sessions)]
+
+    start = time.perf_counter()
+    for i in range(checks):
+        get_current_username(tokens[(i * 7919) % sessions])
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    swept = session_store.sweep_expired_sessions()
+    sweep_elapsed = time.perf_counter() - start
+
+    tmp.cleanup()
+    return {
+        "backend": backend_name,
+        "sessions": sessions,
+        "checks": checks,
+        "us_per_check": elapsed / checks * 1e6,
+        "sweep_ms": sweep_elapsed * 1e3,
+        "swept": swept,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    parser.add_argument("--checks", type=int, default=200_000)
+    parser.add_argument("--backends", default="memory,sqlite")
+    args = parser.parse_args()
+
+    for name in args.backends.split(","):
+        r = run(name, args.sessions, args.checks)
+        print(f"{r['backend']:>7}: {r['us_per_check']:.2f} us/check over {r['sessions']} sessions, "
+              f"sweep {r['sweep_ms']:.1f} ms ({r['swept']} expired)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_chat_cache.py
+"""Disk reads and load latency of chat turns with the hot-chat cache.
+
+--chats chats of --history messages each; every turn picks a chat with
+Zipf-distributed popularity (a few hot conversations, a long tail) and does
+what a real turn does to the store: load the history for the prompt, save
+the user message and the reply, and load the chat again for the frontend.
+Runs once per cache size (0 = no cache); chat files read from disk are the
+cache misses.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_chat_cache --chats 200 --turns 2000 --sizes 0,1,64
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def message(sender: str, n: int) -> dict:
+    return {"id": str(uuid.uuid4()), "sender": sender, "text": f"{sender} message {n} " + "x" * 300,
+            "timestamp": f"2025-01-01T{n // 3600 % 24:02d}:{n // 60 % 60:02d}:{n % 60:02d}Z"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--history", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--sizes", default="0,1,64", help="cache sizes in MB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The chat store reads its location at import; measure the cache, not write-behind
+        os.environ.update(CHATBOT_DATA_DIR=tmp, TRACING="0")
+        from app import chat_store
+        from app.chat_cache import chat_cache
+        from app.file_lock import atomic_write_json
+
+        chat_ids = [chat_store.create_new_chat("bench", f"chat {c}") for c in range(args.chats)]
+        history = [message("user", n) for n in range(args.history)]
+        weights = [1 / (rank + 1) for rank in range(args.chats)]
+
+        print(f"{args.chats} chats x {args.history} messages, {args.turns} turns")
+        print(f"{'cache MB':>8} {'hit rate':>9} {'reads/turn':>11} {'load p50':>9} {'load p99':>9} {'turns/s':>8}")
+        for size in (float(s) for s in args.sizes.split(",")):
+            # Same starting histories for every run
+            for chat_id in chat_ids:
+                atomic_write_json(chat_store.CHAT_DIR / "bench" / f"{chat_id}.json", history)
+            chat_cache.max_bytes = int(size * 1024 * 1024)
+            chat_cache.clear()
+            chat_cache.hits = chat_cache.misses = chat_cache.evictions = 0
+            rng = random.Random(0)
+            loads = []
+            start = time.perf_counter()
+            for turn in range(args.turns):
+                chat_id = rng.choices(chat_ids, weights=weights)[0]
+                t = time.perf_counter()
+                chat_store.load_chat_messages("bench", chat_id)
+                loads.append(time.perf_counter() - t)
+                chat_store.save_message("bench", chat_id, message("user", args.history + turn))
+                chat_store.save_message("bench", chat_id, message("bot", args.history + turn))
+                t = time.perf_counter()
+                chat_store.load_chat_messages("bench", chat_id)
+                loads.append(time.perf_counter() - t)
+            elapsed = time.perf_counter() - start
+            stats = chat_cache.stats()
+            print(f"{size:>8g} {stats['hit_rate']:>9.1%} {stats['misses'] / args.turns:>11.2f} "
+                  f"{percentile(loads, 50) * 1000:>7.2f}ms {percentile(loads, 99) * 1000:>7.2f}ms "
+                  f"{args.turns / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# benchmarks/bench_chat_memory.py
+"""Recall of old facts from long chats: last-N messages vs chat memory.
+
+Builds one chat of --messages messages with synthetic embeddings (a common
+direction, a topic direction and noise, as in bench_similarity). Most
+messages are chatter on --topics recurring topics; --facts messages, each
+on a topic of its own, are planted in the first half of the chat. Every
+query is a new message on one fact's topic (or, for the off-topic half,
+on a topic never mentioned) asked at the end of the chat:
+
+    last-N       the prompt's MAX_CONTEXT_MESSAGES most recent messages only
+    memory       those plus ChatMemory.recall() of --k earlier messages
+
+"found" counts queries whose fact made it into the prompt; "off-topic
+recalled" counts off-topic queries that recalled anything at all. Recall
+latency is given with the chat's keys already parsed (warm, every turn
+after a process's first in that chat) and without (cold). The last line
+pushes --messages messages through the real background path, save_message
+to rows on disk, against the stub Ollama server with free embeddings.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_chat_memory --messages 10000 --min-score 0.64
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+DIM = 768
+WORDS_PER_MESSAGE = 60
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def embeddings(common, centres, rng):
+    vectors = 1.2 * common + 0.7 * centres + rng.standard_normal((len(centres), DIM), dtype=np.float32)
+    return vectors * rng.lognormal(0, 0.8, (len(centres), 1)).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--topics", type=int, default=200, help="recurring chatter topics")
+    parser.add_argument("--facts", type=int, default=100, help="one-off facts in the first half of the chat")
+    parser.add_argument("--queries", type=int, default=200, help="half on facts, half off-topic")
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--min-score", type=float, default=0.64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHATBOT_DATA_DIR"] = tmp
+        os.environ.setdefault("TRACING", "0")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ["MODEL_WARMUP"] = "0"
+        from benchmarks.stub_ollama import StubOllama
+        stub = StubOllama(port=0, embed_latency=0)
+        stub.start()
+        os.environ["OLLAMA_URL"] = stub.url
+        from app import chat_memory as memory_module
+        from app.chat_memory import ChatMemory
+        from app.chat_store import (
+            CHAT_DIR, create_new_chat, load_chat_messages, save_message, start_write_behind, stop_write_behind,
+        )
+        from app.llm import MAX_CONTEXT_MESSAGES
+
+        rng = np.random.default_rng(0)
+        common = rng.standard_normal(DIM, dtype=np.float32)
+        centres = rng.standard_normal((args.topics + args.facts * 2, DIM), dtype=np.float32)
+        topics = rng.integers(0, args.topics, args.messages)
+        fact_at = rng.choice(args.messages // 2, args.facts, replace=False)
+        topics[fact_at] = args.topics + np.arange(args.facts)
+        vectors = embeddings(common, centres[topics], rng)
+        history = [{"id": str(uuid.uuid4()), "sender": "user" if i % 2 == 0 else "bot",
+                    "text": " ".join(["word"] * WORDS_PER_MESSAGE), "timestamp": f"{i:08d}"}
+                   for i in range(args.messages)]
+
+        memory = ChatMemory(memory_dir=os.path.join(tmp, "memory"))
+        for start in range(0, args.messages, 256):
+            chunk = slice(start, start + 256)
+            memory._append("bench", "chat", [m["id"] for m in history[chunk]],
+                           memory_module._normalized(vectors[chunk]))
+
+        half = args.queries // 2
+        asked = rng.integers(0, args.facts, half)
+        unseen = args.topics + args.facts + rng.integers(0, args.facts, args.queries - half)
+        queries = embeddings(common, centres[np.concatenate([args.topics + asked, unseen])], rng)
+        recent = history[-MAX_CONTEXT_MESSAGES:]
+
+        cold, warm, found, off_topic, recalled_chars = [], [], 0, 0, []
+        for n, q in enumerate(queries):
+            start = time.perf_counter()
+            fresh = ChatMemory(memory_dir=memory.memory_dir)
+            fresh.recall("bench", "chat", q, history, MAX_CONTEXT_MESSAGES, args.k, args.min_score)
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            recalled = memory.recall("bench", "chat", q, history, MAX_CONTEXT_MESSAGES, args.k, args.min_score)
+            warm.append(time.perf_counter() - start)
+            recalled_chars.append(sum(len(m["text"]) for m in recalled))
+            if n < half:
+                fact_id = history[fact_at[asked[n]]]["id"]
+                found += any(m["id"] == fact_id for m in recalled)
+            else:
+                off_topic += bool(recalled)
+
+        recent_chars = sum(len(m["text"]) for m in recent)
+        all_chars = sum(len(m["text"]) for m in history)
+        print(f"{args.messages} messages ({args.topics} chatter topics, {args.facts} facts), "
+              f"{args.queries} queries, k={args.k}, min score {args.min_score}")
+        print(f"{'history':<12} {'found':>7} {'off-topic recalled':>19} {'history chars':>14}")
+        print(f"{'last-N':<12} {0:>7.0%} {0:>18.0%} {recent_chars:>14}")
+        print(f"{'memory':<12} {found / half:>7.0%} {off_topic / (args.queries - half):>18.0%} "
+              f"{recent_chars + int(np.mean(recalled_chars)):>14}")
+        print(f"{'everything':<12} {1:>7.0%} {'':>18} {all_chars:>14}")
+        print(f"recall latency: warm p50 {percentile(warm, 50) * 1000:.2f}ms p99 {percentile(warm, 99) * 1000:.2f}ms, "
+              f"cold p50 {percentile(cold, 50) * 1000:.2f}ms p99 {percentile(cold, 99) * 1000:.2f}ms")
+
+        # The background path: save_message queues, the worker embeds in batches and appends
+        start_write_behind()
+        memory_module.chat_memory.start(CHAT_DIR)
+        chat_id = create_new_chat("bench", "memory")
+        start = time.perf_counter()
+        for m in history:
+            save_message("bench", chat_id, m)
+        queued = time.perf_counter() - start
+        while memory_module.chat_memory.queued() or memory_module.chat_memory._queued:
+            time.sleep(0.01)
+        indexed = time.perf_counter() - start
+        memory_module.chat_memory.stop()
+        stop_write_behind()
+        stored = len(memory_module.chat_memory._load_keys(memory_module.chat_memory._paths("bench", chat_id)[1])[0])
+        print(f"background indexing: {stored} of {args.messages} messages in {indexed:.1f}s "
+              f"({stored / indexed:.0f}/s, {stub.requests} embed calls); saving them took {queued:.1f}s")
+        assert len(load_chat_messages("bench", chat_id)) == args.messages
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
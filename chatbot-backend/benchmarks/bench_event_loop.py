@@ -0,0 +1,108 @@
+# benchmarks/bench_event_loop.py
+"""Event-loop lag under a mix of file-heavy and light requests.
+
+--heavy coroutines append to and reload long chats (--messages messages
+each) while --light coroutines stand in for cheap requests that only need a
+moment of the loop. A monitor sleeps 5 ms at a time and records how late it
+wakes up. The same workload runs twice: with the chat store called directly
+on the loop (as async routes used to), and through the async API that runs
+on the file I/O pool.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_event_loop --heavy 8 --light 32 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+TICK = 0.005
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else float("nan")
+
+
+async def monitor(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def light_client(latencies: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0)  # a request that needs the loop for a moment
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def heavy_client(chat_store, chat_id: str, use_pool: bool, counter: list, stop: asyncio.Event):
+    message = {"sender": "user", "text": "x" * 400, "timestamp": "2025-01-01T00:00:00Z"}
+    while not stop.is_set():
+        if use_pool:
+            await chat_store.save_message_async("bench", chat_id, message)
+            await chat_store.load_chat_messages_async("bench", chat_id)
+        else:
+            chat_store.save_message("bench", chat_id, message)
+            chat_store.load_chat_messages("bench", chat_id)
+            await asyncio.sleep(0)
+        counter[0] += 1
+
+
+async def run(chat_store, chat_ids: list, use_pool: bool, light: int, duration: float) -> dict:
+    stop = asyncio.Event()
+    lags, latencies, counter = [], [], [0]
+    tasks = [asyncio.create_task(monitor(lags, stop))]
+    tasks += [asyncio.create_task(light_client(latencies, stop)) for _ in range(light)]
+    tasks += [asyncio.create_task(heavy_client(chat_store, c, use_pool, counter, stop)) for c in chat_ids]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return {
+        "lag_p50_ms": percentile(lags, 50) * 1000, "lag_p99_ms": percentile(lags, 99) * 1000,
+        "lag_max_ms": max(lags) * 1000, "light_p99_ms": percentile(latencies, 99) * 1000,
+        "heavy_ops_per_sec": counter[0] / duration,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--heavy", type=int, default=8)
+    parser.add_argument("--light", type=int, default=32)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The chat store reads its location at import
+        os.environ["CHATBOT_DATA_DIR"] = tmp
+        os.environ.setdefault("TRACING", "0")
+        from app import chat_store
+        from app.file_io import FILE_IO_THREADS
+        from app.file_lock import atomic_write_json
+
+        chat_ids = []
+        for i in range(args.heavy):
+            chat_id = chat_store.create_new_chat("bench", f"chat {i}")
+            atomic_write_json(Path(tmp) / "chats" / "bench" / f"{chat_id}.json", [
+                {"sender": "user", "text": f"message {n} " + "y" * 400, "timestamp": "2025-01-01T00:00:00Z"}
+                for n in range(args.messages)
+            ])
+            chat_ids.append(chat_id)
+
+        print(f"{args.heavy} heavy / {args.light} light clients, {args.messages}-message chats, "
+              f"{FILE_IO_THREADS} file I/O threads")
+        print(f"{'mode':>10} {'lag p50':>9} {'lag p99':>9} {'lag max':>9} {'light p99':>10} {'heavy/s':>8}")
+        for name, use_pool in (("on loop", False), ("I/O pool", True)):
+            r = asyncio.run(run(chat_store, chat_ids, use_pool, args.light, args.duration))
+            print(f"{name:>10} {r['lag_p50_ms']:>7.1f}ms {r['lag_p99_ms']:>7.1f}ms {r['lag_max_ms']:>7.1f}ms "
+                  f"{r['light_p99_ms']:>8.1f}ms {r['heavy_ops_per_sec']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# benchmarks/bench_library_search.py
+"""Filtered vector search: index-side candidate selection vs post-filtering.
+
+Fills a vector store with --users users' libraries (--docs documents of
+--chunks chunks each) plus per-chat attachments, then times searches
+scoped to one chat, one user's whole library, a set of three documents,
+and a chat together with its attached documents. Each runs two ways:
+
+    post-filter   rank every vector, then walk the ranking in Python and
+                  keep the first k that match (how search() used to work)
+    index-side    VectorStore.search(): the filters pick candidate ids
+                  and FAISS only scores those
+
+Both must return the same matches.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_library_search --users 50 --docs 20 --chunks 40
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+DIM = 768
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def post_filter(store, query, k, keep) -> list:
+    D, I = store.index.search(query.reshape(1, -1), store.index.ntotal)
+    found = []
+    for idx in I[0]:
+        m = store.metadata[idx]
+        if not m.get("deleted") and keep(m):
+            # Chunk text isn't held in memory
+            found.append(store._entries.entry(idx)["content"])
+            if len(found) >= k:
+                break
+    return found
+
+
+def build(store, users: int, docs: int, chunks: int, chats: int, rng) -> None:
+    now = str(datetime.now())
+    for u in range(users):
+        metadatas = []
+        for d in range(docs):
+            for c in range(chunks):
+                metadatas.append({"type": "pdf", "username": f"user{u}", "doc_id": f"u{u}d{d}", "page": c,
+                                  "content": f"user{u} doc{d} chunk{c}", "timestamp": now})
+        for chat in range(chats):
+            for c in range(chunks):
+                metadatas.append({"type": "pdf", "chat_id": f"u{u}c{chat}", "page": c,
+                                  "content": f"user{u} chat{chat} chunk{c}", "timestamp": now})
+        store.add(rng.standard_normal((len(metadatas), DIM), dtype=np.float32), metadatas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--chats", type=int, default=5, help="chats per user with their own attachment")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHATBOT_DATA_DIR"] = tmp
+        os.environ.setdefault("TRACING", "0")
+        from app.vector_index import VectorStore
+
+        rng = np.random.default_rng(0)
+        store = VectorStore(dim=DIM, path=Path(tmp) / "vector_store")
+        build(store, args.users, args.docs, args.chunks, args.chats, rng)
+        queries = rng.standard_normal((args.queries, DIM), dtype=np.float32)
+        docs = ["u7d1", "u7d4", "u7d9"]
+
+        scenarios = {
+            "one chat": (dict(chat_id="u7c2"), lambda m: m.get("chat_id") == "u7c2"),
+            "user library": (dict(username="user7"), lambda m: m.get("username") == "user7"),
+            "3 documents": (dict(username="user7", doc_ids=docs),
+                            lambda m: m.get("username") == "user7" and m.get("doc_id") in docs),
+            "chat + 3 documents": (dict(chat_id="u7c2", username="user7", doc_ids=docs),
+                                   lambda m: m.get("chat_id") == "u7c2"
+                                   or (m.get("username") == "user7" and m.get("doc_id") in docs)),
+        }
+
+        print(f"{store.index.ntotal} vectors ({args.users} users x {args.docs} documents x {args.chunks} chunks "
+              f"+ {args.chats} chats each), k={args.k}")
+        print(f"{'filter':<20} {'post-filter p50':>16} {'index-side p50':>15} {'p99':>9} {'speedup':>8} {'same':>5}")
+        for name, (filters, keep) in scenarios.items():
+            post, indexed, same = [], [], True
+            for q in queries:
+                start = time.perf_counter()
+                expected = post_filter(store, q, args.k, keep)
+                post.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                got = store.search(q, k=args.k, **filters)
+                indexed.append(time.perf_counter() - start)
+                same &= [r["content"].split("]: ", 1)[1] for r in got] == expected
+            p50_post, p50_idx = percentile(post, 50), percentile(indexed, 50)
+            print(f"{name:<20} {p50_post * 1000:>14.2f}ms {p50_idx * 1000:>13.2f}ms "
+                  f"{percentile(indexed, 99) * 1000:>7.2f}ms {p50_post / p50_idx:>7.1f}x {'yes' if same else 'NO':>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_login.py
+"""Login latency versus number of users in users.csv.
+
+Users are hashed with a low iteration count so the numbers show the cost of
+finding the user, not of PBKDF2 itself (which is constant per login anyway).
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_login --sizes 1000,10000,100000
+"""
+import argparse
+import csv
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from app.user_store import UserStore, check_credentials, hash_password
+
+ITERATIONS = 1_000
+
+
+def write_users(path: Path, n: int):
+    # One real hash reused for every row keeps setup fast at 100k users
+    encoded = hash_password("secret", iterations=ITERATIONS)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["username", "password_hash", "profile_pic"])
+        for i in range(n):
+            writer.writerow([f"user{i}", encoded, f"https://example.com/{i}.png"])
+
+
+def linear_scan(path: Path, username: str):
+    """The previous implementation, for comparison."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["username"] == username:
+                return row["profile_pic"]
+    return None
+
+
+def run(n: int, logins: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "users.csv"
+        write_users(path, n)
+
+        start = time.perf_counter()
+        store = UserStore(path)
+        load_ms = (time.perf_counter() - start) * 1e3
+
+        names = [f"user{random.randrange(n)}" for _ in range(logins)]
+        start = time.perf_counter()
+        for name in names:
+            assert check_credentials(name, "secret", store=store)
+        indexed_us = (time.perf_counter() - start) / logins * 1e6
+
+        scans = max(1, logins // 50)
+        start = time.perf_counter()
+        for name in names[:scans]:
+            linear_scan(path, name)
+        scan_us = (time.perf_counter() - start) / scans * 1e6
+
+    return {"users": n, "load_ms": load_ms, "indexed_us": indexed_us, "scan_us": scan_us}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--logins", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'load ms':>9} {'login us':>10} {'csv scan us':>12}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        r = run(n, args.logins)
+        print(f"{r['users']:>8} {r['load_ms']:>9.1f} {r['indexed_us']:>10.1f} {r['scan_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/bench_ollama_pool.py
+"""Generations against one Ollama server vs a pool of --nodes stub servers.
+
+Each stub node runs --parallel generations at full speed and slows down
+beyond that, keeps at most one model in memory and takes --load-seconds to
+load another, like a GPU that fits one model. Turns arrive at --rate per
+second for --duration seconds and are split evenly across two models:
+
+    one node      OLLAMA_URLS with a single server
+    least busy    the pool, fewest outstanding requests, blind to models
+                  (OLLAMA_POOL_LOAD_COST=0): the models keep evicting
+                  each other
+    model-aware   the pool, preferring nodes with the model loaded
+    node down     model-aware, with one node stopped halfway through
+
+The pool's health check runs every second. "loads" counts model loads on
+all nodes; "errors" requests that failed even after retries.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_ollama_pool --nodes 3 --rate 3 --duration 30
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+MODELS = ("llama3.2", "qwen2.5")
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run(nodes: int, load_cost: float, kill_one: bool, arrivals, args) -> dict:
+    from app.ollama_client import OllamaClient, OllamaError
+    from benchmarks.stub_ollama import StubOllama
+
+    stubs = [StubOllama(port=0, generate_latency=0.2, parallel=args.parallel,
+                        tokens_per_second=args.tokens_per_second, response_tokens=args.response_tokens,
+                        models=MODELS, load_seconds=args.load_seconds, max_loaded=1).start() for _ in range(nodes)]
+    pool = OllamaClient([s.url for s in stubs], name="bench", load_cost=load_cost)
+    stop = threading.Event()
+
+    def health():
+        while not stop.wait(1):
+            pool.check_health()
+
+    threading.Thread(target=health, daemon=True).start()
+    results = []
+    lock = threading.Lock()
+
+    def one(model):
+        start = time.perf_counter()
+        try:
+            pool.generate({"model": model, "prompt": "hello " * 50})
+            outcome = "ok"
+        except OllamaError:
+            outcome = "error"
+        with lock:
+            results.append((outcome, time.perf_counter() - start))
+
+    threads = []
+    t0 = time.perf_counter()
+    killed = False
+    for at, model in arrivals:
+        delay = at - (time.perf_counter() - t0)
+        if delay > 0:
+            time.sleep(delay)
+        if kill_one and not killed and at >= args.duration / 2:
+            stubs[-1].stop()
+            killed = True
+        t = threading.Thread(target=one, args=(model,))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    for stub in stubs[:-1] if killed else stubs:
+        stub.stop()
+
+    ok = [seconds for outcome, seconds in results if outcome == "ok"]
+    return {"p50": percentile(ok, 50), "p99": percentile(ok, 99), "throughput": len(ok) / elapsed,
+            "errors": len(results) - len(ok), "loads": sum(s.loads for s in stubs)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=3, help="generations per second")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--parallel", type=int, default=2, help="generations a node runs at full speed")
+    parser.add_argument("--load-seconds", type=float, default=2)
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("TRACING", "0")
+    rng = random.Random(0)
+    arrivals, at = [], 0.0
+    while True:
+        at += rng.expovariate(args.rate)
+        if at >= args.duration:
+            break
+        arrivals.append((at, rng.choice(MODELS)))
+
+    print(f"{len(arrivals)} generations over {args.duration:.0f}s on {len(MODELS)} models; nodes hold one model, "
+          f"{args.load_seconds:.0f}s to load another, {args.parallel} generations at full speed")
+    print(f"{'setting':<12} {'p50':>7} {'p99':>7} {'throughput':>11} {'errors':>7} {'loads':>6}")
+    for name, nodes, load_cost, kill_one in (("one node", 1, 0, False), ("least busy", args.nodes, 0, False),
+                                             ("model-aware", args.nodes, 4, False),
+                                             ("node down", args.nodes, 4, True)):
+        r = run(nodes, load_cost, kill_one, arrivals, args)
+        print(f"{name:<12} {r['p50']:>6.2f}s {r['p99']:>6.2f}s {r['throughput']:>9.2f}/s {r['errors']:>7} "
+              f"{r['loads']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_quantization.py
+"""Memory, recall and latency of each VECTOR_QUANTIZATION setting.
+
+Builds a store of --vectors 768-dim vectors per setting (shaped like real
+embeddings: --clusters centres, variation along a few dozen latent
+directions, a little isotropic noise) and runs --queries searches over the
+whole store and within one chat. Recall@k is measured against exact
+float32 search; quantized settings are run at each --rerank factor. "RAM @10M" extrapolates the index's resident size to
+ten million chunks; the exact vectors of quantized stores stay on disk in
+a memory-mapped file (3 KB each) and only re-ranked rows are paged in.
+Metadata is not included.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_quantization --vectors 200000 --rerank 1,4,16
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+DIM = 768
+CHATS = 100
+LATENT = 48
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def dataset(n: int, clusters: int, queries: int, rng):
+    centres = rng.standard_normal((clusters, DIM), dtype=np.float32)
+    directions = rng.standard_normal((LATENT, DIM), dtype=np.float32) / np.sqrt(LATENT)
+    vectors = (centres[rng.integers(0, clusters, n)] + rng.standard_normal((n, LATENT), dtype=np.float32) @ directions
+               + 0.05 * rng.standard_normal((n, DIM), dtype=np.float32))
+    # Unit length, as the store keeps them: exact L2 order is then cosine order
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = rng.integers(0, n, queries)
+    return vectors, vectors[picks] + 0.1 / np.sqrt(DIM) * rng.standard_normal((queries, DIM), dtype=np.float32)
+
+
+def exact_top(vectors, query, k, rows=None):
+    candidates = np.arange(len(vectors)) if rows is None else rows
+    d = ((vectors[candidates] - query) ** 2).sum(axis=1)
+    return set(candidates[np.argsort(d)[:k]].tolist())
+
+
+def run(vector_index, quantization, rerank, path, vectors, queries, k) -> dict:
+    vector_index.VECTOR_RERANK_FACTOR = rerank
+    now = str(datetime.now())
+    metadata = [{"type": "pdf", "chat_id": f"chat{i % CHATS}", "page": i, "content": str(i), "timestamp": now}
+                for i in range(len(vectors))]
+    start = time.perf_counter()
+    store = vector_index.VectorStore(dim=DIM, path=path, quantization=quantization)
+    store.add(vectors, metadata)
+    build = time.perf_counter() - start
+    chat_rows = np.arange(7, len(vectors), CHATS)
+
+    result = {"build_s": build, "bytes_per_vector": store.memory_bytes() / len(vectors)}
+    for scope, filters, rows in (("all", {}, None), ("chat", {"chat_id": "chat7"}, chat_rows)):
+        latencies, recall = [], 0.0
+        for q in queries:
+            t = time.perf_counter()
+            found = store.search(q, k=k, time_window_minutes=None, **filters)
+            latencies.append(time.perf_counter() - t)
+            ids = {int(r["content"].split("]: ", 1)[1]) for r in found}
+            recall += len(ids & exact_top(vectors, q, k, rows)) / k
+        result[scope] = {"p50_ms": percentile(latencies, 50) * 1000, "p99_ms": percentile(latencies, 99) * 1000,
+                         "recall": recall / len(queries)}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--rerank", default="1,4,16", help="comma-separated VECTOR_RERANK_FACTOR values")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHATBOT_DATA_DIR"] = tmp
+        os.environ.setdefault("TRACING", "0")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        from app import vector_index
+
+        vectors, queries = dataset(args.vectors, args.clusters, args.queries, np.random.default_rng(0))
+        factors = [int(f) for f in args.rerank.split(",")]
+        configs = [("flat", 1)] + [(q, f) for q in ("fp16", "int8", "pq") for f in factors]
+
+        print(f"{args.vectors} vectors, {args.queries} queries, recall@{args.k} against exact search; "
+              f"pq uses {vector_index.VECTOR_PQ_M} bytes per vector")
+        print(f"{'setting':<12} {'B/vector':>9} {'RAM @10M':>9} {'build s':>8} "
+              f"{'all p50':>8} {'p99':>7} {'recall':>7} {'chat p50':>9} {'p99':>7} {'recall':>7}")
+        for n, (quantization, rerank) in enumerate(configs):
+            r = run(vector_index, quantization, rerank, Path(tmp) / f"store{n}", vectors, queries, args.k)
+            name = quantization if quantization == "flat" else f"{quantization} x{rerank}"
+            ram_gib = r["bytes_per_vector"] * 10_000_000 / 2 ** 30
+            print(f"{name:<12} {r['bytes_per_vector']:>9.0f} {ram_gib:>7.1f}Gi {r['build_s']:>8.1f} "
+                  f"{r['all']['p50_ms']:>6.1f}ms {r['all']['p99_ms']:>5.1f}ms {r['all']['recall']:>7.3f} "
+                  f"{r['chat']['p50_ms']:>7.2f}ms {r['chat']['p99_ms']:>5.2f}ms {r['chat']['recall']:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# benchmarks/bench_retention.py
+"""Bytes and search time reclaimed by one vector retention pass.
+
+Builds a store where part of the vectors are past the retention window and
+part belong to deleted chats, then runs app.retention once.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_retention --vectors 100000 --expired 0.6 --orphaned 0.1
+"""
+import argparse
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+from app import retention, vector_index
+
+
+def run(vectors: int, expired: float, orphaned: float, chats: int = 50, dim: int = 768) -> dict:
+    tmp = tempfile.TemporaryDirectory()
+    store = vector_index.VectorStore(dim, Path(tmp.name) / "vector_store")
+
+    chat_dir = Path(tmp.name) / "chats"
+    (chat_dir / "user").mkdir(parents=True)
+    live = [f"chat-{i}" for i in range(chats)]
+    with open(chat_dir / "user" / "chat_list.json", "w") as f:
+        json.dump([{"id": c, "title": c} for c in live], f)
+
+    rng = np.random.default_rng(0)
+    now = datetime.now()
+    old = now - timedelta(minutes=retention.VECTOR_RETENTION_MINUTES * 2)
+    roll = rng.random(vectors)
+    metadatas = [
+        {"type": "pdf", "page": 0, "content": "x" * 200,
+         "chat_id": "gone" if r < orphaned else live[i % chats],
+         "timestamp": str(old if orphaned <= r < orphaned + expired else now)}
+        for i, r in enumerate(roll)
+    ]
+    for start in range(0, vectors, 10000):
+        store.add(rng.random((min(10000, vectors - start), dim), dtype=np.float32), metadatas[start:start + 10000])
+
+    query = rng.random(dim, dtype=np.float32)
+    started = time.perf_counter()
+    store.search(query, k=5)
+    search_before = time.perf_counter() - started
+
+    started = time.perf_counter()
+    report = retention.run_retention(store, chat_dir)
+    report["compaction_seconds"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    store.search(query, k=5)
+    report["search_ms_before"] = round(search_before * 1000, 1)
+    report["search_ms_after"] = round((time.perf_counter() - started) * 1000, 1)
+    tmp.cleanup()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--expired", type=float, default=0.6, help="fraction past the retention window")
+    parser.add_argument("--orphaned", type=float, default=0.1, help="fraction belonging to deleted chats")
+    args = parser.parse_args()
+    print(json.dumps(run(args.vectors, args.expired, args.orphaned), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# benchmarks/bench_routing.py
+"""Latency of a mixed workload: everything on one model vs model routing.
+
+A stub Ollama serves "llama3.2:1b" --speedup times faster than "llama3.2"
+and slows everything down beyond --parallel concurrent generations, like
+one GPU shared by both. Turns arrive at --rate per second; a --long share
+of them carry a long prompt (history plus retrieved document passages),
+the rest a short one. Each turn goes through ModelRouter.choose, a
+scheduler slot and model_manager.generate, as in generate_llm_response:
+
+    pinned        model_id "llama3.2": every turn on the large model
+    size          model_id "auto", MODEL_ROUTING_BALANCE=0: short prompts
+                  on the small model, long ones on the large
+    size + load   model_id "auto": a short prompt can also go to the large
+                  model when that is expected to answer sooner
+
+"long on 1b" counts long prompts sent to the small model (should be 0).
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_routing --rate 4 --duration 40 --long 0.05
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+ROUTES = [
+    {"model": "llama3.2:1b", "max_prompt_chars": 2000},
+    {"model": "llama3.2"},
+]
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run(model_id: str, balance: bool, arrivals, args) -> dict:
+    from app.model_manager import model_manager
+    from app.model_router import ModelRouter
+    from app.scheduler import QueueFullError, scheduler
+
+    specs = {"auto": {"name": "Auto", "routes": ROUTES}, "llama3.2": {"name": "Llama 3.2", "routes": ROUTES[1:]}}
+    router = ModelRouter(specs=lambda: specs, balance=balance)
+    results = []
+    lock = threading.Lock()
+
+    def one(n, prompt_chars):
+        start = time.perf_counter()
+        prompt = "word " * (prompt_chars // 5)
+        route = router.choose(model_id, len(prompt))
+        try:
+            with scheduler.slot(route.model, f"user{n % args.users}", len(prompt)):
+                data = model_manager.generate({"model": route.model, "prompt": prompt})
+            outcome = "ok"
+            router.record(route, time.perf_counter() - start, len(prompt), data)
+        except QueueFullError:
+            outcome = "rejected"
+        with lock:
+            results.append((prompt_chars > ROUTES[0]["max_prompt_chars"], route.model, outcome,
+                            time.perf_counter() - start))
+
+    threads = []
+    t0 = time.perf_counter()
+    for n, (at, prompt_chars) in enumerate(arrivals):
+        delay = at - (time.perf_counter() - t0)
+        if delay > 0:
+            time.sleep(delay)
+        t = threading.Thread(target=one, args=(n, prompt_chars))
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    def latencies(long):
+        return [s for is_long, _, outcome, s in results if is_long == long and outcome == "ok"]
+
+    short, long_ = latencies(False), latencies(True)
+    return {
+        "short_p50": percentile(short, 50), "short_p99": percentile(short, 99),
+        "long_p50": percentile(long_, 50), "long_p99": percentile(long_, 99),
+        "small_share": sum(1 for _, model, _, _ in results if model == ROUTES[0]["model"]) / len(results),
+        "long_on_small": sum(1 for is_long, model, _, _ in results if is_long and model == ROUTES[0]["model"]),
+        "rejected": sum(1 for _, _, outcome, _ in results if outcome != "ok"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=4, help="chat turns per second")
+    parser.add_argument("--duration", type=float, default=40)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--long", type=float, default=0.05, help="share of turns with a long prompt")
+    parser.add_argument("--parallel", type=int, default=8, help="generations the stub runs at full speed")
+    parser.add_argument("--speedup", type=float, default=3, help="how much faster the small model is")
+    parser.add_argument("--tokens-per-second", type=float, default=40, help="of the large model")
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=400, help="of the large model")
+    parser.add_argument("--response-tokens", type=int, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHATBOT_DATA_DIR"] = tmp
+        os.environ.setdefault("TRACING", "0")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        os.environ["MODEL_WARMUP"] = "0"
+        os.environ.setdefault("GENERATION_MAX_QUEUE", "1000")
+        from benchmarks.stub_ollama import StubOllama
+        stub = StubOllama(port=0, generate_latency=0.2, parallel=args.parallel,
+                          tokens_per_second=args.tokens_per_second,
+                          prompt_tokens_per_second=args.prompt_tokens_per_second,
+                          response_tokens=args.response_tokens, speedups={ROUTES[0]["model"]: args.speedup}).start()
+        os.environ["OLLAMA_URL"] = stub.url
+        from app.model_manager import model_manager
+
+        # Both models resident, as after warm-up
+        for route in ROUTES:
+            model_manager.generate({"model": route["model"], "prompt": "warm up"})
+
+        rng = random.Random(0)
+        arrivals, at = [], 0.0
+        while True:
+            at += rng.expovariate(args.rate)
+            if at >= args.duration:
+                break
+            arrivals.append((at, rng.randint(3000, 12000) if rng.random() < args.long else rng.randint(100, 1500)))
+
+        print(f"{len(arrivals)} turns over {args.duration:.0f}s, {args.long:.0%} long; small model "
+              f"{args.speedup:.0f}x faster, {args.parallel} generations at full speed")
+        print(f"{'routing':<12} {'short p50':>9} {'short p99':>9} {'long p50':>9} {'long p99':>9} "
+              f"{'on 1b':>6} {'long on 1b':>10} {'rejected':>8}")
+        # Pinned last: its backlog would leave the large model's slot times inflated for the others
+        for name, model_id, balance in (("size", "auto", False), ("size + load", "auto", True),
+                                        ("pinned", "llama3.2", False)):
+            r = run(model_id, balance, arrivals, args)
+            print(f"{name:<12} {r['short_p50']:>8.2f}s {r['short_p99']:>8.2f}s {r['long_p50']:>8.2f}s "
+                  f"{r['long_p99']:>8.2f}s {r['small_share']:>6.0%} {r['long_on_small']:>10} {r['rejected']:>8}")
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
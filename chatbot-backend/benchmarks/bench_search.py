@@ -0,0 +1,90 @@
+# benchmarks/bench_search.py
+"""Search latency over a large synthetic message history.
+
+Builds an index of --messages messages spread over --users users (10
+messages per chat) with Zipf-distributed words, then times ranked,
+paginated two-word queries for one user.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_search --messages 1000000
+"""
+import argparse
+import itertools
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from app.search_index import SearchIndex
+
+VOCABULARY = 20_000
+
+
+def make_words(rng):
+    words = set()
+    while len(words) < VOCABULARY:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))))
+    return sorted(words)
+
+
+def zipf_sampler(rng, words):
+    # Word frequencies in real text follow Zipf's law: weight 1/rank
+    cum_weights = list(itertools.accumulate(1 / (r + 1) for r in range(len(words))))
+    return lambda k: rng.choices(words, cum_weights=cum_weights, k=k)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = make_words(rng)
+    rng.shuffle(words)
+    sample = zipf_sampler(rng, words)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SearchIndex(Path(tmp) / "search.db")
+
+        start = time.perf_counter()
+        chats = args.messages // 10
+        for c in range(chats):
+            username = f"user{c % args.users}"
+            messages = [
+                {"id": f"{c}-{i}", "sender": "user" if i % 2 else "bot", "timestamp": f"{c:08d}{i:02d}",
+                 "text": " ".join(sample(rng.randint(8, 40)))}
+                for i in range(10)
+            ]
+            index.index_messages(username, f"chat{c}", messages)
+        build_s = time.perf_counter() - start
+        db_mb = (Path(tmp) / "search.db").stat().st_size / 1e6
+
+        timings = {}
+        for label, page in (("page 1", 1), ("page 5", 5)):
+            latencies = []
+            for _ in range(args.queries):
+                q = " ".join(sample(2))
+                t0 = time.perf_counter()
+                index.search("user7", q, page=page, page_size=20)
+                latencies.append((time.perf_counter() - t0) * 1e3)
+            timings[label] = latencies
+
+        t0 = time.perf_counter()
+        removed = index.remove_chat("user7", "chat7")
+        delete_ms = (time.perf_counter() - t0) * 1e3
+
+    print(f"indexed {args.messages} messages in {build_s:.1f}s ({db_mb:.0f} MB)")
+    for label, latencies in timings.items():
+        print(f"{label}: p50 {percentile(latencies, 50):.2f} ms, p99 {percentile(latencies, 99):.2f} ms")
+    print(f"remove_chat ({removed} messages): {delete_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
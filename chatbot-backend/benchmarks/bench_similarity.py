@@ -0,0 +1,127 @@
+# benchmarks/bench_similarity.py
+"""Relevance and latency of L2 on raw embeddings versus cosine similarity.
+
+Embeddings come back from Ollama un-normalized, with lengths that vary
+from chunk to chunk, and share a large common component (unrelated texts
+still score around 0.5). The corpus here is --topics topics of --chunks
+chunks each, built the same way: common direction, topic direction and
+noise, at a random length. Queries come from stored topics (precision@k
+counts chunks of the query's topic) and from topics that aren't stored at
+all (these should find nothing).
+
+    l2       VECTOR_METRIC=l2, raw vectors (the old behaviour)
+    cosine   VECTOR_METRIC=cosine, no score threshold
+    cosine ≥ --min-score   results below the threshold are dropped
+
+The last line times converting a stored l2 index to cosine, as the first
+start after upgrading does.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_similarity --topics 500 --chunks 100 --min-score 0.64
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+DIM = 768
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def embeddings(common, centres, per_topic, rng):
+    topics = np.repeat(np.arange(len(centres)), per_topic)
+    vectors = (1.2 * common + 0.7 * centres[topics]
+               + rng.standard_normal((len(topics), DIM), dtype=np.float32))
+    vectors *= rng.lognormal(0, 0.8, (len(topics), 1)).astype(np.float32)
+    return vectors, topics
+
+
+def run(store, queries, query_topics, k, min_score=None) -> dict:
+    latencies, precision, found_any, top = [], [], 0, []
+    for q, topic in zip(queries, query_topics):
+        start = time.perf_counter()
+        results = store.search(q, k=k, time_window_minutes=None, min_score=min_score)
+        latencies.append(time.perf_counter() - start)
+        hits = [int(r["content"].split("]: ", 1)[1]) for r in results]
+        if topic >= 0:
+            precision.append(sum(1 for h in hits if h == topic) / k)
+        elif hits:
+            found_any += 1
+        if results and "score" in results[0]:
+            top.append((topic >= 0, results[0]["score"]))
+    off_topic = sum(1 for t in query_topics if t < 0)
+    return {"precision": float(np.mean(precision)), "off_topic_answered": found_any / off_topic,
+            "p50_ms": percentile(latencies, 50) * 1000, "p99_ms": percentile(latencies, 99) * 1000, "top": top}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--chunks", type=int, default=100, help="chunks per topic")
+    parser.add_argument("--queries", type=int, default=200, help="half on stored topics, half off-topic")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--min-score", type=float, default=0.64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CHATBOT_DATA_DIR"] = tmp
+        os.environ.setdefault("TRACING", "0")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        import faiss
+        from app import vector_format
+        from app.vector_index import VectorStore
+
+        rng = np.random.default_rng(0)
+        common = rng.standard_normal(DIM, dtype=np.float32)
+        centres = rng.standard_normal((args.topics * 2, DIM), dtype=np.float32)
+        vectors, topics = embeddings(common, centres[:args.topics], args.chunks, rng)
+        now = str(datetime.now())
+        # The chunk's content is its topic, so results can be scored
+        metadata = [{"type": "pdf", "chat_id": "bench", "page": 0, "content": str(t), "timestamp": now}
+                    for t in topics]
+        half = args.queries // 2
+        on_topic = rng.integers(0, args.topics, half)
+        off_topic = rng.integers(args.topics, args.topics * 2, args.queries - half)
+        queries, _ = embeddings(common, centres[np.concatenate([on_topic, off_topic])], 1, rng)
+        query_topics = np.concatenate([on_topic, np.full(len(off_topic), -1)])
+
+        stores = {}
+        for metric in ("l2", "cosine"):
+            stores[metric] = VectorStore(dim=DIM, path=Path(tmp) / metric, metric=metric)
+            stores[metric].add(vectors, metadata)
+
+        print(f"{len(vectors)} vectors ({args.topics} topics x {args.chunks}), {args.queries} queries, k={args.k}")
+        print(f"{'setting':<16} {'precision@k':>11} {'off-topic answered':>19} {'p50':>8} {'p99':>8}")
+        rows = [("l2", stores["l2"], None), ("cosine", stores["cosine"], None),
+                (f"cosine >= {args.min_score}", stores["cosine"], args.min_score)]
+        for name, store, min_score in rows:
+            r = run(store, queries, query_topics, args.k, min_score)
+            print(f"{name:<16} {r['precision']:>11.3f} {r['off_topic_answered']:>18.0%} "
+                  f"{r['p50_ms']:>6.2f}ms {r['p99_ms']:>6.2f}ms")
+            if name == "cosine":
+                on = [s for related, s in r["top"] if related]
+                off = [s for related, s in r["top"] if not related]
+                top_scores = (f"top-1 score: stored topics p5 {percentile(on, 5):.2f}, "
+                              f"off-topic p95 {percentile(off, 95):.2f}")
+        print(top_scores)
+
+        # Migration: a store written before VECTOR_METRIC existed
+        old = Path(tmp) / "old"
+        index = faiss.IndexFlatL2(DIM)
+        index.add(vectors)
+        vector_format.save_store(old, index, metadata)
+        start = time.perf_counter()
+        VectorStore(dim=DIM, path=old, metric="cosine")
+        print(f"converting {len(vectors)} stored l2 vectors to cosine: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_workers.py
+"""Concurrent chat throughput versus uvicorn worker count.
+
+Starts a stub Ollama, then `python -m app.serve --workers N` against a
+scratch data directory for each N, and drives concurrent chat turns.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_workers --workers 1,2,4,8 --clients 32
+"""
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from benchmarks.stub_ollama import StubOllama
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def client(base: str, turns: int) -> int:
+    s = requests.Session()
+    # Each request may land on a different worker, so login must be shared
+    token = s.post(f"{base}/auth/login", json={"username": "user", "password": "123"}).json()["token"]
+    s.headers["Authorization"] = f"Bearer {token}"
+    chat_id = s.post(f"{base}/chat/chat/new", json={"title": "bench"}).json()["chat_id"]
+    ok = 0
+    for i in range(turns):
+        r = s.post(f"{base}/chat/chat/{chat_id}/send", data={"text": f"turn {i}", "model_id": "llama3.2"})
+        ok += r.status_code == 200
+    return ok
+
+
+def run(workers: int, clients: int, turns: int, ollama_url: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "data"
+        data_dir.mkdir()
+        shutil.copy(BACKEND_DIR / "data" / "users.csv", data_dir / "users.csv")
+        port = free_port()
+        env = dict(
+            os.environ,
+            PYTHONPATH=str(BACKEND_DIR),
+            CHATBOT_DATA_DIR=str(data_dir),
+            OLLAMA_URL=ollama_url,
+            PASSWORD_HASH_ITERATIONS="1000",
+        )
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "app.serve", "--port", str(port), "--workers", str(workers),
+             "--vector-service", f"127.0.0.1:{free_port()}"],
+            cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_up(base + "/")
+            # Warm-up round so every worker has finished importing before timing
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                list(pool.map(lambda _: client(base, 1), range(clients)))
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                ok = sum(pool.map(lambda _: client(base, turns), range(clients)))
+            elapsed = time.perf_counter() - start
+        finally:
+            proc.terminate()
+            proc.wait()
+    return {"workers": workers, "turns": clients * turns, "ok": ok, "turns_per_sec": ok / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--generate-latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub = StubOllama(port=free_port(), generate_latency=args.generate_latency).start()
+    print(f"{'workers':>8} {'turns':>6} {'ok':>6} {'turns/s':>8}")
+    for n in (int(w) for w in args.workers.split(",")):
+        r = run(n, args.clients, args.turns, stub.url)
+        print(f"{r['workers']:>8} {r['turns']:>6} {r['ok']:>6} {r['turns_per_sec']:>8.1f}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# benchmarks/bench_write_behind.py
+"""Chat turns per second with and without write-behind, per fsync policy.
+
+A turn is what send_message does around generation: save the user message,
+load the history, save the reply. --clients threads run --turns turns each
+on their own chat whose history already has --history messages. Every
+configuration runs in a fresh process and data directory:
+
+    sync       CHAT_WRITE_BEHIND=0, a full chat file rewrite per message
+    off / interval / always    write-behind with that CHAT_FSYNC policy
+
+The crash test then starts a writer per policy, SIGKILLs it mid-stream,
+and lets a new process recover the journal: every message the writer had
+acknowledged must be in its chat file.
+
+Run from chatbot-backend/:
+    python -m benchmarks.bench_write_behind --clients 8 --turns 50
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+MODES = ("sync", "off", "interval", "always")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def message(sender: str, n: int) -> dict:
+    return {"id": str(uuid.uuid4()), "sender": sender, "text": f"{sender} message {n} " + "x" * 300,
+            "timestamp": f"2025-01-01T00:00:{n % 60:02d}.{n:06d}Z"}
+
+
+def child_turns(clients: int, turns: int, history: int):
+    from app import chat_store
+    from app.file_lock import atomic_write_json
+    chat_store.start_write_behind()
+    chat_ids = []
+    for c in range(clients):
+        chat_id = chat_store.create_new_chat("bench", f"chat {c}")
+        atomic_write_json(chat_store.CHAT_DIR / "bench" / f"{chat_id}.json",
+                          [message("user", n) for n in range(history)])
+        chat_ids.append(chat_id)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def client(chat_id):
+        mine = []
+        for n in range(turns):
+            start = time.perf_counter()
+            chat_store.save_message("bench", chat_id, message("user", n))
+            chat_store.load_chat_messages("bench", chat_id)
+            chat_store.save_message("bench", chat_id, message("bot", n))
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in chat_ids]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    chat_store.stop_write_behind()
+    complete = all(len(chat_store.load_chat_messages("bench", c)) == history + 2 * turns for c in chat_ids)
+    print(json.dumps({"turns_per_sec": clients * turns / elapsed, "p50_ms": percentile(latencies, 50) * 1000,
+                      "p99_ms": percentile(latencies, 99) * 1000, "complete": complete}))
+
+
+def child_writer():
+    """Write messages forever, printing each id once save_message has returned."""
+    from app import chat_store
+    chat_store.start_write_behind()
+    chat_id = chat_store.create_new_chat("crash", "crash")
+    print(chat_id, flush=True)
+    n = 0
+    while True:
+        m = message("user", n)
+        chat_store.save_message("crash", chat_id, m)
+        print(m["id"], flush=True)
+        n += 1
+
+
+def child_recover(chat_id: str):
+    from app import chat_store
+    chat_store.start_write_behind()
+    ids = [m["id"] for m in chat_store.load_chat_messages("crash", chat_id)]
+    chat_store.stop_write_behind()
+    print(json.dumps(ids))
+
+
+def run_child(args: list, env: dict, **kwargs):
+    return subprocess.run([sys.executable, "-m", "benchmarks.bench_write_behind"] + args,
+                          env=env, capture_output=True, text=True, check=True, **kwargs)
+
+
+def env_for(mode: str, data_dir: str) -> dict:
+    env = dict(os.environ, CHATBOT_DATA_DIR=data_dir, TRACING="0", LOG_LEVEL="WARNING")
+    if mode == "sync":
+        env["CHAT_WRITE_BEHIND"] = "0"
+    else:
+        env.update(CHAT_WRITE_BEHIND="1", CHAT_FSYNC=mode)
+    return env
+
+
+def crash_test(mode: str, acked_target: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = env_for(mode, tmp)
+        proc = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_write_behind", "--child", "writer"],
+                                env=env, stdout=subprocess.PIPE, text=True)
+        chat_id = proc.stdout.readline().strip()
+        acked = []
+        while len(acked) < acked_target:
+            acked.append(proc.stdout.readline().strip())
+        os.kill(proc.pid, signal.SIGKILL)
+        proc.wait()
+        # Ids printed after the ones we read were acknowledged too
+        acked += [line.strip() for line in proc.stdout.read().splitlines() if line.strip()]
+        recovered = set(json.loads(run_child(["--child", "recover", "--chat-id", chat_id], env).stdout))
+        return {"acked": len(acked), "lost": sum(1 for i in acked if i not in recovered)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--history", type=int, default=200)
+    parser.add_argument("--crash-after", type=int, default=500, help="acknowledged writes before the kill")
+    parser.add_argument("--child", choices=("turns", "writer", "recover"), help=argparse.SUPPRESS)
+    parser.add_argument("--chat-id", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "turns":
+        return child_turns(args.clients, args.turns, args.history)
+    if args.child == "writer":
+        return child_writer()
+    if args.child == "recover":
+        return child_recover(args.chat_id)
+
+    print(f"{args.clients} clients x {args.turns} turns, {args.history}-message histories")
+    print(f"{'mode':>9} {'turns/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'complete':>9}")
+    for mode in MODES:
+        with tempfile.TemporaryDirectory() as tmp:
+            out = run_child(["--child", "turns", "--clients", str(args.clients), "--turns", str(args.turns),
+                             "--history", str(args.history)], env_for(mode, tmp))
+        r = json.loads(out.stdout)
+        print(f"{mode:>9} {r['turns_per_sec']:>8.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{'yes' if r['complete'] else 'NO':>9}")
+
+    print(f"\ncrash test (SIGKILL after {args.crash_after} acknowledged writes)")
+    print(f"{'mode':>9} {'acked':>7} {'lost':>5}")
+    for mode in MODES[1:]:
+        r = crash_test(mode, args.crash_after)
+        print(f"{mode:>9} {r['acked']:>7} {r['lost']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/load_cancellation.py
+"""Load test with many abandoned requests, with and without cancellation.
+
+Starts a stub Ollama that decodes at --tokens-per-second and slows down
+beyond --parallel concurrent generations (like a GPU), then the backend
+(`python -m app.serve`) once with GENERATION_CANCEL=1 and once with 0.
+Chat turns arrive at --rate per second for --duration seconds, each in a
+chat of its own. An --abandon fraction of clients hang up after 0.5-3 s,
+like users leaving the page; the rest wait up to --timeout seconds.
+
+Reported per mode: latency and completion of the patient requests, the
+tokens the stub generated in total, and the bot replies stored for
+abandoned requests (written for nobody).
+
+Run from chatbot-backend/:
+    python -m benchmarks.load_cancellation --rate 1.5 --duration 40 --abandon 0.5
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from benchmarks.bench_workers import BACKEND_DIR, free_port, wait_until_up
+from benchmarks.stub_ollama import StubOllama
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run(cancel: bool, stub: StubOllama, arrivals, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp) / "data"
+        data_dir.mkdir()
+        shutil.copy(BACKEND_DIR / "data" / "users.csv", data_dir / "users.csv")
+        port = free_port()
+        env = dict(
+            os.environ, PYTHONPATH=str(BACKEND_DIR), CHATBOT_DATA_DIR=str(data_dir), OLLAMA_URL=stub.url,
+            PASSWORD_HASH_ITERATIONS="1000", MODEL_WARMUP="0", TRACING="0", LOG_LEVEL="WARNING",
+            GENERATION_CANCEL="1" if cancel else "0", GENERATION_CONCURRENCY=str(args.parallel),
+            GENERATION_MAX_QUEUE="1000", GENERATION_QUEUE_TIMEOUT_SECONDS=str(args.timeout),
+        )
+        proc = subprocess.Popen([sys.executable, "-m", "app.serve", "--port", str(port)],
+                                cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base = f"http://127.0.0.1:{port}"
+        try:
+            wait_until_up(base + "/")
+            token = requests.post(f"{base}/auth/login", json={"username": "user", "password": "123"}).json()["token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            chats = [requests.post(f"{base}/chat/chat/new", json={"title": "load"}, headers=headers).json()["chat_id"]
+                     for _ in arrivals]
+            tokens_before = stub.tokens
+            results = []
+            lock = threading.Lock()
+
+            def one(chat_id, give_up_after):
+                start = time.perf_counter()
+                try:
+                    r = requests.post(f"{base}/chat/chat/{chat_id}/send", headers=headers,
+                                      data={"text": "hello " * 50, "model_id": "llama3.2"},
+                                      timeout=give_up_after or args.timeout)
+                    outcome = "ok" if r.status_code == 200 else str(r.status_code)
+                except requests.Timeout:
+                    outcome = "abandoned" if give_up_after else "timeout"
+                with lock:
+                    results.append((give_up_after is not None, outcome, time.perf_counter() - start))
+
+            threads = []
+            t0 = time.perf_counter()
+            for chat_id, (at, give_up_after) in zip(chats, arrivals):
+                delay = at - (time.perf_counter() - t0)
+                if delay > 0:
+                    time.sleep(delay)
+                t = threading.Thread(target=one, args=(chat_id, give_up_after))
+                t.start()
+                threads.append(t)
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - t0
+            # Let abandoned generations finish (or not) before counting what they left behind
+            deadline = time.monotonic() + args.timeout
+            while stub.inflight and time.monotonic() < deadline:
+                time.sleep(0.2)
+            time.sleep(0.5)
+            stored_for_nobody = 0
+            for chat_id, (_, give_up_after) in zip(chats, arrivals):
+                if give_up_after:
+                    messages = requests.get(f"{base}/chat/chat/{chat_id}/messages", headers=headers).json()["messages"]
+                    stored_for_nobody += sum(1 for m in messages if m["sender"] == "bot")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    patient = [(outcome, seconds) for abandoned, outcome, seconds in results if not abandoned]
+    ok = [seconds for outcome, seconds in patient if outcome == "ok"]
+    return {
+        "completed": len(ok) / len(patient) if patient else float("nan"),
+        "p50": percentile(ok, 50), "p99": percentile(ok, 99), "goodput": len(ok) / elapsed,
+        "tokens": stub.tokens - tokens_before, "stored_for_nobody": stored_for_nobody,
+        "abandoned": sum(1 for abandoned, _, _ in results if abandoned),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=1.5, help="chat turns per second")
+    parser.add_argument("--duration", type=float, default=40)
+    parser.add_argument("--abandon", type=float, default=0.5, help="fraction of clients that hang up early")
+    parser.add_argument("--timeout", type=float, default=60, help="patience of the other clients")
+    parser.add_argument("--parallel", type=int, default=2, help="generations the stub runs at full speed")
+    parser.add_argument("--tokens-per-second", type=float, default=40)
+    parser.add_argument("--response-tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    arrivals, at = [], 0.0
+    while True:
+        at += rng.expovariate(args.rate)
+        if at >= args.duration:
+            break
+        arrivals.append((at, rng.uniform(0.5, 3) if rng.random() < args.abandon else None))
+
+    stub = StubOllama(port=free_port(), generate_latency=0.2, parallel=args.parallel,
+                      tokens_per_second=args.tokens_per_second, response_tokens=args.response_tokens).start()
+    print(f"{len(arrivals)} turns over {args.duration:.0f}s, {args.abandon:.0%} abandoned after 0.5-3s; "
+          f"{args.response_tokens} tokens at {args.tokens_per_second:.0f}/s, {args.parallel} at full speed")
+    print(f"{'cancellation':<13} {'completed':>9} {'p50':>7} {'p99':>7} {'goodput':>8} "
+          f"{'tokens generated':>17} {'replies stored for nobody':>26}")
+    for cancel in (False, True):
+        r = run(cancel, stub, arrivals, args)
+        print(f"{'on' if cancel else 'off':<13} {r['completed']:>9.0%} {r['p50']:>6.1f}s {r['p99']:>6.1f}s "
+              f"{r['goodput']:>7.2f}/s {r['tokens']:>17} {r['stored_for_nobody']:>15} of {r['abandoned']:<7}")
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/load_scheduler.py
+"""Open-loop load test of the generation scheduler against a stub Ollama.
+
+The stub slows every request down once more than --parallel generations
+run at once, like a GPU does. Requests arrive at --rate per second from
+--users users; each has a client timeout of --timeout seconds. The same
+arrival pattern is replayed with and without the scheduler.
+
+Goodput counts only requests answered within --slo seconds.
+
+Run from chatbot-backend/:
+    python -m benchmarks.load_scheduler --rate 8 --duration 20
+"""
+import argparse
+import random
+import threading
+import time
+
+import requests
+
+from app.scheduler import GenerationScheduler, QueueFullError
+from benchmarks.stub_ollama import StubOllama
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def run(mode: str, url: str, arrivals, args) -> dict:
+    scheduler = GenerationScheduler(concurrency=args.parallel, per_model={},
+                                    max_queue=args.max_queue, queue_timeout=args.timeout)
+    results = []
+    lock = threading.Lock()
+
+    def one(username, prompt_len):
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            payload = {"model": "llama3.2", "prompt": "x" * prompt_len, "stream": False}
+            if mode == "scheduled":
+                with scheduler.slot("llama3.2", username, prompt_len):
+                    requests.post(f"{url}/api/generate", json=payload, timeout=args.timeout)
+            else:
+                requests.post(f"{url}/api/generate", json=payload, timeout=args.timeout)
+        except QueueFullError:
+            outcome = "rejected"
+        except requests.Timeout:
+            outcome = "timeout"
+        with lock:
+            results.append((outcome, time.perf_counter() - start))
+
+    threads = []
+    t0 = time.perf_counter()
+    for at, username, prompt_len in arrivals:
+        delay = at - (time.perf_counter() - t0)
+        if delay > 0:
+            time.sleep(delay)
+        t = threading.Thread(target=one, args=(username, prompt_len), daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    ok = [lat for outcome, lat in results if outcome == "ok"]
+    return {
+        "mode": mode,
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected": sum(1 for o, _ in results if o == "rejected"),
+        "timeout": sum(1 for o, _ in results if o == "timeout"),
+        "p50": percentile(ok, 50),
+        "p99": percentile(ok, 99),
+        "goodput": sum(1 for lat in ok if lat <= args.slo) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=8.0, help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--parallel", type=int, default=2, help="stub GPU parallelism and scheduler slots")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub generation time when not overloaded")
+    parser.add_argument("--max-queue", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--slo", type=float, default=5.0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    arrivals, t = [], 0.0
+    while t < args.duration:
+        t += rng.expovariate(args.rate)
+        arrivals.append((t, f"user{rng.randrange(args.users)}", rng.choice([200, 200, 200, 4000])))
+
+    print(f"{'mode':>11} {'reqs':>5} {'ok':>5} {'429':>5} {'t/o':>5} {'p50 s':>7} {'p99 s':>7} {'goodput/s':>10}")
+    for mode in ("direct", "scheduled"):
+        # Fresh stub per mode so abandoned requests from one run can't slow the next
+        stub = StubOllama(port=0, generate_latency=args.latency, parallel=args.parallel).start()
+        r = run(mode, stub.url, arrivals, args)
+        stub.stop()
+        print(f"{r['mode']:>11} {r['requests']:>5} {r['ok']:>5} {r['rejected']:>5} {r['timeout']:>5} "
+              f"{r['p50']:>7.2f} {r['p99']:>7.2f} {r['goodput']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
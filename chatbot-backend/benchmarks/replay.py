@@ -0,0 +1,362 @@
+# benchmarks/replay.py
+"""Replay recorded chat sessions as concurrent users against the API.
+
+Each recorded chat under --chats (default data/chats/user) becomes a
+session: log in, list chats, start a chat and open it, then send every
+recorded user message in order, with its attachment if it had one. The
+pause before each send is the user's recorded think time (the gap since the
+previous reply), scaled by --think-scale and capped at --max-think.
+Attachments aren't in the repo, so a small file of the recorded name and
+type is generated in their place.
+
+Sessions can also come from a request log (--log), one action per line:
+
+    {"session": "s1", "action": "login"}
+    {"session": "s1", "action": "list"}
+    {"session": "s1", "action": "open"}
+    {"session": "s1", "action": "send", "text": "...", "attachment": "plot.png", "think": 4.5}
+
+--dump writes the sessions built from the chat files in that format, as a
+starting point for hand-written logs.
+
+--users virtual users run sessions back to back for --duration seconds (or
+--iterations sessions each). Without --url a stub Ollama and a uvicorn
+server on a scratch data directory are started. Chats created by the replay
+are deleted at the end, which also removes their uploads.
+
+Run from chatbot-backend/:
+    python -m benchmarks.replay --users 8 --duration 60 --think-scale 0.1
+    python -m benchmarks.replay --url http://localhost:8000 --users 4 --iterations 2 --output replay.json
+"""
+import argparse
+import ast
+import json
+import mimetypes
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from benchmarks.bench_workers import free_port, wait_until_up
+from benchmarks.stub_ollama import StubOllama
+from benchmarks.suite import make_pdf, percentile
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# Smallest valid PNG: one transparent pixel
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000105fe02fe0d0a2db40000000049454e44ae426082"
+)
+
+
+# --- sessions ---------------------------------------------------------------------------------
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _attachment_name(file_field):
+    # Older chat files stored the metadata dict's repr() rather than the dict
+    if isinstance(file_field, str):
+        try:
+            file_field = ast.literal_eval(file_field)
+        except (ValueError, SyntaxError):
+            return None
+    return file_field.get("filename") if isinstance(file_field, dict) else None
+
+
+def sessions_from_chats(chat_dir: Path) -> list:
+    """One action list per recorded chat file."""
+    sessions = []
+    for chat_file in sorted(Path(chat_dir).glob("*.json")):
+        if chat_file.name == "chat_list.json":
+            continue
+        with open(chat_file, "r", encoding="utf-8") as f:
+            messages = sorted(json.load(f), key=lambda m: m.get("timestamp", ""))
+        actions = [{"action": "login"}, {"action": "list"}, {"action": "open"}]
+        previous = None
+        for m in messages:
+            if m.get("sender") == "user":
+                think = 0.0
+                if previous is not None and m.get("timestamp"):
+                    think = max(0.0, (_parse_time(m["timestamp"]) - previous).total_seconds())
+                actions.append({"action": "send", "text": m.get("text") or "...",
+                                "attachment": _attachment_name(m.get("file")), "think": think})
+            if m.get("timestamp"):
+                previous = _parse_time(m["timestamp"])
+        if any(a["action"] == "send" for a in actions):
+            sessions.append({"session": chat_file.stem, "actions": actions})
+    return sessions
+
+
+def sessions_from_log(path: Path) -> list:
+    sessions = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                sessions.setdefault(record.get("session", "default"), []).append(record)
+    return [{"session": name, "actions": actions} for name, actions in sessions.items()]
+
+
+def dump_sessions(sessions: list, path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        for s in sessions:
+            for action in s["actions"]:
+                f.write(json.dumps({"session": s["session"], **action}) + "\n")
+
+
+def attachment_bytes(name: str, pdf_cache: dict) -> tuple:
+    """(content, content type) standing in for a recorded attachment."""
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if content_type.startswith("image/"):
+        return TINY_PNG, content_type
+    if content_type == "application/pdf":
+        if "pdf" not in pdf_cache:
+            with tempfile.TemporaryDirectory() as tmp:
+                make_pdf(Path(tmp) / "a.pdf", pages=3)
+                pdf_cache["pdf"] = (Path(tmp) / "a.pdf").read_bytes()
+        return pdf_cache["pdf"], content_type
+    return b"replayed attachment\n" * 50, content_type
+
+
+# --- load -------------------------------------------------------------------------------------
+
+class Recorder:
+    """Latencies and outcomes per endpoint."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def call(self, endpoint: str, fn):
+        start = time.perf_counter()
+        try:
+            response = fn()
+            status = str(response.status_code)
+            ok = response.status_code < 400
+        except requests.RequestException as e:
+            response, status, ok = None, type(e).__name__, False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.statuses[endpoint][status] += 1
+            if ok:
+                self.latencies[endpoint].append(elapsed)
+            else:
+                self.errors[endpoint] += 1
+        return response if ok else None
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies[name]
+            total = len(samples) + self.errors[name]
+            endpoints[name] = {
+                "requests": total,
+                "errors": self.errors[name],
+                "error_rate": round(self.errors[name] / total, 4),
+                "throughput_per_sec": round(len(samples) / elapsed, 2),
+                "statuses": dict(self.statuses[name]),
+            }
+            if samples:
+                endpoints[name].update({
+                    f"p{p}_ms": round(percentile(samples, p) * 1000, 1) for p in (50, 95, 99)
+                })
+                endpoints[name]["max_ms"] = round(max(samples) * 1000, 1)
+        requests_total = sum(e["requests"] for e in endpoints.values())
+        errors_total = sum(e["errors"] for e in endpoints.values())
+        return {
+            "seconds": round(elapsed, 2),
+            "requests": requests_total,
+            "errors": errors_total,
+            "error_rate": round(errors_total / requests_total, 4) if requests_total else 0.0,
+            "throughput_per_sec": round((requests_total - errors_total) / elapsed, 2),
+            "endpoints": endpoints,
+        }
+
+
+class VirtualUser:
+    def __init__(self, base: str, args, recorder: Recorder, created: list, pdf_cache: dict):
+        self.base = base
+        self.args = args
+        self.recorder = recorder
+        self.created = created
+        self.pdf_cache = pdf_cache
+        self.http = requests.Session()
+
+    def _think(self, seconds: float, deadline: float):
+        pause = min(seconds * self.args.think_scale, self.args.max_think)
+        time.sleep(max(0.0, min(pause, deadline - time.monotonic())))
+
+    def run_session(self, session: dict, deadline: float):
+        chat_id = None
+        for action in session["actions"]:
+            if time.monotonic() >= deadline:
+                return
+            kind = action["action"]
+            if kind == "login":
+                r = self.recorder.call("POST /auth/login", lambda: self.http.post(
+                    f"{self.base}/auth/login", json={"username": self.args.username, "password": self.args.password},
+                    timeout=self.args.timeout))
+                if r is None:
+                    return
+                self.http.headers["Authorization"] = f"Bearer {r.json()['token']}"
+            elif kind == "list":
+                self.recorder.call("GET /chat/chats", lambda: self.http.get(
+                    f"{self.base}/chat/chats", timeout=self.args.timeout))
+            elif kind == "open":
+                # Replayed turns go into a fresh chat so the recorded ones stay as they are
+                r = self.recorder.call("POST /chat/chat/new", lambda: self.http.post(
+                    f"{self.base}/chat/chat/new", json={"title": f"replay {session['session']}"},
+                    timeout=self.args.timeout))
+                if r is None:
+                    return
+                chat_id = r.json()["chat_id"]
+                self.created.append((self.http.headers["Authorization"], chat_id))
+                self.recorder.call("GET /chat/chat/{chat_id}/messages", lambda: self.http.get(
+                    f"{self.base}/chat/chat/{chat_id}/messages", timeout=self.args.timeout))
+            elif kind == "send" and chat_id:
+                self._think(float(action.get("think") or 0.0), deadline)
+                if time.monotonic() >= deadline:
+                    return
+                data = {"text": action.get("text") or "...", "model_id": self.args.model}
+                name = action.get("attachment")
+                if name:
+                    content, content_type = attachment_bytes(name, self.pdf_cache)
+                    self.recorder.call("POST /chat/chat/{chat_id}/send [file]", lambda: self.http.post(
+                        f"{self.base}/chat/chat/{chat_id}/send", data=data,
+                        files={"file": (name, content, content_type)}, timeout=self.args.timeout))
+                else:
+                    self.recorder.call("POST /chat/chat/{chat_id}/send", lambda: self.http.post(
+                        f"{self.base}/chat/chat/{chat_id}/send", data=data, timeout=self.args.timeout))
+
+    def run(self, sessions: list, offset: int, deadline: float):
+        done = 0
+        while time.monotonic() < deadline and (not self.args.iterations or done < self.args.iterations):
+            self.run_session(sessions[(offset + done) % len(sessions)], deadline)
+            done += 1
+
+
+def replay(base: str, sessions: list, args) -> dict:
+    recorder = Recorder()
+    created = []
+    pdf_cache = {}
+    deadline = time.monotonic() + (args.duration if args.duration else float("inf"))
+    users = [VirtualUser(base, args, recorder, created, pdf_cache) for _ in range(args.users)]
+    threads = []
+    start = time.perf_counter()
+    for i, user in enumerate(users):
+        t = threading.Thread(target=user.run, args=(sessions, i, deadline), daemon=True)
+        t.start()
+        threads.append(t)
+        # Ramp up instead of a thundering herd of logins
+        time.sleep(args.ramp_up / max(1, args.users))
+    for t in threads:
+        t.join()
+    report = recorder.report(time.perf_counter() - start)
+
+    cleanup = requests.Session()
+    for auth, chat_id in created:
+        try:
+            cleanup.delete(f"{base}/chat/chat/{chat_id}/delete", headers={"Authorization": auth}, timeout=30)
+        except requests.RequestException:
+            pass
+    return report
+
+
+def start_server(tmp: Path, ollama_url: str, workers: int) -> tuple:
+    from benchmarks.suite import _empty_vector_store
+    data_dir = tmp / "data"
+    data_dir.mkdir()
+    shutil.copy(BACKEND_DIR / "data" / "users.csv", data_dir / "users.csv")
+    _empty_vector_store(data_dir / "vector_store")
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR), CHATBOT_DATA_DIR=str(data_dir), OLLAMA_URL=ollama_url,
+               MODEL_WARMUP="0", PASSWORD_HASH_ITERATIONS="1000", LOG_LEVEL="WARNING")
+    command = [sys.executable, "-m", "app.serve", "--port", str(port), "--workers", str(workers)]
+    if workers > 1:
+        command += ["--vector-service", f"127.0.0.1:{free_port()}"]
+    proc = subprocess.Popen(command, cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    wait_until_up(base + "/")
+    return proc, base
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<40} {'reqs':>6} {'err%':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:<40} {e['requests']:>6} {e['error_rate'] * 100:>5.1f}% {e['throughput_per_sec']:>7.2f} "
+              + " ".join(f"{e.get(k, float('nan')):>8.1f}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")))
+    print(f"{'total':<40} {report['requests']:>6} {report['error_rate'] * 100:>5.1f}% "
+          f"{report['throughput_per_sec']:>7.2f}   ({report['seconds']}s, latencies in ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="server to load; default: start one against a stub Ollama")
+    parser.add_argument("--chats", default=str(BACKEND_DIR / "data" / "chats" / "user"))
+    parser.add_argument("--log", help="replay this request log instead of the chat files")
+    parser.add_argument("--dump", help="write the sessions as a request log and exit")
+    parser.add_argument("--users", type=int, default=4, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds; 0 = until --iterations are done")
+    parser.add_argument("--iterations", type=int, default=0, help="sessions per user; 0 = until --duration")
+    parser.add_argument("--think-scale", type=float, default=0.1, help="multiplier on recorded think times")
+    parser.add_argument("--max-think", type=float, default=5.0, help="cap on one pause, seconds")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="seconds over which users start")
+    parser.add_argument("--username", default="user")
+    parser.add_argument("--password", default="123")
+    parser.add_argument("--model", default="llama3.2+llava")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the started server")
+    parser.add_argument("--generate-latency", type=float, default=0.2, help="stub Ollama latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args()
+    if not args.duration and not args.iterations:
+        parser.error("set --duration or --iterations")
+
+    sessions = sessions_from_log(Path(args.log)) if args.log else sessions_from_chats(Path(args.chats))
+    if not sessions:
+        sys.exit("no sessions to replay")
+    if args.dump:
+        dump_sessions(sessions, Path(args.dump))
+        print(f"wrote {sum(len(s['actions']) for s in sessions)} actions of {len(sessions)} sessions to {args.dump}")
+        return
+    random.Random(args.seed).shuffle(sessions)
+    sends = sum(a["action"] == "send" for s in sessions for a in s["actions"])
+    print(f"replaying {len(sessions)} sessions ({sends} sends) with {args.users} users", file=sys.stderr)
+
+    if args.url:
+        report = replay(args.url.rstrip("/"), sessions, args)
+    else:
+        stub = StubOllama(port=free_port(), generate_latency=args.generate_latency).start()
+        with tempfile.TemporaryDirectory() as tmp:
+            proc, base = start_server(Path(tmp), stub.url, args.workers)
+            try:
+                report = replay(base, sessions, args)
+            finally:
+                proc.terminate()
+                proc.wait()
+                stub.stop()
+
+    report["config"] = {k: getattr(args, k) for k in ("users", "duration", "iterations", "think_scale",
+                                                      "max_think", "model", "workers")}
+    report["config"]["source"] = args.log or args.chats
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
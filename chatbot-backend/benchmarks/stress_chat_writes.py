@@ -0,0 +1,128 @@
+# benchmarks/stress_chat_writes.py
+"""Concurrent writes to the chat store: no message may be lost.
+
+    hot chat     --writers concurrent save_message_async calls to one chat
+    many chats   --chats chats written in parallel, --per-chat messages each
+    threads      --writers threads calling save_message on one chat, as
+                 sync code and other uvicorn workers do
+
+Each scenario checks that every chat file ends up with exactly the messages
+written to it. The hot-chat scenario also times single writes to other
+chats while the burst is running: with per-chat locks the burst occupies one
+file I/O thread, without them (--no-chat-locks) it can take them all.
+
+Run from chatbot-backend/:
+    python -m benchmarks.stress_chat_writes --writers 100 --chats 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else float("nan")
+
+
+def message(writer: int, n: int = 0) -> dict:
+    return {"id": f"{writer}-{n}", "sender": "user", "text": f"writer {writer} message {n}",
+            "timestamp": "2025-01-01T00:00:00Z"}
+
+
+def check(chat_store, chat_id: str, expected: int) -> bool:
+    messages = chat_store.load_chat_messages("stress", chat_id)
+    ids = {m["id"] for m in messages}
+    return len(messages) == expected and len(ids) == expected
+
+
+async def hot_chat(chat_store, writers: int, chat_locks: bool) -> dict:
+    from app.file_io import run_io
+    hot = chat_store.create_new_chat("stress", "hot")
+    others = [chat_store.create_new_chat("stress", f"other {i}") for i in range(10)]
+
+    async def write(chat_id, msg):
+        if chat_locks:
+            await chat_store.save_message_async("stress", chat_id, msg)
+        else:
+            await run_io(chat_store.save_message, "stress", chat_id, msg)
+
+    other_latencies = []
+
+    async def other_writes():
+        await asyncio.sleep(0.01)  # let the burst take the pool first
+        for i, chat_id in enumerate(others):
+            start = time.perf_counter()
+            await write(chat_id, message(-1, i))
+            other_latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(other_writes(), *(write(hot, message(w)) for w in range(writers)))
+    elapsed = time.perf_counter() - start
+    return {
+        "ok": check(chat_store, hot, writers) and all(check(chat_store, c, 1) for c in others),
+        "seconds": elapsed, "writes_per_sec": writers / elapsed,
+        "other_chat_p50_ms": percentile(other_latencies, 50) * 1000,
+        "other_chat_max_ms": max(other_latencies) * 1000,
+    }
+
+
+async def many_chats(chat_store, chats: int, per_chat: int) -> dict:
+    chat_ids = [chat_store.create_new_chat("stress", f"chat {i}") for i in range(chats)]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        chat_store.save_message_async("stress", chat_id, message(w, n))
+        for n in range(per_chat) for w, chat_id in enumerate(chat_ids)
+    ))
+    elapsed = time.perf_counter() - start
+    ok = all(check(chat_store, c, per_chat) for c in chat_ids)
+    return {"ok": ok, "seconds": elapsed, "writes_per_sec": chats * per_chat / elapsed}
+
+
+def threaded(chat_store, writers: int) -> dict:
+    chat_id = chat_store.create_new_chat("stress", "threads")
+    threads = [threading.Thread(target=chat_store.save_message, args=("stress", chat_id, message(w)))
+               for w in range(writers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"ok": check(chat_store, chat_id, writers), "seconds": elapsed, "writes_per_sec": writers / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=100)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--per-chat", type=int, default=3)
+    parser.add_argument("--no-chat-locks", action="store_true", help="hot chat without the per-chat locks")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The chat store reads its location at import
+        os.environ["CHATBOT_DATA_DIR"] = tmp
+        os.environ.setdefault("TRACING", "0")
+        from app import chat_store
+
+        results = {
+            f"hot chat ({args.writers} writers)": asyncio.run(hot_chat(chat_store, args.writers, not args.no_chat_locks)),
+            f"many chats ({args.chats} x {args.per_chat})": asyncio.run(many_chats(chat_store, args.chats, args.per_chat)),
+            f"threads ({args.writers} on one chat)": threaded(chat_store, args.writers),
+        }
+
+    print(f"{'scenario':<32} {'ok':>4} {'seconds':>8} {'writes/s':>9} {'other chat p50/max':>20}")
+    for name, r in results.items():
+        other = (f"{r['other_chat_p50_ms']:.1f}/{r['other_chat_max_ms']:.1f} ms"
+                 if "other_chat_p50_ms" in r else "")
+        print(f"{name:<32} {'yes' if r['ok'] else 'NO':>4} {r['seconds']:>8.2f} {r['writes_per_sec']:>9.1f} {other:>20}")
+    if not all(r["ok"] for r in results.values()):
+        sys.exit("lost or duplicated messages")
+
+
+if __name__ == "__main__":
+    main()
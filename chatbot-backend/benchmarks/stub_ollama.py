@@ -0,0 +1,281 @@
+# benchmarks/stub_ollama.py
+"""Minimal stand-in for the Ollama HTTP API, for benchmarks without a GPU.
+
+    python -m benchmarks.stub_ollama --port 11500 --generate-latency 0.2
+    python -m benchmarks.stub_ollama --tokens-per-second 40 --prompt-tokens-per-second 800
+
+Serves /api/generate (non-streaming, and NDJSON streaming when the request
+has "stream": true), /api/embeddings (one prompt) and /api/embed (one or
+many inputs), with Ollama's timing fields in every final response.
+
+A generation takes generate_latency, plus prompt tokens / prompt rate, plus
+response tokens / token rate when rates are given. Tokens are approximated
+as whitespace-separated words; the response length is ``response_tokens``
+or the request's options.num_predict. ``speedups`` ({model: factor}) makes
+some models faster than others, like a small model next to a large one.
+
+As one node of a pool: ``models`` lists the models it has pulled (others
+get Ollama's 404; None serves any), a model not in memory takes
+``load_seconds`` to load first, and at most ``max_loaded`` stay in memory
+(0: no limit). /api/ps and /api/tags report them (with models=None,
+/api/tags lists the models it has loaded so far).
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBED_DIM = 768
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> list:
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:4], "big")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+class StubOllama:
+    def __init__(self, host="127.0.0.1", port=11500, generate_latency=0.2, embed_latency=0.01, parallel=0,
+                 tokens_per_second=0.0, prompt_tokens_per_second=0.0, response_tokens=32, speedups=None,
+                 models=None, load_seconds=0.0, max_loaded=0):
+        self.generate_latency = generate_latency
+        self.embed_latency = embed_latency
+        # Like a GPU: beyond `parallel` concurrent generations every request slows down
+        # superlinearly, because the real server starts swapping KV cache (0 = unlimited)
+        self.parallel = parallel
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.response_tokens = response_tokens
+        self.speedups = dict(speedups or {})
+        self.models = None if models is None else set(models)
+        self.load_seconds = load_seconds
+        self.max_loaded = max_loaded
+        # Models in memory, least recently used first
+        self.loaded = []
+        self._loading = {}
+        self.loads = 0
+        self.inflight = 0
+        self.requests = 0
+        # Streams the client hung up on before the end
+        self.aborted = 0
+        # Response tokens produced, including those of aborted streams up to the abort
+        self.tokens = 0
+        self.stopped = False
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    pass  # client hung up on a keep-alive connection
+
+            def _json(self, status, payload):
+                body = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client gave up (timeout)
+
+            def _stream(self, lines):
+                """Write NDJSON lines as chunks of a chunked response."""
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for line in lines:
+                        data = json.dumps(line).encode() + b"\n"
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    stub.aborted += 1  # client cancelled mid-stream
+
+            def do_GET(self):
+                if stub.stopped:
+                    self.close_connection = True  # like a dead server: no answer on open connections either
+                elif self.path == "/api/ps":
+                    self._json(200, {"models": [{"name": m, "model": m} for m in list(stub.loaded)]})
+                elif self.path == "/api/tags":
+                    self._json(200, {"models": [{"name": m, "model": m} for m in sorted(stub.models or stub.loaded)]})
+                else:
+                    self._json(404, {"error": "not found"})
+
+            def do_POST(self):
+                if stub.stopped:
+                    self.close_connection = True
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                stub.requests += 1
+                model = payload.get("model")
+                if stub.models is not None and model not in stub.models:
+                    self._json(404, {"error": f"model '{model}' not found, try pulling it first"})
+                    return
+                stub.load(model)
+                if self.path == "/api/generate":
+                    if payload.get("stream", True):
+                        self._stream(stub.stream_generation(payload))
+                    else:
+                        self._json(200, stub.generation(payload))
+                elif self.path == "/api/embeddings":
+                    time.sleep(stub.embed_latency)
+                    self._json(200, {"embedding": fake_embedding(payload.get("prompt", ""))})
+                elif self.path == "/api/embed":
+                    inputs = payload.get("input", "")
+                    inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+                    time.sleep(stub.embed_latency * max(1, len(inputs)))
+                    self._json(200, {"model": payload.get("model"), "embeddings": [fake_embedding(t) for t in inputs]})
+                else:
+                    self._json(404, {"error": "not found"})
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    # --- timing model -----------------------------------------------------------------
+
+    def load(self, model):
+        """Bring ``model`` into memory, evicting the least recently used beyond max_loaded."""
+        with self._lock:
+            if model in self.loaded:
+                self.loaded.remove(model)
+                self.loaded.append(model)
+                return
+            loading = self._loading.get(model)
+            if loading is not None:
+                waiting = True  # another request is loading it
+            else:
+                waiting = False
+                loading = self._loading[model] = threading.Event()
+                self.loads += 1
+        if waiting:
+            loading.wait()
+            return
+        time.sleep(self.load_seconds)
+        with self._lock:
+            self.loaded.append(model)
+            while self.max_loaded and len(self.loaded) > self.max_loaded:
+                self.loaded.pop(0)
+            del self._loading[model]
+        loading.set()
+
+    def _slowdown(self, load: int) -> float:
+        if self.parallel and load > self.parallel:
+            return (load / self.parallel) ** 1.5
+        return 1.0
+
+    def _plan(self, payload) -> tuple:
+        """(fixed latency, prompt eval seconds, seconds per response token, response token count)."""
+        speedup = self.speedups.get(payload.get("model"), 1.0)
+        prompt_tokens = len(str(payload.get("prompt", "")).split())
+        prompt_seconds = prompt_tokens / self.prompt_tokens_per_second if self.prompt_tokens_per_second else 0.0
+        count = int((payload.get("options") or {}).get("num_predict") or self.response_tokens)
+        per_token = 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+        return self.generate_latency / speedup, prompt_seconds / speedup, per_token / speedup, max(1, count)
+
+    def _enter(self) -> float:
+        with self._lock:
+            self.inflight += 1
+            return self._slowdown(self.inflight)
+
+    def _leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def _final(self, payload, response: str, started: float, first_token_at: float, count: int) -> dict:
+        total = time.perf_counter() - started
+        prompt_eval = first_token_at - started
+        return {
+            "model": payload.get("model"), "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": response, "done": True, "done_reason": "stop",
+            "total_duration": int(total * 1e9), "load_duration": 0,
+            "prompt_eval_count": len(str(payload.get("prompt", "")).split()),
+            "prompt_eval_duration": int(prompt_eval * 1e9),
+            "eval_count": count, "eval_duration": int((total - prompt_eval) * 1e9),
+        }
+
+    def generation(self, payload) -> dict:
+        """A complete non-streaming /api/generate response."""
+        latency, prompt_seconds, per_token, count = self._plan(payload)
+        started = time.perf_counter()
+        slowdown = self._enter()
+        try:
+            if not per_token:
+                # Fixed latency; a fifth of it counts as prompt evaluation
+                time.sleep(latency * slowdown + prompt_seconds * slowdown)
+                first = started + (time.perf_counter() - started) * 0.2
+                with self._lock:
+                    self.tokens += count
+                return self._final(payload, "stub reply", started, first, count)
+            time.sleep((latency + prompt_seconds) * slowdown)
+            first = time.perf_counter()
+            time.sleep(per_token * count * slowdown)
+            with self._lock:
+                self.tokens += count
+            return self._final(payload, " ".join(["tok"] * count), started, first, count)
+        finally:
+            self._leave()
+
+    def stream_generation(self, payload):
+        """NDJSON lines of a streaming /api/generate response, paced like real decoding."""
+        latency, prompt_seconds, per_token, count = self._plan(payload)
+        started = time.perf_counter()
+        slowdown = self._enter()
+        try:
+            time.sleep((latency + prompt_seconds) * slowdown)
+            first = time.perf_counter()
+            for i in range(count):
+                if i:
+                    time.sleep(per_token * slowdown)
+                with self._lock:
+                    self.tokens += 1
+                yield {"model": payload.get("model"), "response": "tok" if i == 0 else " tok", "done": False}
+            yield self._final(payload, "", started, first, count)
+        finally:
+            self._leave()
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--generate-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    parser.add_argument("--parallel", type=int, default=0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--response-tokens", type=int, default=32)
+    args = parser.parse_args()
+    stub = StubOllama(args.host, args.port, args.generate_latency, args.embed_latency, args.parallel,
+                      args.tokens_per_second, args.prompt_tokens_per_second, args.response_tokens)
+    print(f"Stub Ollama on {stub.url}")
+    stub.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
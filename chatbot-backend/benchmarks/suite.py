@@ -0,0 +1,335 @@
+# benchmarks/suite.py
+"""End-to-end benchmark suite, written to JSON so runs can be compared.
+
+Runs every scenario against a scratch data directory and a stub Ollama
+(benchmarks.stub_ollama), so no GPU, model or real data is needed:
+
+    chat_append       save_message into one chat: appends/sec, p50/p99
+    history_load      load_chat_messages for chats of 10, 100 and 1000 messages
+    pdf_ingestion     process_pdf on a generated text PDF: pages/sec
+    vector_search     VectorStore.search over 1k, 10k and 100k vectors
+    concurrent_turns  /chat/{id}/send through a uvicorn server at 1, 4 and 16 clients
+
+Run from chatbot-backend/:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --quick --scenarios chat_append,vector_search
+    python -m benchmarks.suite --output new.json --compare results.json
+
+--compare prints every metric next to the baseline's and exits with status 1
+when a latency rose or a throughput fell by more than --threshold (20%).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+from benchmarks.bench_workers import free_port, wait_until_up
+from benchmarks.stub_ollama import StubOllama
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ("chat_append", "history_load", "pdf_ingestion", "vector_search", "concurrent_turns")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def latency_ms(samples) -> dict:
+    """p50/p99/mean of durations in seconds, as milliseconds."""
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+def message(i: int) -> dict:
+    return {
+        "sender": "user" if i % 2 == 0 else "bot",
+        "text": f"benchmark message {i} " + "lorem ipsum dolor sit amet " * 8,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+# --- scenarios --------------------------------------------------------------------------------
+
+def bench_chat_append(quick: bool) -> dict:
+    from app import chat_store
+    count = 200 if quick else 1000
+    chat_id = chat_store.create_new_chat("bench", "append")
+    samples = []
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        chat_store.save_message("bench", chat_id, message(i))
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    # The chat file is rewritten on every append, so late appends show the growth cost
+    return {"messages": count, "appends_per_sec": round(count / elapsed, 1), **latency_ms(samples),
+            "last_100_p50_ms": round(percentile(samples[-100:], 50) * 1000, 3)}
+
+
+def bench_history_load(quick: bool) -> dict:
+    from app import chat_store
+    from app.file_lock import atomic_write_json
+    result = {}
+    for size in (10, 100, 1000):
+        chat_id = chat_store.create_new_chat("bench", f"history {size}")
+        atomic_write_json(chat_store.CHAT_DIR / "bench" / f"{chat_id}.json", [message(i) for i in range(size)])
+        repeats = 20 if quick else 100
+        samples = []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            chat_store.load_chat_messages("bench", chat_id)
+            samples.append(time.perf_counter() - t)
+        result[f"messages_{size}"] = latency_ms(samples)
+    return result
+
+
+def make_pdf(path: Path, pages: int, lines_per_page: int = 40):
+    """A plain multi-page text PDF (Helvetica), enough for pypdf to extract text from."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for p in range(pages):
+        lines = b"".join(
+            b"(Page %d line %d: the quick brown fox jumps over the lazy dog near the river bank.) Tj T*\n" % (p, i)
+            for i in range(lines_per_page)
+        )
+        stream = b"BT /F1 10 Tf 14 TL 40 800 Td\n" + lines + b"ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> "
+            b"/Contents %d 0 R >>" % content_id
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+def bench_pdf_ingestion(quick: bool, work_dir: Path) -> dict:
+    from app import llm
+    pages = 10 if quick else 50
+    pdf = work_dir / "bench.pdf"
+    make_pdf(pdf, pages)
+    before = llm.store.index.ntotal
+    start = time.perf_counter()
+    llm.process_pdf(str(pdf), "bench-pdf")
+    elapsed = time.perf_counter() - start
+    return {"pages": pages, "vectors": llm.store.index.ntotal - before, "seconds": round(elapsed, 3),
+            "pages_per_sec": round(pages / elapsed, 2)}
+
+
+def bench_vector_search(quick: bool, work_dir: Path) -> dict:
+    import numpy as np
+    from app.vector_index import VectorStore
+    dim = 768
+    rng = np.random.default_rng(0)
+    result = {}
+    for size in (1_000, 10_000) if quick else (1_000, 10_000, 100_000):
+        store = VectorStore(dim, work_dir / f"vectors_{size}")
+        now = str(datetime.now())
+        for start in range(0, size, 10_000):
+            n = min(10_000, size - start)
+            store.add(rng.standard_normal((n, dim)).astype(np.float32), [
+                {"type": "pdf", "chat_id": f"chat-{(start + i) % 50}", "page": 0, "content": "x", "timestamp": now}
+                for i in range(n)
+            ])
+        queries = rng.standard_normal((20 if quick else 50, dim)).astype(np.float32)
+        samples = []
+        for q in queries:
+            t = time.perf_counter()
+            store.search(q, chat_id="chat-0", k=5)
+            samples.append(time.perf_counter() - t)
+        result[f"vectors_{size}"] = latency_ms(samples)
+    return result
+
+
+def _client(base: str, turns: int) -> tuple:
+    s = requests.Session()
+    token = s.post(f"{base}/auth/login", json={"username": "user", "password": "123"}).json()["token"]
+    s.headers["Authorization"] = f"Bearer {token}"
+    chat_id = s.post(f"{base}/chat/chat/new", json={"title": "bench"}).json()["chat_id"]
+    samples, errors = [], 0
+    for i in range(turns):
+        t = time.perf_counter()
+        r = s.post(f"{base}/chat/chat/{chat_id}/send", data={"text": f"turn {i}", "model_id": "llama3.2"})
+        if r.status_code == 200:
+            samples.append(time.perf_counter() - t)
+        else:
+            errors += 1
+    return samples, errors
+
+
+def bench_concurrent_turns(quick: bool, work_dir: Path, ollama_url: str) -> dict:
+    data_dir = work_dir / "server_data"
+    data_dir.mkdir()
+    shutil.copy(BACKEND_DIR / "data" / "users.csv", data_dir / "users.csv")
+    _empty_vector_store(data_dir / "vector_store")
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR), CHATBOT_DATA_DIR=str(data_dir), OLLAMA_URL=ollama_url)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    turns = 3 if quick else 10
+    result = {}
+    try:
+        wait_until_up(base + "/")
+        _client(base, 1)  # warm-up
+        for clients in (1, 4, 16):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=clients) as pool:
+                runs = list(pool.map(lambda _: _client(base, turns), range(clients)))
+            elapsed = time.perf_counter() - start
+            samples = [s for r in runs for s in r[0]]
+            result[f"clients_{clients}"] = {
+                "turns": clients * turns, "errors": sum(r[1] for r in runs),
+                "turns_per_sec": round(len(samples) / elapsed, 2),
+                **(latency_ms(samples) if samples else {}),
+            }
+    finally:
+        proc.terminate()
+        proc.wait()
+    return result
+
+
+# --- harness ----------------------------------------------------------------------------------
+
+def _empty_vector_store(path: Path):
+    # With no store at VECTOR_STORE_PATH the app would import the repo's legacy ones
+    import faiss
+    from app import vector_format
+    vector_format.save_store(path, faiss.IndexFlatL2(768), [])
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def flatten(tree: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in tree.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Print metric changes; returns the names of metrics that regressed."""
+    now, before = flatten(current["scenarios"]), flatten(baseline["scenarios"])
+    regressions = []
+    print(f"\n{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(now.keys() & before.keys()):
+        old, new = before[name], now[name]
+        change = (new - old) / old if old else 0.0
+        lower_is_better = name.endswith("_ms") or name.endswith("seconds") or name.endswith("errors")
+        higher_is_better = name.endswith("_per_sec")
+        regressed = (lower_is_better and change > threshold) or (higher_is_better and change < -threshold)
+        if name.endswith("errors"):
+            regressed = new > old
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<48} {old:>12.3f} {new:>12.3f} {change:>+7.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast smoke run")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--generate-latency", type=float, default=0.05)
+    parser.add_argument("--embed-latency", type=float, default=0.002)
+    args = parser.parse_args()
+    selected = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    stub = StubOllama(port=free_port(), generate_latency=args.generate_latency,
+                      embed_latency=args.embed_latency).start()
+    work = tempfile.TemporaryDirectory()
+    work_dir = Path(work.name)
+    # App modules read their configuration at import, so point them at scratch space first
+    os.environ.update({
+        "CHATBOT_DATA_DIR": str(work_dir / "data"), "OLLAMA_URL": stub.url, "MODEL_WARMUP": "0",
+        "LOG_LEVEL": "WARNING", "PASSWORD_HASH_ITERATIONS": "1000", "TRACING": "0",
+    })
+    _empty_vector_store(work_dir / "data" / "vector_store")
+
+    runners = {
+        "chat_append": lambda: bench_chat_append(args.quick),
+        "history_load": lambda: bench_history_load(args.quick),
+        "pdf_ingestion": lambda: bench_pdf_ingestion(args.quick, work_dir),
+        "vector_search": lambda: bench_vector_search(args.quick, work_dir),
+        "concurrent_turns": lambda: bench_concurrent_turns(args.quick, work_dir, stub.url),
+    }
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {"quick": args.quick, "generate_latency": args.generate_latency,
+                   "embed_latency": args.embed_latency},
+        "scenarios": {},
+    }
+    try:
+        for name in selected:
+            print(f"running {name}...", file=sys.stderr)
+            start = time.perf_counter()
+            results["scenarios"][name] = runners[name]()
+            print(f"  done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    finally:
+        stub.stop()
+        work.cleanup()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
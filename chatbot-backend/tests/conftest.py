@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# app modules read their settings at import time
+os.environ.setdefault("CHATBOT_DATA_DIR", tempfile.mkdtemp(prefix="chatbot-tests-"))
+os.environ.setdefault("PASSWORD_HASH_ITERATIONS", "1000")
+os.environ.setdefault("MODEL_WARMUP", "0")
+os.environ.setdefault("TRACING", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
@@ -0,0 +1,110 @@
+# tests/test_cancellation.py
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import chat_routes
+from app.cancellation import GenerationCancelled, TurnRegistry
+from app.chat_store import create_new_chat
+from app.dependencies import get_current_username
+
+
+class FakeRequest:
+    """What _run_turn reads of a request: receive() completes when the client goes away."""
+
+    def __init__(self, disconnect_after=None):
+        self.disconnect_after = disconnect_after
+
+    async def receive(self):
+        if self.disconnect_after is None:
+            await asyncio.Event().wait()
+        await asyncio.sleep(self.disconnect_after)
+        return {"type": "http.disconnect"}
+
+
+def _generate(*args, cancel):
+    # Stands in for a generation that streams until it is cancelled
+    cancel.wait(5)
+    cancel.check()
+    return {"text": "too late", "image": None}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = TurnRegistry(shared=False)
+    monkeypatch.setattr(chat_routes, "turns", registry)
+    monkeypatch.setattr(chat_routes, "generate_llm_response", _generate)
+    monkeypatch.setattr(chat_routes, "GENERATION_CANCEL_POLL_SECONDS", 0.01)
+    return registry
+
+
+def _turn(request, registry, chat_id="c1"):
+    token = registry.begin("alice", chat_id)
+    return token, chat_routes._run_turn(request, "alice", chat_id, token)
+
+
+def test_client_disconnect_cancels_the_turn(registry):
+    token, turn = _turn(FakeRequest(disconnect_after=0.05), registry)
+    with pytest.raises(GenerationCancelled) as e:
+        asyncio.run(turn)
+    assert e.value.reason == "disconnected"
+
+
+def test_a_new_send_supersedes_the_running_turn(registry):
+    async def main():
+        token, turn = _turn(FakeRequest(), registry)
+        running = asyncio.ensure_future(turn)
+        await asyncio.sleep(0.05)
+        newer = registry.begin("alice", "c1")
+        with pytest.raises(GenerationCancelled) as e:
+            await running
+        return token, newer, e.value.reason
+
+    token, newer, reason = asyncio.run(main())
+    assert reason == "superseded"
+    assert token.cancelled and not newer.cancelled
+
+
+def test_cancel_endpoint_cancels_the_running_turn(registry):
+    app = FastAPI()
+    app.include_router(chat_routes.chat_router, prefix="/chat")
+    app.dependency_overrides[get_current_username] = lambda: "alice"
+    chat_id = create_new_chat("alice", "cancel me")
+    with TestClient(app) as client:
+        assert client.post(f"/chat/chat/{chat_id}/cancel").json()["status"] == "cancel_requested"
+        token = registry.begin("alice", chat_id)
+        assert client.post(f"/chat/chat/{chat_id}/cancel").json()["status"] == "cancelled"
+        assert token.reason == "cancelled"
+        registry.end("alice", chat_id, token)
+        assert client.post("/chat/chat/missing/cancel").status_code == 404
+
+
+def test_another_worker_cancels_through_the_marker(registry, monkeypatch, tmp_path):
+    here, there = TurnRegistry(tmp_path, shared=True), TurnRegistry(tmp_path, shared=True)
+    monkeypatch.setattr(chat_routes, "turns", here)
+
+    async def main():
+        token, turn = _turn(FakeRequest(), here)
+        running = asyncio.ensure_future(turn)
+        await asyncio.sleep(0.05)
+        # begin() left a marker from before the turn started, which doesn't count
+        assert not token.cancelled
+        assert there.cancel("alice", "c1") is False
+        with pytest.raises(GenerationCancelled) as e:
+            await running
+        here.end("alice", "c1", token)
+        return e.value.reason
+
+    assert asyncio.run(main()) == "cancelled"
+    assert not (tmp_path / "alice" / "c1.json").exists()
+
+
+def test_single_worker_writes_no_markers(tmp_path):
+    registry = TurnRegistry(tmp_path, shared=False)
+    token = registry.begin("alice", "c1")
+    assert registry.cancel("alice", "c1") is True
+    assert not registry.poll("alice", "c1", registry.begin("alice", "c1"))
+    assert token.reason == "cancelled"
+    assert not any(tmp_path.iterdir())
@@ -0,0 +1,76 @@
+# tests/test_chat_cache.py
+import json
+import os
+
+import pytest
+
+from app import chat_store
+from app.chat_cache import ChatCache
+from app.chat_store import CHAT_DIR, create_new_chat, delete_user_chat, load_chat_messages, save_message
+from app.file_lock import atomic_write_json
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ChatCache()
+    monkeypatch.setattr(chat_store, "chat_cache", cache)
+    return cache
+
+
+def _message(text):
+    return {"id": text, "sender": "user", "text": text, "timestamp": "2024-01-01T00:00:00Z"}
+
+
+def test_least_recently_used_chats_are_evicted():
+    cache = ChatCache(max_bytes=400)
+    for name in "abcd":
+        cache.put(("u", name), (1, 1, 100), [name], 100)
+    assert cache.get(("u", "a"), (1, 1, 100)) == ["a"]
+    cache.put(("u", "e"), (1, 1, 100), ["e"], 100)
+    assert cache.get(("u", "b"), (1, 1, 100)) is None
+    assert [cache.get(("u", name), (1, 1, 100)) for name in "acde"] == [["a"], ["c"], ["d"], ["e"]]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 400
+
+    # Too big to be worth caching: it would evict a quarter of the cache
+    cache.put(("u", "f"), (1, 1, 101), ["f"], 101)
+    assert cache.get(("u", "f"), (1, 1, 101)) is None
+    assert cache.stats()["entries"] == 4
+
+
+def test_a_changed_file_is_read_again(cache):
+    chat_id = create_new_chat("carol", "cached")
+    save_message("carol", chat_id, _message("one"))
+    path = CHAT_DIR / "carol" / f"{chat_id}.json"
+    assert load_chat_messages("carol", chat_id) == [_message("one")]
+    hits = cache.hits
+    assert load_chat_messages("carol", chat_id) == [_message("one")]
+    assert cache.hits == hits + 1
+
+    # Replaced by another process: a new inode
+    atomic_write_json(path, [_message("two")])
+    assert load_chat_messages("carol", chat_id) == [_message("two")]
+
+    # Rewritten in place: a new size
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([_message("three"), _message("four")], f)
+    assert load_chat_messages("carol", chat_id) == [_message("three"), _message("four")]
+
+    # Rewritten in place to the same size: only the mtime tells
+    stat = path.stat()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([_message("seven"), _message("nine")], f)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert path.stat().st_size == stat.st_size
+    assert load_chat_messages("carol", chat_id) == [_message("seven"), _message("nine")]
+
+
+def test_deleting_a_chat_drops_it_from_the_cache(cache):
+    chat_id = create_new_chat("carol", "deleted")
+    save_message("carol", chat_id, _message("one"))
+    assert load_chat_messages("carol", chat_id) == [_message("one")]
+    assert cache.stats()["entries"] == 1
+
+    assert delete_user_chat("carol", chat_id)
+    assert cache.stats()["entries"] == 0
+    assert load_chat_messages("carol", chat_id) == []
@@ -0,0 +1,33 @@
+# tests/test_http_metrics.py
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.main import observe_request
+
+
+def _count(route, status):
+    prefix = f'chatbot_http_request_seconds_count{{method="GET",route="{route}",status="{status}"}} '
+    return next((float(line[len(prefix):]) for line in metrics.render().splitlines() if line.startswith(prefix)), 0)
+
+
+def test_requests_are_counted_by_route_template_even_when_the_handler_raises():
+    router = APIRouter()
+
+    @router.get("/chat/{chat_id}/messages")
+    def messages(chat_id: str):
+        return {"chat_id": chat_id}
+
+    @router.get("/chat/{chat_id}/boom")
+    def boom(chat_id: str):
+        raise RuntimeError("boom")
+
+    app = FastAPI()
+    app.middleware("http")(observe_request)
+    app.include_router(router, prefix="/test")
+    ok, failed = _count("/test/chat/{chat_id}/messages", 200), _count("/test/chat/{chat_id}/boom", 500)
+    with TestClient(app, raise_server_exceptions=False) as client:
+        assert client.get("/test/chat/chat/messages").status_code == 200
+        assert client.get("/test/chat/c/boom").status_code == 500
+    assert _count("/test/chat/{chat_id}/messages", 200) == ok + 1
+    assert _count("/test/chat/{chat_id}/boom", 500) == failed + 1
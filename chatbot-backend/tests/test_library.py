@@ -0,0 +1,50 @@
+# tests/test_library.py
+import numpy as np
+import pytest
+
+from app import library, uploads
+from app.vector_index import VectorStore
+
+
+@pytest.fixture(autouse=True)
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(library, "LIBRARY_DIR", tmp_path / "library")
+    monkeypatch.setattr(uploads, "UPLOADS_DIR", tmp_path / "uploads")
+    (tmp_path / "uploads").mkdir()
+    return tmp_path
+
+
+def test_a_document_lives_while_a_chat_has_it_attached(dirs):
+    shared, created = library.add_document("alice", "c1", b"shared", "a.pdf", "application/pdf")
+    assert created
+    assert library.add_document("alice", "c2", b"shared", "a.pdf", "application/pdf") == (shared, False)
+    only_c1, _ = library.add_document("alice", "c1", b"only c1", "b.pdf", "application/pdf")
+
+    assert [d["id"] for d in library.forget_chat("alice", "c1")] == [only_c1["id"]]
+    assert not (dirs / "uploads" / only_c1["stored_as"]).exists()
+    assert [d["id"] for d in library.list_documents("alice")] == [shared["id"]]
+
+    assert library.detach("alice", "c1", shared["id"]) is None
+    assert [d["id"] for d in library.detach("alice", "c2", shared["id"])] == [shared["id"]]
+    assert library.list_documents("alice") == []
+    assert list((dirs / "uploads").iterdir()) == []
+
+
+def test_prune_drops_documents_of_deleted_chats(dirs):
+    kept, _ = library.add_document("alice", "live", b"kept", "a.pdf", "application/pdf")
+    gone, _ = library.add_document("alice", "deleted", b"gone", "b.pdf", "application/pdf")
+
+    assert library.prune({"live"}) == 1
+    assert library.live_documents() == {("alice", kept["id"])}
+    assert library.attached_ids("alice", "deleted") == []
+
+
+def test_compaction_drops_vectors_of_documents_no_library_holds(dirs):
+    store = VectorStore(dim=4, path=dirs / "vectors", quantization="flat")
+    meta = [{"type": "pdf", "username": "alice", "doc_id": doc_id, "page": 0, "content": doc_id,
+             "timestamp": "2000-01-01T00:00:00"} for doc_id in ("kept", "gone")]
+    store.add(np.eye(2, 4, dtype=np.float32), meta)
+
+    result = store.compact(max_age_minutes=1, live_documents={("alice", "kept")})
+    assert result["removed_by_reason"]["orphaned"] == 1
+    assert [m["doc_id"] for m in store.metadata] == ["kept"]
@@ -0,0 +1,44 @@
+# tests/test_model_router.py
+import json
+
+import pytest
+
+from app import model_manager
+from app.model_router import ModelRouter, UnknownModelError
+from app.scheduler import scheduler
+
+ROUTES = [{"model": "llama3.2:1b", "max_prompt_chars": 2000}, {"model": "llama3.2"}]
+
+
+def test_unknown_ids_are_rejected_without_a_queue():
+    specs = {"auto": {"name": "Auto", "routes": ROUTES}}
+    router = ModelRouter(specs=lambda: specs, balance=False)
+    for model_id in ("+", "", "no-such-model"):
+        with pytest.raises(UnknownModelError):
+            router.check_capacity(model_id)
+        with pytest.raises(UnknownModelError):
+            router.choose(model_id, 10)
+        assert model_id not in scheduler._models
+    assert router.choose("auto", 10).model == "llama3.2:1b"
+    assert router.choose("auto", 5000).model == "llama3.2"
+
+
+def test_specs_are_cached_until_models_json_changes(tmp_path, monkeypatch):
+    path = tmp_path / "models.json"
+    path.write_text(json.dumps({"llama3.2": "Llama 3.2", "+": "Nothing"}))
+    monkeypatch.setattr(model_manager, "MODELS_FILE", path)
+    monkeypatch.setattr(model_manager, "MODELS_CHECK_INTERVAL_SECONDS", 0)
+    for name, value in (("_specs", {}), ("_specs_signature", None), ("_specs_checked", float("-inf"))):
+        monkeypatch.setattr(model_manager, name, value)
+    reads = []
+    read = model_manager._read_model_specs
+    monkeypatch.setattr(model_manager, "_read_model_specs", lambda: reads.append(1) or read())
+
+    specs = model_manager.load_model_specs()
+    assert list(specs) == ["llama3.2"]
+    assert model_manager.load_model_specs() is specs
+    assert len(reads) == 1
+
+    path.write_text(json.dumps({"llama3.2": "Llama 3.2", "llava": "LLaVA"}))
+    assert list(model_manager.load_model_specs()) == ["llama3.2", "llava"]
+    assert len(reads) == 2
@@ -0,0 +1,133 @@
+# tests/test_ollama_client.py
+import types
+
+import pytest
+import requests
+
+from app import ollama_client
+from app.cancellation import CancelToken, GenerationCancelled
+from app.ollama_client import (
+    CircuitBreaker, CircuitOpenError, OllamaClient, OllamaTimeout, OllamaUnavailable,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake clock for the module: sleeping advances it instead of waiting."""
+    now = [1000.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(ollama_client, "time", types.SimpleNamespace(
+        monotonic=lambda: now[0], time=lambda: now[0], sleep=sleep))
+    monkeypatch.setattr(ollama_client, "backoff_delay", lambda attempt: 1.0)
+    return now
+
+
+class FakeSession:
+    """Stands in for the client's requests.Session; every call runs ``behaviour``."""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = 0
+
+    def post(self, url, **kwargs):
+        self.calls += 1
+        return self.behaviour()
+
+
+def _refused():
+    raise requests.ConnectionError("refused")
+
+
+def _client(session, breaker=None):
+    client = OllamaClient(["http://ollama.test"], breaker=breaker or CircuitBreaker(failure_threshold=100))
+    client._local.session = session
+    return client
+
+
+def test_breaker_opens_after_the_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+        breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as e:
+        breaker.allow()
+    assert e.value.retry_after == 30
+
+
+def test_half_open_breaker_lets_a_single_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    # A failed trial opens it for another reset_timeout, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 30
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+    breaker.allow()
+
+
+def test_cancelled_trial_frees_the_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    breaker.allow()
+    breaker.record_cancelled()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.allow()
+
+
+def test_post_fails_fast_once_the_breaker_opens(clock):
+    session = FakeSession(_refused)
+    client = _client(session, CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    for _ in range(2):
+        with pytest.raises(OllamaUnavailable):
+            client.post("/api/generate", {"model": "m"}, timeout=60, retries=0)
+    with pytest.raises(CircuitOpenError):
+        client.post("/api/generate", {"model": "m"}, timeout=60, retries=0)
+    assert session.calls == 2
+
+
+def test_post_cancelled_during_the_trial_frees_the_slot(clock):
+    def cancelled():
+        raise GenerationCancelled("superseded")
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    client = _client(FakeSession(cancelled), breaker)
+    with pytest.raises(GenerationCancelled):
+        client.post("/api/generate", {"model": "m"}, timeout=60, cancel=CancelToken())
+    breaker.allow()
+
+
+def test_post_stops_after_its_retries(clock):
+    session = FakeSession(_refused)
+    with pytest.raises(OllamaUnavailable):
+        _client(session).post("/api/generate", {"model": "m"}, timeout=60, retries=2)
+    assert session.calls == 3
+
+
+def test_post_stops_at_its_deadline(clock):
+    def slow_timeout():
+        clock[0] += 4
+        raise requests.Timeout()
+
+    session = FakeSession(slow_timeout)
+    with pytest.raises(OllamaTimeout):
+        _client(session).post("/api/generate", {"model": "m"}, timeout=10, retries=10)
+    # 4s attempt, 1s backoff, 4s attempt, 1s backoff: the budget is spent
+    assert session.calls == 2
+    assert clock[0] == 1010.0
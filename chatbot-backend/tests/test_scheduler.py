@@ -0,0 +1,106 @@
+# tests/test_scheduler.py
+import threading
+import time
+
+import pytest
+
+from app import scheduler as scheduler_module
+from app.scheduler import GenerationScheduler, QueueFullError
+
+
+def _wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def _enqueue(scheduler, model, username, prompt_len, granted, errors=None):
+    """Start a thread that queues for a slot, notes its turn and hands the slot straight on."""
+    def run():
+        try:
+            with scheduler.slot(model, username, prompt_len):
+                granted.append(username)
+        except QueueFullError as e:
+            if errors is None:
+                raise
+            errors.append(e)
+
+    queued = scheduler.snapshot().get(model, {}).get("queued", 0)
+    thread = threading.Thread(target=run)
+    thread.start()
+    _wait_for(lambda: scheduler.snapshot()[model]["queued"] > queued or not thread.is_alive())
+    return thread
+
+
+def test_users_take_turns_so_one_cannot_starve_another():
+    scheduler = GenerationScheduler(concurrency=1, per_model={}, max_queue=10)
+    scheduler.acquire("m", "holder", 10)
+    granted = []
+    threads = [_enqueue(scheduler, "m", user, 10, granted) for user in ("alice", "alice", "alice", "bob")]
+    assert [w.username for w in scheduler._models["m"].dispatch_order()] == ["alice", "bob", "alice", "alice"]
+    assert scheduler.snapshot("bob")["m"]["positions"] == [2]
+
+    scheduler.release("m")
+    for t in threads:
+        t.join(5)
+    assert granted == ["alice", "bob", "alice", "alice"]
+
+
+def test_short_prompts_go_first_until_a_long_one_has_waited(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "PRIORITY_AGING_SECONDS", 0.3)
+    scheduler = GenerationScheduler(concurrency=1, per_model={}, max_queue=10)
+    scheduler.acquire("m", "holder", 10)
+    granted = []
+    threads = [_enqueue(scheduler, "m", "carol", scheduler_module.SHORT_PROMPT_CHARS + 1, granted),
+               _enqueue(scheduler, "m", "dave", 10, granted)]
+    assert [w.username for w in scheduler._models["m"].dispatch_order()] == ["dave", "carol"]
+
+    time.sleep(0.35)
+    assert [w.username for w in scheduler._models["m"].dispatch_order()] == ["carol", "dave"]
+    scheduler.release("m")
+    for t in threads:
+        t.join(5)
+    assert granted == ["carol", "dave"]
+
+
+def test_slots_are_per_model():
+    scheduler = GenerationScheduler(concurrency=2, per_model={"llava": 1}, max_queue=10)
+    scheduler.acquire("llama3.2", "a", 10)
+    scheduler.acquire("llama3.2", "b", 10)
+    scheduler.acquire("llava", "a", 10)
+    assert scheduler.free_slots("llama3.2") == 0
+    assert scheduler.free_slots("llava") == 0
+    assert scheduler.free_slots("mistral") == 2
+
+
+def test_a_full_queue_is_refused_with_a_retry_estimate():
+    scheduler = GenerationScheduler(concurrency=1, per_model={}, max_queue=1)
+    scheduler.acquire("m", "holder", 10)
+    granted = []
+    thread = _enqueue(scheduler, "m", "alice", 10, granted)
+
+    with pytest.raises(QueueFullError) as e:
+        scheduler.check_capacity("m")
+    # Average slot time (5 s until measured) for the queued request and this one, over one slot
+    assert (e.value.model, e.value.queued, e.value.retry_after) == ("m", 1, 10.0)
+    with pytest.raises(QueueFullError):
+        scheduler.acquire("m", "bob", 10)
+
+    scheduler.release("m")
+    thread.join(5)
+    assert granted == ["alice"]
+    scheduler.check_capacity("m")
+
+
+def test_a_wait_past_the_queue_timeout_is_refused():
+    scheduler = GenerationScheduler(concurrency=1, per_model={}, max_queue=10, queue_timeout=0.1)
+    scheduler.acquire("m", "holder", 10)
+    errors = []
+    _enqueue(scheduler, "m", "alice", 10, [], errors).join(5)
+    assert len(errors) == 1 and scheduler.snapshot()["m"]["queued"] == 0
+
+
+def test_limits_are_split_between_workers(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "GENERATION_WORKERS", 4)
+    assert [scheduler_module._per_worker(n) for n in (16, 8, 2, 0)] == [4, 2, 1, 0]
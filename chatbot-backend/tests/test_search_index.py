@@ -0,0 +1,31 @@
+# tests/test_search_index.py
+import threading
+
+from app.search_index import SearchIndex
+
+
+def test_concurrent_writers_keep_every_message(tmp_path):
+    index = SearchIndex(tmp_path / "search.db")
+    threads = [
+        threading.Thread(target=lambda t=t: [
+            index.index_message("alice", f"chat{t}", {"id": str(i), "sender": "user", "text": f"hello {t} {i}"})
+            for i in range(200)
+        ])
+        for t in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    conn = index._conn()
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 1600
+    assert conn.execute("SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'hello'").fetchone()[0] == 1600
+
+
+def test_reindexing_a_message_is_a_no_op(tmp_path):
+    index = SearchIndex(tmp_path / "search.db")
+    messages = [{"id": "1", "text": "first words"}, {"id": "2", "text": "second words"}]
+    index.index_messages("alice", "c1", messages)
+    index.index_messages("alice", "c1", messages)
+    assert index._conn().execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 2
+    assert len(index.search("alice", "words")["results"]) == 2
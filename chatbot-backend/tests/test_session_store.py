@@ -0,0 +1,86 @@
+# tests/test_session_store.py
+import multiprocessing
+import types
+
+import pytest
+
+from app import session_store
+from app.session_store import MemorySessionBackend, SQLiteSessionBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(session_store, "time", types.SimpleNamespace(time=lambda: now[0]))
+    monkeypatch.setattr(session_store, "SESSION_TTL_SECONDS", 100)
+    monkeypatch.setattr(session_store, "_REFRESH_AFTER_SECONDS", 10)
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, monkeypatch, tmp_path):
+    backend = MemorySessionBackend() if request.param == "memory" else SQLiteSessionBackend(tmp_path / "s.db")
+    monkeypatch.setattr(session_store, "_backend", backend)
+    return backend
+
+
+def test_sessions_expire_after_the_ttl(clock, backend):
+    token = session_store.create_session("alice")
+    clock[0] += 99
+    assert session_store.get_username(token) == "alice"
+    clock[0] += 100
+    assert session_store.get_username(token) is None
+    assert backend.get(token) is None
+
+
+def test_sliding_refresh_writes_at_most_once_per_tenth_of_the_ttl(clock, backend, monkeypatch):
+    token = session_store.create_session("alice")
+    touches = []
+    touch = backend.touch
+    monkeypatch.setattr(backend, "touch", lambda t, expires_at: touches.append(expires_at) or touch(t, expires_at))
+
+    clock[0] += 9
+    assert session_store.get_username(token) == "alice"
+    assert touches == []
+    clock[0] += 1
+    assert session_store.get_username(token) == "alice"
+    assert touches == [1110.0]
+    assert backend.get(token)[1] == 1110.0
+
+    # Used within the TTL of the last refresh, it stays alive past the first expiry
+    clock[0] = 1109.0
+    assert session_store.get_username(token) == "alice"
+    assert backend.get(token)[1] == 1209.0
+
+
+def test_sweep_drops_only_expired_sessions(clock, backend):
+    old = session_store.create_session("alice")
+    clock[0] += 50
+    new = session_store.create_session("bob")
+    clock[0] += 50
+    assert session_store.sweep_expired_sessions() == 1
+    assert backend.get(old) is None
+    assert session_store.get_username(new) == "bob"
+
+
+def _in_other_process(path, token, queue):
+    backend = SQLiteSessionBackend(path)
+    queue.put(backend.get(token))
+    backend.create("from-child", "bob", 2e9)
+    backend.delete(token)
+
+
+def test_sqlite_sessions_are_shared_between_processes(tmp_path):
+    path = tmp_path / "s.db"
+    backend = SQLiteSessionBackend(path)
+    backend.create("from-parent", "alice", 2e9)
+
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    child = ctx.Process(target=_in_other_process, args=(path, "from-parent", queue))
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    assert queue.get(timeout=1) == ("alice", 2e9)
+    assert backend.get("from-child") == ("bob", 2e9)
+    assert backend.get("from-parent") is None
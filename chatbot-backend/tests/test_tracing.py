@@ -0,0 +1,27 @@
+# tests/test_tracing.py
+from app.tracing import Span, _TraceStore
+
+
+def _span(name, trace_id, root=False):
+    return Span(name, trace_id, None if root else "0" * 15 + "1", 1, is_local_root=root)
+
+
+def test_a_span_ending_after_its_root_joins_the_finished_trace():
+    store = _TraceStore()
+    store.add(_span("child", "t1"))
+    assert [s.name for s in store.add(_span("root", "t1", root=True))] == ["child", "root"]
+
+    assert store.add(_span("late", "t1")) is None
+    assert [s.name for s in store.get("t1")] == ["child", "root", "late"]
+    assert not store._open
+
+
+def test_traces_whose_root_never_ends_expire(monkeypatch):
+    store = _TraceStore(open_seconds=60)
+    clock = [1000.0]
+    monkeypatch.setattr("app.tracing.time.monotonic", lambda: clock[0])
+    store.add(_span("orphan", "t1"))
+    clock[0] += 61
+    store.add(_span("child", "t2"))
+    assert list(store._open) == ["t2"]
+    assert store.get("t1") is None
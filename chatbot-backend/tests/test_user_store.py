@@ -0,0 +1,42 @@
+# tests/test_user_store.py
+from app.user_store import UserStore, check_credentials, hash_password, migrate_plaintext_passwords, verify_password
+
+
+def _write(path, text):
+    path.write_text(text, encoding="utf-8")
+
+
+def test_append_is_read_incrementally(tmp_path):
+    path = tmp_path / "users.csv"
+    _write(path, "username,password_hash,profile_pic\nalice,%s,a.png\n" % hash_password("a"))
+    store = UserStore(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("bob,%s,b.png\n" % hash_password("b"))
+    store.reload()
+    assert store.incremental_reloads == 1
+    assert check_credentials("bob", "b", store) == "b.png"
+
+
+def test_rewrite_that_grows_the_file_is_reloaded_in_full(tmp_path):
+    path = tmp_path / "users.csv"
+    _write(path, "username,password,profile_pic\nalice,secret,a.png\nbob,hunter2,b.png\n")
+    store = UserStore(path)
+    assert check_credentials("alice", "secret", store) == "a.png"
+
+    assert migrate_plaintext_passwords(path) == 2
+    store.reload()
+    assert store.full_reloads == 2
+    assert len(store) == 2
+    assert check_credentials("alice", "secret", store) == "a.png"
+    assert check_credentials("bob", "hunter2", store) == "b.png"
+    assert check_credentials("bob", "wrong", store) is None
+
+
+def test_malformed_hash_fails_the_login(tmp_path):
+    assert not verify_password("x", "pbkdf2_sha256$many$c2FsdA==$ZGlnZXN0")
+    assert not verify_password("x", "pbkdf2_sha256$1000$not base64!$ZGlnZXN0")
+    assert not verify_password("x", "pbkdf2_sha256$0$c2FsdA==$ZGlnZXN0")
+    assert not verify_password("x", "pbkdf2_sha256$1000")
+    path = tmp_path / "users.csv"
+    _write(path, "username,password_hash,profile_pic\nalice,pbkdf2_sha256$x$y$z,a.png\n")
+    assert check_credentials("alice", "x", UserStore(path)) is None
@@ -0,0 +1,136 @@
+# tests/test_vector_format.py
+import json
+import threading
+
+import faiss
+import numpy as np
+
+from app import vector_format
+from app.vector_index import VectorStore
+
+
+def _meta(chat_id, n, start=0):
+    return [{"type": "pdf", "page": i, "content": f"{chat_id} chunk {i}", "chat_id": chat_id,
+             "timestamp": "2099-01-01T00:00:00"} for i in range(start, start + n)]
+
+
+def _search(store, vector, chat_id):
+    return store.search(vector, k=100, chat_id=chat_id, time_window_minutes=None)
+
+
+def test_add_appends_and_keeps_text_out_of_memory(tmp_path):
+    path = tmp_path / "vectors"
+    rng = np.random.default_rng(0)
+    store = VectorStore(dim=8, path=path, quantization="fp16")
+    store.add(rng.random((3, 8), dtype=np.float32), _meta("a", 3))
+    first = vector_format.read_manifest(path)["files"]
+    store.add(rng.random((2, 8), dtype=np.float32), _meta("a", 2, start=3))
+    files = vector_format.read_manifest(path)["files"]
+
+    # Same files, longer; only the manifest moved to a new generation
+    for part in ("floats", "metadata", "index"):
+        assert files[part]["name"] == first[part]["name"]
+    assert files["floats"]["bytes"] == 5 * 8 * 4
+    assert all("content" not in m for m in store.metadata)
+    assert sorted(r["content"] for r in _search(store, rng.random(8, dtype=np.float32), "a")) == \
+        sorted(f"[PDF Page {i + 1}]: a chunk {i}" for i in range(5))
+    vector_format.check_integrity(path, full=True)
+
+    reopened = VectorStore(dim=8, path=path, quantization="fp16")
+    assert reopened.index.ntotal == 5
+    assert len(_search(reopened, rng.random(8, dtype=np.float32), "a")) == 5
+
+
+def test_tombstones_and_compaction_survive_a_restart(tmp_path):
+    path = tmp_path / "vectors"
+    rng = np.random.default_rng(0)
+    store = VectorStore(dim=8, path=path, quantization="flat")
+    store.add(rng.random((3, 8), dtype=np.float32), _meta("a", 3))
+    store.add(rng.random((2, 8), dtype=np.float32), _meta("b", 2))
+    assert store.delete_chat("a") == 3
+    assert VectorStore(dim=8, path=path).deleted == 3
+
+    assert store.compact()["removed"] == 3
+    reopened = VectorStore(dim=8, path=path)
+    assert (reopened.index.ntotal, reopened.deleted) == (2, 0)
+    assert {r["content"] for r in _search(reopened, rng.random(8, dtype=np.float32), "b")} == \
+        {"[PDF Page 1]: b chunk 0", "[PDF Page 2]: b chunk 1"}
+    vector_format.check_integrity(path, full=True)
+
+
+def test_searches_and_adds_run_while_compaction_writes_its_files(tmp_path, monkeypatch):
+    path = tmp_path / "vectors"
+    rng = np.random.default_rng(0)
+    store = VectorStore(dim=8, path=path, quantization="flat")
+    store.add(rng.random((3, 8), dtype=np.float32), _meta("a", 3))
+    store.add(rng.random((2, 8), dtype=np.float32), _meta("b", 2))
+    store.delete_chat("a")
+
+    staging, release = threading.Event(), threading.Event()
+    stage_store = vector_format.stage_store
+
+    def slow_stage_store(*args, **kwargs):
+        staged = stage_store(*args, **kwargs)
+        staging.set()
+        assert release.wait(10)
+        return staged
+
+    monkeypatch.setattr(vector_format, "stage_store", slow_stage_store)
+    compaction = threading.Thread(target=store.compact)
+    compaction.start()
+    assert staging.wait(10)
+    # Neither waits for the compaction to finish writing
+    assert len(_search(store, rng.random(8, dtype=np.float32), "b")) == 2
+    store.add(rng.random((1, 8), dtype=np.float32), _meta("b", 1, start=2))
+    store.delete_chat("b")
+    release.set()
+    compaction.join()
+
+    # The vectors added and deleted meanwhile carried over
+    assert (store.index.ntotal, store.deleted) == (3, 3)
+    reopened = VectorStore(dim=8, path=path)
+    assert (reopened.index.ntotal, reopened.deleted) == (3, 3)
+    vector_format.check_integrity(path, full=True)
+    assert sorted(p.name for p in path.iterdir() if p.name.startswith(".")) == []
+
+
+def test_bytes_appended_without_a_manifest_are_dropped(tmp_path):
+    path = tmp_path / "vectors"
+    rng = np.random.default_rng(0)
+    store = VectorStore(dim=8, path=path)
+    store.add(rng.random((2, 8), dtype=np.float32), _meta("a", 2))
+    files = vector_format.read_manifest(path)["files"]
+    # An append that crashed before its manifest was written
+    with open(path / files["floats"]["name"], "ab") as f:
+        f.write(b"\0" * 32)
+    with open(path / files["metadata"]["name"], "ab") as f:
+        f.write(b'{"type": "pdf", "cha')
+
+    reopened = VectorStore(dim=8, path=path)
+    assert reopened.index.ntotal == 2
+    reopened.add(rng.random((1, 8), dtype=np.float32), _meta("a", 1, start=2))
+    vector_format.check_integrity(path, full=True)
+    assert len(_search(VectorStore(dim=8, path=path), rng.random(8, dtype=np.float32), "a")) == 3
+
+
+def test_version_1_store_is_converted(tmp_path):
+    path = tmp_path / "vectors"
+    path.mkdir()
+    rng = np.random.default_rng(0)
+    index = faiss.IndexFlatL2(8)
+    index.add(rng.random((3, 8), dtype=np.float32))
+    metadata = _meta("a", 3)
+    metadata[0]["deleted"] = True
+    (path / "vectors-1.faiss").write_bytes(faiss.serialize_index(index).tobytes())
+    (path / "metadata-1.json").write_text(json.dumps(metadata))
+    files = {part: {"name": name, "bytes": (path / name).stat().st_size, "sha256": ""}
+             for part, name in (("vectors", "vectors-1.faiss"), ("metadata", "metadata-1.json"))}
+    (path / vector_format.MANIFEST_NAME).write_text(json.dumps({
+        "format": vector_format.FORMAT_NAME, "version": 1, "generation": 1, "dim": 8, "count": 3, "files": files,
+    }))
+
+    store = VectorStore(dim=8, path=path, metric="l2")
+    assert vector_format.read_manifest(path)["version"] == vector_format.FORMAT_VERSION
+    assert not (path / "vectors-1.faiss").exists()
+    assert (store.index.ntotal, store.deleted) == (3, 1)
+    assert len(_search(store, rng.random(8, dtype=np.float32), "a")) == 2
@@ -0,0 +1,26 @@
+# tests/test_vector_search.py
+import numpy as np
+import pytest
+
+from app.vector_index import VectorStore
+
+
+def _meta(chat_id, n):
+    return [{"type": "pdf", "page": i, "content": f"{chat_id} {i}", "chat_id": chat_id,
+             "timestamp": "2099-01-01T00:00:00"} for i in range(n)]
+
+
+@pytest.mark.parametrize("quantization", ["flat", "fp16"])
+def test_min_score_keeps_the_best_matches_above_it(tmp_path, quantization):
+    rng = np.random.default_rng(0)
+    store = VectorStore(dim=16, path=tmp_path / "vectors", quantization=quantization, metric="cosine")
+    store.add(rng.standard_normal((200, 16)).astype(np.float32), _meta("a", 200))
+    store.add(rng.standard_normal((50, 16)).astype(np.float32), _meta("b", 50))
+    query = rng.standard_normal(16).astype(np.float32)
+
+    for chat_id in ("a", None):
+        every = store.search(query, k=250, chat_id=chat_id, time_window_minutes=None)
+        for min_score, k in ((0.3, 5), (0.3, 100), (0.99, 5)):
+            expected = [r for r in every if r["score"] >= min_score][:k]
+            results = store.search(query, k=k, chat_id=chat_id, time_window_minutes=None, min_score=min_score)
+            assert [r["content"] for r in results] == [r["content"] for r in expected]
@@ -0,0 +1,44 @@
+# tests/test_vector_service.py
+import threading
+
+import numpy as np
+import pytest
+
+from app.vector_index import VectorStore
+from app.vector_service import RemoteVectorStore, VectorService
+
+
+def _meta(chat_id, n):
+    return [{"type": "pdf", "page": i, "content": f"{chat_id} {i}", "chat_id": chat_id,
+             "timestamp": "2099-01-01T00:00:00"} for i in range(n)]
+
+
+def test_delete_chat_and_compact_through_the_service(tmp_path):
+    service = VectorService(VectorStore(dim=8, path=tmp_path / "vectors", quantization="flat"), "127.0.0.1:0",
+                            authkey=b"test")
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    host, port = service.listener.address
+    remote = RemoteVectorStore(f"{host}:{port}", authkey=b"test")
+
+    rng = np.random.default_rng(0)
+    remote.add(rng.random((3, 8), dtype=np.float32), _meta("a", 3))
+    remote.add(rng.random((2, 8), dtype=np.float32), _meta("b", 2))
+    query = rng.random(8, dtype=np.float32)
+    assert len(remote.search(query, k=10, chat_id="a", time_window_minutes=None)) == 3
+
+    assert remote.delete_chat("a") == 3
+    assert remote.search(query, k=10, chat_id="a", time_window_minutes=None) == []
+    assert remote.stats()["deleted"] == 3
+
+    result = remote.compact()
+    assert result["removed"] == 3
+    stats = remote.stats()
+    assert (stats["vectors"], stats["metadata"], stats["deleted"]) == (2, 2, 0)
+    assert len(remote.search(query, k=10, chat_id="b", time_window_minutes=None)) == 2
+
+
+def test_no_default_authkey(tmp_path):
+    with pytest.raises(ValueError):
+        VectorService(VectorStore(dim=8, path=tmp_path / "vectors"), "127.0.0.1:0", authkey=b"")
+    with pytest.raises(ValueError):
+        RemoteVectorStore("127.0.0.1:1", authkey=b"")
@@ -0,0 +1,56 @@
+# tests/test_write_buffer.py
+import json
+import threading
+
+from app.file_lock import try_lock_path, unlink_locked
+from app.write_buffer import WriteBuffer
+
+
+class Applied:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, username, chat_id, messages, fsync, replay):
+        self.calls.append((username, chat_id, [m["id"] for m in messages], replay))
+        return messages
+
+
+def test_recover_leaves_a_running_owner_alone(tmp_path):
+    apply = Applied()
+    live = WriteBuffer(tmp_path, fsync="off", interval_ms=60_000)
+    live.start(apply)
+    live.append("alice", "c1", {"id": "1", "text": "hi"})
+
+    assert WriteBuffer(tmp_path, fsync="off").recover() == 0
+    assert apply.calls == []
+    live.stop()
+    assert apply.calls == [("alice", "c1", ["1"], False)]
+
+
+def test_recover_replays_a_dead_owner(tmp_path):
+    with open(tmp_path / "dead-00000000.jsonl", "w") as f:
+        f.write(json.dumps({"username": "alice", "chat_id": "c1", "message": {"id": "1"}}) + "\n")
+    apply = Applied()
+    buffer = WriteBuffer(tmp_path, fsync="off")
+    buffer._apply = apply
+    assert buffer.recover() == 1
+    assert apply.calls == [("alice", "c1", ["1"], True)]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_start_waits_for_a_recovery_holding_its_new_lock_file(tmp_path):
+    buffer = WriteBuffer(tmp_path, fsync="off")
+    path = tmp_path / f"{buffer._owner}.lock"
+    # Another worker's recover() found the file before the owner locked it
+    other = try_lock_path(path)
+    release = threading.Timer(0.2, unlink_locked, (other, path))
+    release.start()
+
+    buffer.start(Applied())
+    try:
+        release.join()
+        # The running owner's lock is still on the file at its path
+        assert try_lock_path(path) is None
+    finally:
+        buffer.stop()
+    assert not path.exists()